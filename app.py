@@ -1,15 +1,19 @@
 """Streamlit application for questionnaire and staff dashboard (Phase 3)."""
 import json
 import pathlib
+import uuid
 from datetime import datetime, timezone
-import asyncio
 
 import streamlit as st
-import pandas as pd
 
+import async_runtime
 import data_persistence
-import prompts
-import questionnaire
+import tracing
+import write_queue
+
+# Streamlit re-executes this script on every rerun, and patient mode never
+# needs pandas while the staff view never needs the generation stack, so
+# questionnaire, pipeline, prompts and cohort are imported where they are used.
 
 CONSENT_MESSAGE = (
     "このアンケートの回答は匿名化され、分析目的で利用されます。"\
@@ -29,9 +33,42 @@ if css_path.exists():
     st.markdown(f"<style>{css_path.read_text()}</style>", unsafe_allow_html=True)
 
 
+@st.cache_resource
+def _bank_refill_worker():
+    """Keep one question bank refill worker alive per server process."""
+    import questionnaire
+
+    return questionnaire.start_bank_refill()
+
+
+@st.cache_resource
+def _write_queue() -> None:
+    """Start the writer once per server process, replaying unwritten records."""
+    write_queue.start()
+
+
+@st.cache_resource
+def _cohort():
+    """Cohort statistics shared by all staff sessions in this process."""
+    import cohort
+    from axes import AXES
+
+    return cohort.Cohort(AXES)
+
+
 def init_state() -> None:
-    if "questions" not in st.session_state:
-        st.session_state.questions = questionnaire.generate_questionnaire()
+    _bank_refill_worker()
+    if "trace_session" not in st.session_state:
+        st.session_state.trace_session = uuid.uuid4().hex
+    if "question_stream" not in st.session_state:
+        import questionnaire
+
+        # Start generating while the patient reads the consent and start page.
+        if questionnaire.QUESTIONNAIRE_MODE == "adaptive":
+            stream = questionnaire.AdaptiveQuestionnaire(session=st.session_state.trace_session)
+        else:
+            stream = questionnaire.QuestionnaireStream(session=st.session_state.trace_session)
+        st.session_state.question_stream = stream.start()
     if "answers" not in st.session_state:
         st.session_state.answers = []
     if "index" not in st.session_state:
@@ -67,52 +104,92 @@ def show_start_page() -> None:
                 st.warning("名前を入力してください")
                 return
             st.session_state.user_name = st.session_state.input_user_name
-            data_persistence.save_user(user_id, st.session_state.user_name)
+            write_queue.save_user(user_id, st.session_state.user_name)
         st.session_state.user_id = user_id
         st.session_state.start_time = datetime.now(timezone.utc).isoformat()
         st.session_state.started = True
         st.rerun()
 
 
-def save_results(scores: dict, summary: str) -> None:
-    """Persist questionnaire answers with the provided summary."""
-    for i, q in enumerate(st.session_state.questions):
-        ans = st.session_state.answers[i]
-        data_persistence.save_interaction(
-            user_id=st.session_state.user_id or "anonymous",
-            question_text=q["question_text"],
-            answer_text=str(ans["score"]),
-            total_question_count=len(st.session_state.questions),
-            evaluation_summary=summary,
-            start_timestamp=st.session_state.start_time,
-        )
+def show_results() -> None:
+    """Display radar chart and patient-facing feedback only.
 
+    On the first render the post-questionnaire pipeline runs: the patient
+    feedback is streamed while the session and staff report are persisted
+    concurrently.  Later reruns show the stored result.  A rerun that
+    interrupted the stream runs the pipeline again without persisting, since
+    the first run keeps going in the background and stores the session.
+    """
+    import pipeline
+    import questionnaire
 
-def show_results(scores: dict, summary: str) -> None:
-    """Display radar chart and patient-facing feedback only."""
+    result = st.session_state.get("pipeline_result")
+    scores = result.scores if result else questionnaire.score_answers(st.session_state.answers)
     st.subheader("結果")
     fig = questionnaire.radar_chart(scores)
     st.plotly_chart(fig, use_container_width=True)
 
     st.write("### 患者向けフィードバック")
-    feedback = asyncio.run(
-        prompts.feedback_for_patient_async(summary, st.session_state.user_name)
-    )
-    st.write(feedback)
+    if result is not None:
+        st.write(result.patient_feedback)
+        return
+    result = pipeline.PipelineResult()
+    persist = not st.session_state.get("session_persisted", False)
+    st.session_state.session_persisted = True
+    with st.spinner("分析中..."):
+        st.write_stream(
+            async_runtime.iterate(
+                tracing.bind_stream(
+                    pipeline.stream_post_questionnaire(
+                        st.session_state.question_stream.questions(),
+                        st.session_state.answers,
+                        st.session_state.user_id or "anonymous",
+                        st.session_state.user_name,
+                        st.session_state.start_time,
+                        result,
+                        persist=persist,
+                    ),
+                    session=st.session_state.trace_session,
+                )
+            )
+        )
+    st.session_state.pipeline_result = result
+
 
+def format_staff_report(report: str) -> str:
+    """Render the structured staff report JSON as readable text."""
+    try:
+        fb_json = json.loads(report)
+    except json.JSONDecodeError:
+        return report
+    if not isinstance(fb_json, dict):
+        return report
+    return (
+        f"リスク傾向要約: {fb_json.get('risk_profile_summary', '')}\n\n"
+        f"注意点: {'、'.join(fb_json.get('caution_points', []))}\n\n"
+        f"推奨対応: {'、'.join(fb_json.get('recommended_actions', []))}\n\n"
+        f"エスカレーションプラン: {fb_json.get('escalation_plan', '')}"
+    )
 
 
 def questionnaire_flow() -> None:
-    if st.session_state.index >= len(st.session_state.questions):
-        with st.spinner("分析中..."):
-            scores = questionnaire.score_answers(st.session_state.answers)
-            summary = asyncio.run(prompts.evaluation_summary_async(scores))
-            save_results(scores, summary)
-            show_results(scores, summary)
+    import questionnaire
+
+    stream = st.session_state.question_stream
+    if st.session_state.index >= stream.total:
+        show_results()
         return
 
-    q = st.session_state.questions[st.session_state.index]
-    total = len(st.session_state.questions)
+    if stream.ready(st.session_state.index):
+        q = stream.get(st.session_state.index)
+    else:
+        with st.spinner("質問を準備しています..."):
+            q = stream.get(
+                st.session_state.index,
+                timeout=questionnaire.QUESTION_DEADLINE,
+                use_fallback=True,
+            )
+    total = stream.total
     current = st.session_state.index + 1
     st.write(f"質問 {current} / {total}")
     st.write(f"**{q['question_text']}**")
@@ -130,52 +207,138 @@ def questionnaire_flow() -> None:
         key=f"q{st.session_state.index}",
     )
     if st.button("次へ"):
+        stream.answer(st.session_state.index, choice)
         st.session_state.answers.append({"axis": q["axis"], "score": choice})
         st.session_state.index += 1
         st.rerun()
 
 
+def show_cohort_position(user_id: str, timestamp: str) -> None:
+    """Show where the session's axis scores sit within all stored sessions."""
+    stats = _cohort()
+    stats.update(data_persistence.load_answers(after_id=stats.last_id))
+    session_id = stats.session_id(user_id, timestamp)
+    if session_id is None:
+        return
+    st.write(f"### 集団内での位置づけ（{len(stats)}件中）")
+    position = stats.position(session_id).round(2)
+    position.columns = ["スコア", "パーセンタイル", "zスコア"]
+    st.table(position)
+
+
 def staff_dashboard() -> None:
     """Display stored questionnaire results for staff."""
     st.subheader("医療従事者向け分析")
-    csv_path = data_persistence.CSV_PATH
-    if not csv_path.exists():
+    df = data_persistence.load_interactions()
+    if df is None or df.empty:
         st.write("データがまだありません。")
         return
-    df = pd.read_csv(csv_path)
-    if df.empty:
-        st.write("データがまだありません。")
-        return
-    sessions = df[["user_id", "evaluation_summary"]].drop_duplicates().reset_index(drop=True)
+    sessions = (
+        df[["timestamp", "user_id", "evaluation_summary"]]
+        .drop_duplicates(subset=["timestamp", "user_id"])
+        .reset_index(drop=True)
+    )
     selected = st.selectbox(
         "ユーザーを選択してください", sessions.index,
-        format_func=lambda i: f"{sessions.loc[i, 'user_id']} ({i})"
+        format_func=lambda i: f"{sessions.loc[i, 'user_id']} ({sessions.loc[i, 'timestamp']})"
     )
-    user_id = sessions.loc[selected, "user_id"]
+    user_id = str(sessions.loc[selected, "user_id"])
+    timestamp = str(sessions.loc[selected, "timestamp"])
     summary = sessions.loc[selected, "evaluation_summary"]
     st.write("### 評価サマリー")
     st.write(summary)
 
+    show_cohort_position(user_id, timestamp)
+
     st.write("### AIによる推奨対応")
-    fb = asyncio.run(prompts.feedback_for_staff_async(summary))
-    try:
-        fb_json = json.loads(fb)
-        text = (
-            f"リスク傾向要約: {fb_json.get('risk_profile_summary', '')}\n\n"
-            f"注意点: {'、'.join(fb_json.get('caution_points', []))}\n\n"
-            f"推奨対応: {'、'.join(fb_json.get('recommended_actions', []))}\n\n"
-            f"エスカレーションプラン: {fb_json.get('escalation_plan', '')}"
-        )
-        st.write(text)
-    except json.JSONDecodeError:
-        st.write(fb)
+    report = data_persistence.get_report(user_id, timestamp, data_persistence.STAFF_REPORT)
+    regenerate = st.button("再生成")
+    placeholder = st.empty()
+    if report is None or regenerate:
+        import prompts
+
+        try:
+            generated = placeholder.write_stream(
+                async_runtime.iterate(
+                    prompts.feedback_for_staff_stream(summary, cache=not regenerate)
+                )
+            )
+        except prompts.StreamError as e:
+            st.error(f"レポートの生成に失敗しました: {e}")
+        else:
+            report = generated
+            data_persistence.save_report(user_id, timestamp, data_persistence.STAFF_REPORT, report)
+    if report is None:
+        placeholder.empty()
+    else:
+        placeholder.write(format_staff_report(report))
     st.write("### 回答一覧")
-    st.table(df[df["user_id"] == user_id][["question_text", "answer_text"]])
+    answers = df[(df["user_id"].astype(str) == user_id) & (df["timestamp"] == timestamp)]
+    st.table(answers[["question_text", "answer_text"]])
+
+
+def metrics_page() -> None:
+    """Display LLM latency, call volume and similarity metrics from the trace log."""
+    st.subheader("LLMメトリクス")
+    metrics = tracing.summarise(tracing.load())
+    if not metrics.get("calls") and not metrics.get("cache_hits"):
+        st.write("トレースがまだありません。")
+        return
+    calls, hits = metrics.get("calls", 0), metrics.get("cache_hits", 0)
+    cols = st.columns(3)
+    cols[0].metric("API呼び出し", calls)
+    cols[1].metric("キャッシュヒット率", f"{hits / (calls + hits):.0%}")
+    cols[2].metric("エラー", metrics.get("errors", 0))
+    latency = metrics.get("latency")
+    if latency:
+        st.write("### レイテンシ（秒）")
+        cols = st.columns(3)
+        for col, (name, value) in zip(cols, latency.items()):
+            col.metric(name, f"{value:.2f}")
+        st.table(metrics["latency_by_caller"].round(2))
+    per_session = metrics.get("calls_per_session")
+    if per_session:
+        st.write("### セッションあたりのAPI呼び出し")
+        cols = st.columns(3)
+        cols[0].metric("セッション数", per_session["sessions"])
+        cols[1].metric("平均", f"{per_session['mean']:.1f}")
+        cols[2].metric("p95", f"{per_session['p95']:.1f}")
+    tokens = metrics.get("tokens", {})
+    if tokens:
+        st.write("### トークン")
+        cols = st.columns(2)
+        cols[0].metric("プロンプト", tokens.get("prompt_tokens", 0))
+        cols[1].metric("生成", tokens.get("completion_tokens", 0))
+    if "similarity_rejection_rate" in metrics:
+        st.metric("類似による質問の棄却率", f"{metrics['similarity_rejection_rate']:.0%}")
+
+
+def write_queue_metrics() -> None:
+    """Display the write-behind queue's counters and write latency for this process."""
+    stats = write_queue.stats()
+    st.write("### 書き込みキュー")
+    cols = st.columns(5)
+    cols[0].metric("書き込み済み", stats["written"])
+    cols[1].metric("待機中", stats["pending"])
+    cols[2].metric("再試行中", stats["retrying"])
+    cols[3].metric("失敗", stats["failed"])
+    cols[4].metric("平均バッチサイズ", f"{stats.get('batch_size_mean', 0):.1f}")
+    if stats["dead_letter"]:
+        st.warning(
+            f"{stats['dead_letter']} 件の記録を書き込めず {write_queue.DEAD_LETTER_PATH.name}"
+            " に退避しました。次回の起動時に再度書き込みます。"
+        )
+    latency = stats.get("latency")
+    if latency:
+        cols = st.columns(3)
+        for col, name in zip(cols, ("p50", "p95", "p99")):
+            col.metric(f"書き込み遅延 {name}", f"{latency[name] * 1000:.0f} ms")
 
 
 def main() -> None:
+    _write_queue()
     st.title("Patient Profiling System")
-    mode = st.sidebar.radio("モードを選択", ("患者モード", "医療従事者モード"))
+    mode = st.sidebar.radio("モードを選択", ("患者モード", "医療従事者モード", "メトリクス"))
     if mode == "患者モード":
         show_consent()
         init_state()
@@ -183,8 +346,11 @@ def main() -> None:
             show_start_page()
         else:
             questionnaire_flow()
-    else:
+    elif mode == "医療従事者モード":
         staff_dashboard()
+    else:
+        metrics_page()
+        write_queue_metrics()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+"""Long-lived background event loop shared by the whole process.
+
+Streamlit runs each script rerun in its own thread, and calling
+``asyncio.run`` there creates and tears down an event loop (and with it the
+async OpenAI client and its connection pool) every time.  Coroutines are
+instead submitted to one loop running in a daemon thread; callers get
+``concurrent.futures.Future`` objects they can block on or poll.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import queue
+import threading
+from typing import AsyncIterator, Awaitable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+_loop: asyncio.AbstractEventLoop | None = None
+_thread: threading.Thread | None = None
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Return the background loop, starting its thread on first use."""
+    global _loop, _thread
+    with _lock:
+        if _loop is None or _thread is None or not _thread.is_alive():
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(
+                target=_loop.run_forever, name="async-runtime", daemon=True
+            )
+            _thread.start()
+        return _loop
+
+
+def _check_not_on_loop() -> None:
+    if _thread is not None and threading.current_thread() is _thread:
+        raise RuntimeError("blocking call from inside the background event loop")
+
+
+def submit(coro: Awaitable[T]) -> "concurrent.futures.Future[T]":
+    """Schedule ``coro`` on the background loop and return its future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro: Awaitable[T], timeout: float | None = None) -> T:
+    """Run ``coro`` on the background loop and wait for its result."""
+    _check_not_on_loop()
+    return submit(coro).result(timeout)
+
+
+def iterate(agen: AsyncIterator[T], timeout: float | None = None) -> Iterator[T]:
+    """Iterate an async generator from synchronous code.
+
+    The generator is driven to completion on the background loop and items
+    are handed over through a queue as soon as they are produced, so work it
+    started (e.g. persistence) finishes even if the caller stops reading.
+    ``timeout`` bounds the wait for each item.
+    """
+    _check_not_on_loop()
+    items: queue.Queue = queue.Queue()
+    done = object()
+
+    async def pump() -> None:
+        try:
+            async for item in agen:
+                items.put(item)
+        except BaseException as e:  # re-raised in the consuming thread
+            items.put(e)
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            items.put(done)
+
+    submit(pump())
+    while True:
+        try:
+            item = items.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("no item within timeout") from None
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
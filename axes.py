@@ -0,0 +1,14 @@
+"""The five questionnaire axes.
+
+Kept in a module of their own so code that only needs the axis names (e.g.
+the staff dashboard's cohort statistics) does not import the question
+generation stack.
+"""
+
+AXES = [
+    "特権意識と期待",
+    "情動の不安定性",
+    "不信感と猜疑心",
+    "依存性と操作性",
+    "統制欲求と完璧主義",
+]
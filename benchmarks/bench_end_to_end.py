@@ -0,0 +1,281 @@
+"""End-to-end benchmarks against a local mock OpenAI server.
+
+Measures wall time, API calls and memory for
+
+* ``generate_questionnaire`` (per batching mode),
+* the end-of-survey pipeline (``pipeline.run_post_questionnaire``),
+* staff dashboard data loading (cold and incremental ``load_interactions``
+  plus the session list) on stores holding ``--rows`` interactions,
+
+and writes the results as JSON for regression tracking.  Comparing with an
+earlier result file prints the relative change of every median::
+
+    python benchmarks/bench_end_to_end.py --rows 1000 100000 1000000 --output bench.json
+    python benchmarks/bench_end_to_end.py --rows 1000 --compare bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import async_runtime
+import data_persistence
+import llm_cache
+import llm_client
+import pipeline
+import questionnaire
+import sqlite_storage
+import tracing
+from mock_openai import MockConfig, MockOpenAI
+
+QUESTIONS = 15
+
+
+def _percentiles(samples: list[float]) -> dict[str, float]:
+    ordered = sorted(samples)
+    pick = lambda p: ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+    return {
+        "p50": statistics.median(ordered),
+        "p95": pick(0.95),
+        "max": ordered[-1],
+        "mean": statistics.fmean(ordered),
+    }
+
+
+def _measure(fn, runs: int, mock: MockOpenAI | None = None) -> dict:
+    """Time ``runs`` calls of ``fn`` after one warm-up call, then record the
+    peak traced memory of one more."""
+    fn()  # imports, connection pools, page cache
+    times, calls = [], []
+    for _ in range(runs):
+        if mock is not None:
+            mock.reset_counts()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+        if mock is not None:
+            calls.append(dict(mock.counts))
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = {"wall_s": _percentiles(times), "peak_mb": round(peak / 2**20, 2)}
+    if calls:
+        kinds = sorted({k for c in calls for k in c})
+        result["api_calls"] = {k: statistics.fmean(c.get(k, 0) for c in calls) for k in kinds}
+    return result
+
+
+def bench_generation(mock: MockOpenAI, runs: int) -> list[dict]:
+    results = []
+    for batch in ("axis", "all", None):
+        questionnaire.reset_speculation_stats()
+        result = _measure(
+            lambda: questionnaire.generate_questionnaire(use_bank=False, batch=batch), runs, mock
+        )
+        stats = questionnaire.speculation_stats()
+        result["fallbacks"] = stats["fallbacks"]
+        result["similarity_rejections"] = stats["rejected"]
+        results.append({"scenario": "generate_questionnaire", "params": {"batch": batch}, **result})
+    return results
+
+
+def bench_pipeline(mock: MockOpenAI, runs: int) -> list[dict]:
+    questions = [
+        {"question_text": f"質問{i}", "axis": questionnaire.AXES[i % len(questionnaire.AXES)]}
+        for i in range(QUESTIONS)
+    ]
+    answers = [{"axis": q["axis"], "score": i % 5 + 1} for i, q in enumerate(questions)]
+    counter = iter(range(10**9))
+
+    def run() -> None:
+        async_runtime.run(
+            pipeline.run_post_questionnaire(
+                questions, answers, "bench", "ベンチ", f"ts-{next(counter)}"
+            )
+        )
+
+    return [{"scenario": "post_questionnaire_pipeline", "params": {}, **_measure(run, runs, mock)}]
+
+
+def _prefill_csv(rows: int) -> None:
+    with data_persistence.CSV_PATH.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(data_persistence.COLUMNS)
+        for i in range(rows):
+            s = i // QUESTIONS
+            writer.writerow([
+                f"ts-{s}", f"user{s % 5000}", f"質問 {i % 400}", str(i % 5 + 1), QUESTIONS,
+                f"要約 {s}",
+            ])
+
+
+def _prefill_sqlite(rows: int) -> None:
+    chunk: list[dict] = []
+    for i in range(rows):
+        s = i // QUESTIONS
+        chunk.append({
+            "timestamp": f"ts-{s}",
+            "user_id": f"user{s % 5000}",
+            "question_text": f"質問 {i % 400}",
+            "answer_text": str(i % 5 + 1),
+            "total_question_count": QUESTIONS,
+            "evaluation_summary": f"要約 {s}",
+            "axis": questionnaire.AXES[i % len(questionnaire.AXES)],
+        })
+        if len(chunk) >= 15000:
+            sqlite_storage.save_interactions(data_persistence.DB_PATH, chunk)
+            chunk = []
+    if chunk:
+        sqlite_storage.save_interactions(data_persistence.DB_PATH, chunk)
+
+
+def _sessions():
+    df = data_persistence.load_interactions()
+    return (
+        df[["timestamp", "user_id", "evaluation_summary"]]
+        .drop_duplicates(subset=["timestamp", "user_id"])
+        .reset_index(drop=True)
+    )
+
+
+def bench_dashboard(rows: int, backend: str, runs: int) -> list[dict]:
+    data_persistence.BACKEND = backend
+    start = time.perf_counter()
+    (_prefill_sqlite if backend == "sqlite" else _prefill_csv)(rows)
+    prefill = time.perf_counter() - start
+
+    def cold() -> None:
+        data_persistence._interactions_cache.clear()
+        _sessions()
+
+    counter = iter(range(10**9))
+
+    def incremental() -> None:
+        answers = [(f"質問 {q}", "3") for q in range(QUESTIONS)]
+        data_persistence.save_session("new", answers, "要約", f"new-{next(counter)}")
+        _sessions()
+
+    params = {"rows": rows, "backend": backend}
+    cold_result = _measure(cold, runs)
+    frame = data_persistence.load_interactions()
+    cold_result["frame_mb"] = round(frame.memory_usage(deep=True).sum() / 2**20, 2)
+    cold_result["prefill_s"] = round(prefill, 2)
+    return [
+        {"scenario": "dashboard_load_cold", "params": params, **cold_result},
+        {"scenario": "dashboard_load_incremental", "params": params, **_measure(incremental, runs)},
+    ]
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _key(result: dict) -> str:
+    return result["scenario"] + json.dumps(result["params"], sort_keys=True)
+
+
+def compare(current: dict, baseline_path: Path) -> None:
+    baseline = {_key(r): r for r in json.loads(baseline_path.read_text())["results"]}
+    print(f"\nchange in median wall time vs {baseline_path}:")
+    for result in current["results"]:
+        old = baseline.get(_key(result))
+        if old is None:
+            continue
+        before, after = old["wall_s"]["p50"], result["wall_s"]["p50"]
+        change = (after - before) / before * 100 if before else 0.0
+        print(
+            f"  {_key(result):<70} {before * 1000:9.1f} -> {after * 1000:9.1f} ms"
+            f" ({change:+.0f}%)"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument(
+        "--backend", choices=["csv", "sqlite"], nargs="+", default=["csv", "sqlite"]
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--median", type=float, default=0.2, help="mock median latency (s)")
+    parser.add_argument("--sigma", type=float, default=0.5, help="mock log-normal spread")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--similar-rate", type=float, default=0.2)
+    parser.add_argument("--skip-llm", action="store_true", help="only benchmark data loading")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path, help="earlier result file to compare with")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        median_latency=args.median,
+        sigma=args.sigma,
+        error_rate=args.error_rate,
+        similar_rate=args.similar_rate,
+    )
+    results: list[dict] = []
+    with tempfile.TemporaryDirectory() as tmp, MockOpenAI(config) as mock:
+        os.environ["OPENAI_API_KEY"] = "mock"
+        os.environ["OPENAI_BASE_URL"] = mock.base_url
+        llm_client.reset()
+        llm_cache.ENABLED = False
+        tracing.ENABLED = False
+        data_persistence.REPORTS_PATH = Path(tmp) / "reports.csv"
+        if not args.skip_llm:
+            data_persistence.CSV_PATH = Path(tmp) / "llm.csv"
+            results += bench_generation(mock, args.runs)
+            results += bench_pipeline(mock, args.runs)
+        for backend in args.backend:
+            for rows in args.rows:
+                data_persistence.CSV_PATH = Path(tmp) / f"interactions-{rows}.csv"
+                data_persistence.DB_PATH = Path(tmp) / f"bench-{rows}.sqlite3"
+                results += bench_dashboard(rows, backend, args.runs)
+                sqlite_storage.close_all()
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "mock": vars(config),
+            "runs": args.runs,
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "results": results,
+    }
+    for r in results:
+        wall = r["wall_s"]
+        calls = r.get("api_calls", {}).get("total")
+        print(
+            f"{_key(r):<70} p50 {wall['p50'] * 1000:9.1f} ms  p95 {wall['p95'] * 1000:9.1f} ms"
+            f"  peak {r['peak_mb']:8.1f} MB" + (f"  calls {calls:.1f}" if calls is not None else "")
+        )
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=1))
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
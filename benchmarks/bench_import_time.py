@@ -0,0 +1,109 @@
+"""Measure import time and memory of the app's modules against a budget.
+
+Every module is imported ``--runs`` times, each in a fresh interpreter that
+has already imported ``streamlit`` (a running server always has), and the
+median wall time, the resident memory added and the heavy dependencies that
+got loaded are reported.  The run fails (exit status 1) when a module exceeds
+its time budget or loads a dependency it must not, so it can guard cold start
+in CI::
+
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --runs 10 --scale 2 --output imports.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+HEAVY = ("pandas", "numpy", "plotly", "openai", "questionnaire", "prompts", "cohort")
+
+# module -> (time budget in ms, dependencies it must not import)
+BUDGET: dict[str, tuple[float, tuple[str, ...]]] = {
+    "app": (400, ("pandas", "openai", "questionnaire", "prompts", "cohort")),
+    "data_persistence": (100, ("pandas", "numpy", "openai")),
+    "tracing": (100, ("pandas", "numpy", "openai")),
+    "fallback": (50, ("pandas", "numpy", "openai")),
+    "write_queue": (100, ("pandas", "numpy", "openai")),
+    "questionnaire": (1500, ("pandas", "plotly.graph_objects")),
+    "prompts": (1200, ("pandas", "numpy", "plotly.graph_objects")),
+    "pipeline": (1500, ("pandas", "plotly.graph_objects")),
+    "cohort": (1500, ("openai", "questionnaire")),
+}
+
+_PROBE = """
+import json, resource, sys, time, warnings, logging
+warnings.simplefilter("ignore")
+import streamlit
+logging.disable(logging.WARNING)
+sys.path.insert(0, {root!r})
+before = dict.fromkeys(sys.modules)
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+__import__({module!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "ms": elapsed * 1000,
+    "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss,
+    "loaded": [m for m in sys.modules if m not in before],
+}}))
+"""
+
+
+def measure(module: str, runs: int) -> dict:
+    """Import ``module`` in ``runs`` fresh interpreters and summarise."""
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(root=str(ROOT), module=module)],
+            capture_output=True, text=True, check=True, cwd=ROOT,
+        ).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    loaded = set(samples[0]["loaded"])
+    return {
+        "ms": statistics.median(s["ms"] for s in samples),
+        "rss_mb": statistics.median(s["rss_kb"] for s in samples) / 1024,
+        "heavy": sorted(m for m in HEAVY if m in loaded and m != module),
+        "loaded": loaded,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=list(BUDGET))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply time budgets")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    results, failures = {}, []
+    for module in args.modules:
+        result = measure(module, args.runs)
+        max_ms, forbidden = BUDGET.get(module, (float("inf"), ()))
+        max_ms *= args.scale
+        loaded = result.pop("loaded")
+        banned = sorted(m for m in forbidden if m in loaded)
+        if result["ms"] > max_ms:
+            failures.append(f"{module}: {result['ms']:.0f} ms > budget {max_ms:.0f} ms")
+        if banned:
+            failures.append(f"{module}: imports {', '.join(banned)}")
+        results[module] = result | {"budget_ms": max_ms, "banned": banned}
+        print(
+            f"{module:<18} {result['ms']:8.1f} ms (budget {max_ms:6.0f})"
+            f"  +{result['rss_mb']:6.1f} MB  heavy: {', '.join(result['heavy']) or '-'}"
+        )
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=1))
+    for failure in failures:
+        print("FAIL", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Measure the cost of persisting one completed questionnaire.
+
+Compares the per-question ``save_interaction`` loop with the bulk
+``save_session`` call for each storage backend on top of a store that already
+holds ``--existing`` rows.
+
+    python benchmarks/bench_save_session.py --existing 10000 --sessions 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import data_persistence
+
+QUESTIONS = 15
+
+
+def _session(i: int) -> list[tuple[str, str]]:
+    return [(f"質問 {i}-{q} の内容についてどう思いますか？", str(q % 5 + 1)) for q in range(QUESTIONS)]
+
+
+def _prefill(existing: int) -> None:
+    summary = "要約" * 100
+    for i in range(existing // QUESTIONS):
+        data_persistence.save_session(f"seed{i}", _session(i), summary, f"seed-{i}")
+
+
+def _loop(i: int, summary: str) -> None:
+    for question_text, answer_text in _session(i):
+        data_persistence.save_interaction(
+            f"user{i}", question_text, answer_text, QUESTIONS, summary, f"ts-{i}"
+        )
+
+
+def _bulk(i: int, summary: str) -> None:
+    data_persistence.save_session(f"user{i}", _session(i), summary, f"ts-{i}")
+
+
+def run(backend: str, existing: int, sessions: int) -> dict[str, float]:
+    results = {}
+    summary = "要約" * 100
+    for name, fn in (("save_interaction loop", _loop), ("save_session", _bulk)):
+        with tempfile.TemporaryDirectory() as tmp:
+            data_persistence.BACKEND = backend
+            data_persistence.CSV_PATH = Path(tmp) / "interactions.csv"
+            data_persistence.DB_PATH = Path(tmp) / "bench.sqlite3"
+            _prefill(existing)
+            start = time.perf_counter()
+            for i in range(sessions):
+                fn(i, summary)
+            results[name] = (time.perf_counter() - start) / sessions * 1000
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--existing", type=int, default=10_000)
+    parser.add_argument("--sessions", type=int, default=200)
+    args = parser.parse_args()
+    for backend in ("csv", "sqlite"):
+        for name, ms in run(backend, args.existing, args.sessions).items():
+            print(f"{backend:6} {name:22} {ms:8.3f} ms/session")
+
+
+if __name__ == "__main__":
+    main()
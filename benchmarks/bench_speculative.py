@@ -0,0 +1,71 @@
+"""Compare serial and speculative question generation under simulated latency.
+
+Each generation call sleeps for a log-normally distributed time and its
+candidate is rejected as a duplicate with probability ``--reject``.  For every
+``k`` the slot latency percentiles and the API calls per slot are reported, so
+the tail-latency gain can be weighed against the extra cost.
+
+    python benchmarks/bench_speculative.py --slots 300 --reject 0.3 --k 1 2 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import prompts
+import questionnaire
+
+
+def _install_stubs(median: float, sigma: float, reject: float) -> None:
+    async def generate(axis, category=None, temperature=0.4):
+        await asyncio.sleep(random.lognormvariate(0, sigma) * median)
+        return '{"question_text": "%f", "axis": "%s"}' % (random.random(), axis)
+
+    async def is_similar(text, existing, threshold=None):
+        return random.random() < reject
+
+    prompts.generate_question_async = generate
+    questionnaire._is_similar_async = is_similar
+
+
+async def _run(k: int, slots: int, concurrency: int) -> None:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def slot() -> None:
+        async with sem:
+            await questionnaire._generate_unique_question_async("axis", [], 0.4, "c", k=k)
+
+    await asyncio.gather(*(slot() for _ in range(slots)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--slots", type=int, default=300)
+    parser.add_argument("--median", type=float, default=0.05, help="median call latency (s)")
+    parser.add_argument("--sigma", type=float, default=0.6, help="log-normal spread")
+    parser.add_argument("--reject", type=float, default=0.3, help="duplicate probability")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 3])
+    args = parser.parse_args()
+
+    _install_stubs(args.median, args.sigma, args.reject)
+    print(f"{'k':>3} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'calls/slot':>11}")
+    for k in args.k:
+        random.seed(0)
+        questionnaire.reset_speculation_stats()
+        asyncio.run(_run(k, args.slots, args.concurrency))
+        s = questionnaire.speculation_stats()
+        print(
+            f"{k:>3} {s['p50'] * 1000:>8.1f} {s['p95'] * 1000:>8.1f} "
+            f"{s['p99'] * 1000:>8.1f} {s['calls_per_slot']:>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Compare disk usage and full-load time of the CSV and SQLite stores.
+
+    python benchmarks/bench_storage_size.py --sessions 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import data_persistence
+import sqlite_storage
+
+QUESTIONS = 15
+BANK_SIZE = 300
+
+
+def run(backend: str, sessions: int) -> tuple[int, float]:
+    rng = random.Random(0)
+    bank = [f"質問{i}: 治療の進め方について事前に詳しく説明してほしいと思いますか？" for i in range(BANK_SIZE)]
+    summary = "回答からは説明の丁寧さと予定の明確さを重視する傾向がうかがえます。" * 6
+    with tempfile.TemporaryDirectory() as tmp:
+        data_persistence.BACKEND = backend
+        data_persistence.CSV_PATH = Path(tmp) / "interactions.csv"
+        data_persistence.DB_PATH = Path(tmp) / "bench.sqlite3"
+        for i in range(sessions):
+            pairs = [(q, str(rng.randint(1, 5))) for q in rng.sample(bank, QUESTIONS)]
+            data_persistence.save_session(f"user{i}", pairs, summary, f"2024-01-01T00:00:{i:06d}")
+        sqlite_storage.close_all()
+        size = sum(f.stat().st_size for f in Path(tmp).iterdir() if not f.name.endswith(".lock"))
+        data_persistence._interactions_cache.clear()
+        start = time.perf_counter()
+        data_persistence.load_interactions()
+        elapsed = time.perf_counter() - start
+        sqlite_storage.close_all()
+    return size, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    args = parser.parse_args()
+    for backend in ("csv", "sqlite"):
+        size, elapsed = run(backend, args.sessions)
+        print(f"{backend:6} {size / 1024:10.1f} KiB  load {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
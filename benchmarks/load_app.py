@@ -0,0 +1,79 @@
+"""Streamlit entry point used by ``load_test.py``: ``app.py`` with a redirected,
+instrumented data store.
+
+The data paths are moved to ``LOAD_TEST_DIR`` and every store write and wait
+for a CSV file lock is appended as one JSON line to
+``LOAD_TEST_DIR/writes.jsonl``.  Setup happens once per server process; each
+script run then executes ``app.py`` unchanged.
+"""
+
+import json
+import os
+import runpy
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+import data_persistence
+import llm_cache
+import question_bank
+import tracing
+
+
+def _setup(directory: Path) -> None:
+    data_persistence.CSV_PATH = directory / "interactions.csv"
+    data_persistence.USERS_PATH = directory / "users.csv"
+    data_persistence.REPORTS_PATH = directory / "reports.csv"
+    data_persistence.DB_PATH = directory / "load.sqlite3"
+    question_bank.BANK_PATH = directory / "question_bank.json"
+    if os.getenv("LOAD_TEST_BANK", "0") == "0":
+        question_bank.LOW_WATER_MARK = 0  # never refill an empty bank
+    llm_cache.CACHE_PATH = directory / "llm_cache.sqlite3"
+    tracing.TRACE_PATH = directory / "llm_trace.jsonl"
+
+    log = open(directory / "writes.jsonl", "a", encoding="utf-8")
+    lock = threading.Lock()
+
+    def add(name: str, seconds: float) -> None:
+        with lock:
+            log.write(json.dumps({"name": name, "seconds": seconds}) + "\n")
+            log.flush()
+
+    file_lock = data_persistence.file_lock
+
+    @contextmanager
+    def timed_lock(path):
+        start = time.perf_counter()
+        with file_lock(path):
+            add("lock_wait", time.perf_counter() - start)
+            yield
+
+    data_persistence.file_lock = timed_lock
+    # Batch functions, as called by write_queue's writer thread.
+    for name in ("save_sessions", "save_reports", "save_users", "save_report"):
+        original = getattr(data_persistence, name)
+
+        def wrapper(*args, _original=original, _name=name, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _original(*args, **kwargs)
+            finally:
+                add(f"write.{_name}", time.perf_counter() - start)
+
+        setattr(data_persistence, name, wrapper)
+
+
+# Concurrent first script runs must not set up (and wrap the writers) twice;
+# the lock lives on a module that, unlike this script, is imported only once.
+with data_persistence.__dict__.setdefault("_load_test_lock", threading.Lock()):
+    if not getattr(data_persistence, "_load_test", False):
+        _setup(Path(os.environ["LOAD_TEST_DIR"]))
+        data_persistence._load_test = True
+
+runpy.run_path(str(ROOT / "app.py"), run_name="__main__")
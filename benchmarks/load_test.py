@@ -0,0 +1,317 @@
+"""Multi-session load test of the patient flow in ``app.py``.
+
+One headless ``streamlit run`` server (``load_app.py``, i.e. ``app.py`` with
+its data store moved to a temporary directory) is started against the local
+mock OpenAI server.  Simulated patients then click through consent, the start
+page and every question up to the results page, each over its own websocket
+session as a browser would.  Reported are completed sessions per minute,
+latency percentiles of each step, the server's peak RSS and how long writes
+to the data store took or waited for CSV file locks.
+
+    python benchmarks/load_test.py --sessions 40 --concurrency 10 --median 0.3
+    python benchmarks/load_test.py --backend sqlite --output load.json
+
+Streamlit's ``AppTest`` is not used: it runs the script in the calling
+thread against process-global runtime state, so concurrent instances in one
+process break each other.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.sync.client import connect
+
+import tracing
+from mock_openai import MockConfig, MockOpenAI
+
+APP_PATH = Path(__file__).resolve().parent / "load_app.py"
+RERUN_REQUESTED = 2  # ScriptFinishedStatus.FINISHED_EARLY_FOR_RERUN
+
+
+class Recorder:
+    """Thread-safe collection of named latency samples."""
+
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.samples[name].append(seconds)
+
+    @contextmanager
+    def timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        result = {}
+        for name, values in sorted(self.samples.items()):
+            ordered = sorted(values)
+            pick = lambda p: ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+            result[name] = {
+                "count": len(ordered),
+                "p50": statistics.median(ordered),
+                "p95": pick(0.95),
+                "p99": pick(0.99),
+                "max": ordered[-1],
+            }
+        return result
+
+
+class Session:
+    """One browser tab: sends widget states and waits for the script run."""
+
+    def __init__(self, ws, timeout: float) -> None:
+        self.ws = ws
+        self.timeout = timeout
+        self.widgets: dict[str, object] = {}  # widget id -> element proto
+        self.values: dict[str, WidgetState] = {}
+
+    def widget(self, kind: str, suffix: str = "") -> str:
+        """Return the id of the rendered ``kind`` widget whose id ends with ``suffix``."""
+        for wid, (k, _) in self.widgets.items():
+            if k == kind and wid.endswith(suffix):
+                return wid
+        raise LookupError(f"no {kind} widget {suffix!r} on the page")
+
+    def set_text(self, key: str, value: str) -> None:
+        wid = self.widget("text_input", f"-{key}")
+        self.values[wid] = WidgetState(id=wid, string_value=value)
+
+    def set_radio(self, key: str, index: int) -> None:
+        wid = self.widget("radio", f"-{key}")
+        element = self.widgets[wid][1]
+        if "raw_value" in element.DESCRIPTOR.fields_by_name:
+            # Newer Streamlit identifies the choice by its formatted label.
+            state = WidgetState(id=wid, string_value=element.options[index])
+        else:
+            state = WidgetState(id=wid, int_value=index)
+        self.values[wid] = state
+
+    def click(self, label: str) -> None:
+        wid = next(
+            w for w, (k, e) in self.widgets.items() if k == "button" and e.label == label
+        )
+        self.rerun(WidgetState(id=wid, trigger_value=True))
+
+    def rerun(self, trigger: WidgetState | None = None) -> None:
+        """Rerun the script and wait until it (and any ``st.rerun``) finished."""
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        states = [s for wid, s in self.values.items() if wid in self.widgets]
+        msg.rerun_script.widget_states.widgets.extend(states + ([trigger] if trigger else []))
+        self.ws.send(msg.SerializeToString())
+        self.widgets = {}
+        deadline = time.monotonic() + self.timeout
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(self.ws.recv(timeout=max(0.0, deadline - time.monotonic())))
+            kind = fwd.WhichOneof("type")
+            if kind == "new_session":
+                self.widgets = {}
+            elif kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                element = fwd.delta.new_element
+                name = element.WhichOneof("type")
+                if name == "exception":
+                    raise RuntimeError(element.exception.message)
+                inner = getattr(element, name)
+                if "id" in inner.DESCRIPTOR.fields_by_name and inner.id:
+                    self.widgets[inner.id] = (name, inner)
+            elif kind == "script_finished" and fwd.script_finished != RERUN_REQUESTED:
+                return
+
+
+def run_session(index: int, url: str, steps: Recorder, timeout: float) -> int:
+    """Drive one patient from the consent page to the results page.
+
+    Questions are answered until none is shown, so adaptive questionnaires of
+    any length are followed to the end.  Returns the number answered.
+    """
+    with connect(url, max_size=None, open_timeout=timeout) as ws:
+        session = Session(ws, timeout)
+        with steps.timed("consent_page"):
+            session.rerun()
+        session.set_text("input_user_id", f"load{index}")
+        session.set_text("input_user_name", f"患者{index}")
+        with steps.timed("start"):
+            session.click("スタート")
+        i = 0
+        while True:
+            session.set_radio(f"q{i}", i % 5)
+            start = time.perf_counter()
+            session.click("次へ")
+            i += 1
+            try:
+                session.widget("radio", f"-q{i}")
+            except LookupError:
+                steps.add("results", time.perf_counter() - start)
+                return i
+            steps.add("next_question", time.perf_counter() - start)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_healthy(port: int, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if proc.poll() is not None:
+            raise RuntimeError(f"streamlit exited with {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError("streamlit server did not become healthy")
+
+
+def _peak_rss_mb(pid: int) -> float | None:
+    """Peak resident set size of ``pid`` (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("--median", type=float, default=0.2, help="mock median latency (s)")
+    parser.add_argument("--sigma", type=float, default=0.5, help="mock log-normal spread")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--bank", action="store_true", help="keep the question bank enabled")
+    parser.add_argument("--adaptive", action="store_true", help="QUESTIONNAIRE_MODE=adaptive")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per script run (s)")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    config = MockConfig(median_latency=args.median, sigma=args.sigma, error_rate=args.error_rate)
+    steps, writes = Recorder(), Recorder()
+    failures: list[str] = []
+    questions: list[int] = []
+    with tempfile.TemporaryDirectory() as tmp, MockOpenAI(config) as mock:
+        tmp = Path(tmp)
+        port = _free_port()
+        env = os.environ | {
+            "OPENAI_API_KEY": "mock",
+            "OPENAI_BASE_URL": mock.base_url,
+            "DATA_BACKEND": args.backend,
+            "LOAD_TEST_DIR": str(tmp),
+            "LOAD_TEST_BANK": "1" if args.bank else "0",
+            "QUESTIONNAIRE_MODE": "adaptive" if args.adaptive else "fixed",
+        }
+        proc = subprocess.Popen(
+            [
+                sys.executable, "-m", "streamlit", "run", str(APP_PATH),
+                "--server.headless", "true",
+                "--server.port", str(port),
+                "--server.address", "127.0.0.1",
+                "--server.enableXsrfProtection", "false",
+                "--browser.gatherUsageStats", "false",
+            ],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=open(tmp / "server.log", "w"),
+        )
+        try:
+            _wait_healthy(port, proc)
+            url = f"ws://127.0.0.1:{port}/_stcore/stream"
+            rss_before = _peak_rss_mb(proc.pid)
+            start = time.perf_counter()
+
+            def worker(i: int) -> None:
+                try:
+                    with steps.timed("session"):
+                        questions.append(run_session(i, url, steps, args.timeout))
+                except Exception:
+                    failures.append(traceback.format_exc(limit=3))
+
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                list(pool.map(worker, range(args.sessions)))
+            elapsed = time.perf_counter() - start
+            rss_peak = _peak_rss_mb(proc.pid)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+        api_calls = dict(mock.counts)
+        log = tmp / "writes.jsonl"
+        if log.exists():
+            for line in log.read_text().splitlines():
+                entry = json.loads(line)
+                writes.add(entry["name"], entry["seconds"])
+        tracing.TRACE_PATH = tmp / "llm_trace.jsonl"
+        trace = tracing.summarise(tracing.load())
+        if failures:
+            server_log = (tmp / "server.log").read_text()[-2000:]
+
+    completed = args.sessions - len(failures)
+    report = {
+        "params": vars(args) | {"output": str(args.output) if args.output else None},
+        "completed": completed,
+        "failed": len(failures),
+        "elapsed_s": elapsed,
+        "sessions_per_min": completed / elapsed * 60,
+        "questions_per_session": statistics.fmean(questions) if questions else None,
+        "steps": steps.summary(),
+        "writes": writes.summary(),
+        "api_calls": api_calls,
+        "llm_latency": trace.get("latency"),
+        "server_rss_mb": {"idle": rss_before, "peak": rss_peak},
+    }
+    print(f"{completed}/{args.sessions} sessions in {elapsed:.1f}s "
+          f"({report['sessions_per_min']:.1f} sessions/min, concurrency {args.concurrency})")
+    if questions:
+        print(f"{report['questions_per_session']:.1f} questions per session")
+    if rss_peak is not None:
+        print(f"server peak RSS {rss_peak:.0f} MB (idle {rss_before:.0f} MB)")
+    for title, table in (("step", report["steps"]), ("write", report["writes"])):
+        for name, s in table.items():
+            print(
+                f"{title:>5} {name:<20} n={s['count']:<5} p50 {s['p50'] * 1000:8.1f} ms"
+                f"  p95 {s['p95'] * 1000:8.1f} ms  p99 {s['p99'] * 1000:8.1f} ms"
+            )
+    for failure in failures[:3]:
+        print(failure)
+    if failures:
+        print(server_log)
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=1, default=str))
+
+
+if __name__ == "__main__":
+    main()
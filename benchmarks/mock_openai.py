@@ -0,0 +1,280 @@
+"""Local OpenAI-compatible chat completion server for benchmarks and load tests.
+
+Replies are synthesised from the request: question generation prompts get
+JSON questions, the similarity tie-break gets "はい"/"いいえ", the staff
+report prompt gets a JSON report and everything else plain Japanese text.
+Latency is drawn from a log-normal distribution and a share of requests can
+fail with an HTTP error, so client-side retries, hedging and the circuit
+breaker are exercised too.  Streaming (``"stream": true``) is supported.
+
+Run it standalone and point the app at it::
+
+    python benchmarks/mock_openai.py --port 8001 --median 0.4 --error-rate 0.02
+    OPENAI_API_KEY=mock OPENAI_BASE_URL=http://127.0.0.1:8001/v1 streamlit run app.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NOUNS = (
+    "予約 待ち時間 説明 治療 計画 検査 結果 食事 睡眠 運動 家族 友人 仕事 休日 薬 費用"
+    " 受付 連絡 相談 記録 体調 気分 習慣 趣味 通院 手続き 書類 看護 担当 質問 選択 希望"
+    " 準備 変更 順番 場所 方法 目標 約束 会話 情報 資料 意見 比較"
+).split()
+ENDINGS = [
+    "を大切にしたいと思いますか",
+    "が気になりますか",
+    "を自分で決めたいですか",
+    "を詳しく知りたいですか",
+    "を誰かに任せたいですか",
+    "が変わると落ち着きませんか",
+    "について相談したいですか",
+    "を事前に確認したいですか",
+    "に満足していますか",
+    "を重視しますか",
+]
+STAFF_REPORT = {
+    "risk_profile_summary": "全体として安定した傾向です。",
+    "caution_points": ["説明を急がない", "約束した時間を守る"],
+    "recommended_actions": ["治療の見通しを共有する", "質問の機会を設ける"],
+    "escalation_plan": "懸念があれば担当医と共有し、段階的に対応します。",
+}
+PATIENT_TEXT = "アンケートへのご協力ありがとうございました。" * 12
+SUMMARY_TEXT = "回答は全体として落ち着いた傾向を示しています。" * 5
+
+_SINGLE = re.compile(
+    r"Category: (?P<category>.+?)\. Generate one short question related to the axis '(?P<axis>.+?)'"
+)
+_BATCH = re.compile(r"- Axis '(?P<axis>.+?)': (?P<n>\d+) questions")
+
+
+@dataclass
+class MockConfig:
+    """Behaviour of the mock server; fields may be changed while it runs."""
+
+    median_latency: float = 0.2
+    sigma: float = 0.5  # log-normal spread; 0 gives a fixed latency
+    error_rate: float = 0.0
+    error_status: int = 429
+    similar_rate: float = 0.2  # share of tie-breaks answered "はい"
+    duplicate_rate: float = 0.0  # share of questions repeating an earlier one
+    chunk_delay: float = 0.01  # pause between streamed chunks
+
+
+def _question() -> str:
+    a, b, c = random.sample(NOUNS, 3)
+    return f"{a}や{b}、{c}{random.choice(ENDINGS)}？"
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address) -> None:
+        # Hedged and cancelled requests close their connection early.
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def classify(messages: list) -> str:
+    """Return the kind of request: question, batch, similarity, staff, patient or summary."""
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    if "判定" in system:
+        return "similarity"
+    if "軸の名称をキー" in system:
+        return "batch"
+    if "question_text" in system:
+        return "question"
+    if "risk assessment" in system:
+        return "staff"
+    if "カウンセラー" in system:
+        return "patient"
+    return "summary"
+
+
+class MockOpenAI:
+    """Threaded mock server; use as a context manager or call start()/stop()."""
+
+    def __init__(self, config: MockConfig | None = None, port: int = 0) -> None:
+        self.config = config or MockConfig()
+        self.counts: Counter = Counter()
+        self._issued: list[str] = []
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", port), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    def start(self) -> "MockOpenAI":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockOpenAI":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.counts.clear()
+
+    def _new_question(self) -> str:
+        with self._lock:
+            if self._issued and random.random() < self.config.duplicate_rate:
+                return random.choice(self._issued)
+            text = _question()
+            self._issued.append(text)
+            return text
+
+    def reply(self, kind: str, messages: list) -> str:
+        """Return the synthetic reply text for a request."""
+        user = next((m["content"] for m in messages if m["role"] == "user"), "")
+        if kind == "similarity":
+            return "はい" if random.random() < self.config.similar_rate else "いいえ"
+        if kind == "question":
+            match = _SINGLE.search(user)
+            axis = match["axis"] if match else ""
+            return json.dumps(
+                {"question_text": self._new_question(), "axis": axis}, ensure_ascii=False
+            )
+        if kind == "batch":
+            return json.dumps(
+                {
+                    m["axis"]: [
+                        {"question_text": self._new_question(), "axis": m["axis"]}
+                        for _ in range(int(m["n"]))
+                    ]
+                    for m in _BATCH.finditer(user)
+                },
+                ensure_ascii=False,
+            )
+        if kind == "staff":
+            return json.dumps(STAFF_REPORT, ensure_ascii=False)
+        if kind == "patient":
+            return PATIENT_TEXT
+        return SUMMARY_TEXT
+
+    def _latency(self) -> float:
+        cfg = self.config
+        if cfg.sigma <= 0:
+            return cfg.median_latency
+        return random.lognormvariate(0, cfg.sigma) * cfg.median_latency
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                kind = classify(body.get("messages", []))
+                with mock._lock:
+                    mock.counts[kind] += 1
+                    mock.counts["total"] += 1
+                time.sleep(mock._latency())
+                if random.random() < mock.config.error_rate:
+                    with mock._lock:
+                        mock.counts["errors"] += 1
+                    return self._json(
+                        mock.config.error_status,
+                        {"error": {"message": "injected failure", "type": "server_error"}},
+                    )
+                content = mock.reply(kind, body.get("messages", []))
+                usage = {
+                    "prompt_tokens": sum(len(m["content"]) for m in body["messages"]) // 2,
+                    "completion_tokens": len(content) // 2,
+                }
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                if body.get("stream"):
+                    return self._stream(content, usage)
+                self._json(200, {
+                    "id": "mock", "object": "chat.completion", "created": 0,
+                    "model": body.get("model", "mock"),
+                    "choices": [{
+                        "index": 0, "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }],
+                    "usage": usage,
+                })
+
+            def _json(self, status: int, payload: dict) -> None:
+                data = json.dumps(payload, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, content: str, usage: dict) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                pieces = [content[i:i + 20] for i in range(0, len(content), 20)]
+                for piece in pieces:
+                    self._event({"choices": [
+                        {"index": 0, "delta": {"content": piece}, "finish_reason": None}
+                    ]})
+                    time.sleep(mock.config.chunk_delay)
+                self._event({"choices": [], "usage": usage})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def _event(self, payload: dict) -> None:
+                chunk = {
+                    "id": "mock", "object": "chat.completion.chunk", "created": 0,
+                    "model": "mock", **payload,
+                }
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--median", type=float, default=0.2, help="median latency (s)")
+    parser.add_argument("--sigma", type=float, default=0.5, help="log-normal spread")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--similar-rate", type=float, default=0.2)
+    parser.add_argument("--duplicate-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    config = MockConfig(
+        median_latency=args.median,
+        sigma=args.sigma,
+        error_rate=args.error_rate,
+        similar_rate=args.similar_rate,
+        duplicate_rate=args.duplicate_rate,
+    )
+    mock = MockOpenAI(config, port=args.port)
+    print(f"mock OpenAI listening on {mock.base_url}")
+    try:
+        mock.start()._thread.join()
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Simulate the adaptive questionnaire and measure what it saves.
+
+Simulated patients have a true score per axis and answer on the 1-5 scale
+with Gaussian noise whose spread varies between patients (``--noise``).  Every
+patient is run through the fixed questionnaire (``--per-axis`` questions per
+axis) and through :class:`questionnaire.AdaptivePolicy` for each
+``--tolerance``.  Reported are questions asked per session and the error of
+the axis score estimates against the true scores::
+
+    python benchmarks/sim_adaptive.py --patients 5000 --tolerance 0.6 0.85 1.1
+
+With ``--live`` sessions additionally run end to end through
+``AdaptiveQuestionnaire`` and ``QuestionnaireStream`` against the local mock
+OpenAI server, counting API calls by kind and questions generated, including
+those generated but never asked.  ``--bank`` serves them from a question bank
+stocked before each session instead of generating every question live::
+
+    python benchmarks/sim_adaptive.py --live 20 --median 0.05 --bank
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import questionnaire
+from axes import AXES
+
+
+def _answer(rng: random.Random, true_score: float, noise: float) -> int:
+    return min(5, max(1, round(rng.gauss(true_score, noise))))
+
+
+def _patient(rng: random.Random, noise_levels: list[float]) -> tuple[dict, float]:
+    return {axis: rng.uniform(1, 5) for axis in AXES}, rng.choice(noise_levels)
+
+
+def run_fixed(rng, truth: dict, noise: float, per_axis: int) -> dict[str, list[int]]:
+    return {axis: [_answer(rng, truth[axis], noise) for _ in range(per_axis)] for axis in AXES}
+
+
+def run_adaptive(rng, truth: dict, noise: float, policy) -> dict[str, list[int]]:
+    answers: dict[str, list[int]] = {axis: [] for axis in AXES}
+    while (axis := policy.next_axis(answers)) is not None:
+        answers[axis].append(_answer(rng, truth[axis], noise))
+    return answers
+
+
+def _summarise(runs: list[tuple[dict, dict]]) -> dict:
+    counts = sorted(sum(len(v) for v in answers.values()) for _, answers in runs)
+    errors = sorted(
+        abs(statistics.fmean(answers[axis]) - truth[axis])
+        for truth, answers in runs
+        for axis in AXES
+    )
+    pick = lambda xs, p: xs[min(len(xs) - 1, int(len(xs) * p))]
+    return {
+        "questions_mean": statistics.fmean(counts),
+        "questions_p95": pick(counts, 0.95),
+        "abs_error_mean": statistics.fmean(errors),
+        "abs_error_p95": pick(errors, 0.95),
+    }
+
+
+def simulate(args) -> None:
+    print(f"{'mode':<24} {'questions':>9} {'p95':>5} {'|error|':>8} {'p95':>6} {'saved':>6}")
+    rng = random.Random(args.seed)
+    patients = [_patient(rng, args.noise) for _ in range(args.patients)]
+    fixed = _summarise(
+        [(t, run_fixed(random.Random(i), t, n, args.per_axis)) for i, (t, n) in enumerate(patients)]
+    )
+    rows = [(f"fixed {args.per_axis}/axis", fixed)]
+    for tolerance in args.tolerance:
+        policy = questionnaire.AdaptivePolicy(
+            tolerance=tolerance,
+            min_per_axis=args.min_per_axis,
+            max_per_axis=args.max_per_axis,
+            max_questions=args.per_axis * len(AXES),
+        )
+        rows.append((
+            f"adaptive tol={tolerance}",
+            _summarise(
+                [(t, run_adaptive(random.Random(i), t, n, policy)) for i, (t, n) in enumerate(patients)]
+            ),
+        ))
+    for name, r in rows:
+        saved = 1 - r["questions_mean"] / fixed["questions_mean"]
+        print(
+            f"{name:<24} {r['questions_mean']:9.2f} {r['questions_p95']:5d}"
+            f" {r['abs_error_mean']:8.3f} {r['abs_error_p95']:6.2f} {saved:6.0%}"
+        )
+
+
+def _stock_bank(per_category: int) -> None:
+    import prompts
+    import question_bank
+
+    for axis in AXES:
+        for cat in prompts.AXIS_CATEGORIES.get(axis, ["一般"]):
+            missing = per_category - question_bank.counts().get(axis, {}).get(cat, 0)
+            question_bank.add(
+                axis, cat, [f"{axis}/{cat} {random.random():.12f}" for _ in range(missing)]
+            )
+
+
+def live(args) -> None:
+    import llm_cache
+    import llm_client
+    import question_bank
+    import tracing
+    from mock_openai import MockConfig, MockOpenAI
+
+    llm_cache.ENABLED = False
+    tracing.ENABLED = False
+    policy = questionnaire.AdaptivePolicy(
+        min_per_axis=args.min_per_axis,
+        max_per_axis=args.max_per_axis,
+        max_questions=args.per_axis * len(AXES),
+    )
+    rng = random.Random(args.seed)
+    bank_dir = tempfile.TemporaryDirectory()
+    question_bank.BANK_PATH = Path(bank_dir.name) / "question_bank.json"
+    with bank_dir, MockOpenAI(MockConfig(median_latency=args.median)) as mock:
+        os.environ["OPENAI_API_KEY"] = "mock"
+        os.environ["OPENAI_BASE_URL"] = mock.base_url
+        llm_client.reset()
+        for name in ("fixed", "adaptive"):
+            calls, asked, generated, unused, walls = [], [], [], [], []
+            kinds: Counter = Counter()
+            for i in range(args.live):
+                truth, noise = _patient(random.Random(args.seed + i), args.noise)
+                if args.bank:
+                    _stock_bank(args.max_per_axis)
+                if name == "fixed":
+                    stream = questionnaire.QuestionnaireStream(args.per_axis, use_bank=args.bank)
+                else:
+                    stream = questionnaire.AdaptiveQuestionnaire(policy, use_bank=args.bank)
+                mock.reset_counts()
+                start = time.perf_counter()
+                stream.start()
+                index = 0
+                while index < stream.total:
+                    q = stream.get(index, timeout=questionnaire.QUESTION_DEADLINE, use_fallback=True)
+                    stream.answer(index, _answer(rng, truth[q["axis"]], noise))
+                    index += 1
+                walls.append(time.perf_counter() - start)
+                time.sleep(0.2)  # let prefetches that will never be asked finish
+                calls.append(mock.counts["total"])
+                kinds.update(mock.counts)
+                asked.append(index)
+                stats = stream.stats() if name == "adaptive" else {"generated": index, "unused": 0}
+                generated.append(stats["generated"])
+                unused.append(stats["unused"])
+            print(
+                f"{name:<9} questions {statistics.fmean(asked):5.1f}  API calls/session"
+                f" {statistics.fmean(calls):5.1f}  generated {statistics.fmean(generated):4.1f}"
+                f" (unused {statistics.fmean(unused):3.1f})"
+                f"  wall {statistics.median(walls):5.2f}s"
+            )
+            print("          " + ", ".join(
+                f"{kind} {n / args.live:.1f}" for kind, n in sorted(kinds.items()) if kind != "total"
+            ))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--noise", type=float, nargs="+", default=[0.3, 0.7, 1.2])
+    parser.add_argument("--tolerance", type=float, nargs="+", default=[0.6, 0.85, 1.1])
+    parser.add_argument("--per-axis", type=int, default=3, help="fixed questions per axis")
+    parser.add_argument("--min-per-axis", type=int, default=2)
+    parser.add_argument("--max-per-axis", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--live", type=int, default=0, help="sessions to run against the mock")
+    parser.add_argument("--median", type=float, default=0.1, help="mock median latency (s)")
+    parser.add_argument("--bank", action="store_true", help="serve --live questions from a bank")
+    args = parser.parse_args()
+    simulate(args)
+    if args.live:
+        live(args)
+
+
+if __name__ == "__main__":
+    main()
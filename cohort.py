@@ -0,0 +1,116 @@
+"""Vectorised cohort scoring: per-session axis means, percentiles and z-scores."""
+
+from __future__ import annotations
+
+import threading
+import warnings
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+
+def session_axis_sums(answers: pd.DataFrame, axes: List[str]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Return per-session score sums and answer counts for every axis.
+
+    ``answers`` has one row per answer with ``session_id``, ``axis`` and a
+    numeric ``score``.  Both frames are indexed by session id with one column
+    per axis.
+    """
+    grouped = answers.groupby(["session_id", "axis"], observed=True)["score"]
+    sums = grouped.sum().unstack("axis").reindex(columns=axes).fillna(0.0)
+    counts = grouped.count().unstack("axis").reindex(columns=axes).fillna(0).astype(np.int64)
+    return sums, counts
+
+
+def cohort_scores(means: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """Return percentile ranks (0-100) and z-scores of every session per axis.
+
+    Sessions with no answers for an axis (NaN mean) are excluded from that
+    axis' population.
+    """
+    values = means.to_numpy(dtype=float)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN axes
+        mu = np.nanmean(values, axis=0)
+        sigma = np.nanstd(values, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(sigma > 0, (values - mu) / sigma, 0.0)
+    z[np.isnan(values)] = np.nan
+    return {
+        "means": means,
+        "percentiles": means.rank(pct=True, method="average") * 100,
+        "z_scores": pd.DataFrame(z, index=means.index, columns=means.columns),
+    }
+
+
+def score_cohort(answers: pd.DataFrame, axes: List[str]) -> dict[str, pd.DataFrame]:
+    """Score every session in ``answers`` against the whole cohort at once."""
+    sums, counts = session_axis_sums(answers, axes)
+    return cohort_scores(sums / counts.where(counts > 0))
+
+
+class Cohort:
+    """Running cohort statistics updated incrementally as answers arrive.
+
+    Per-session sums and counts are accumulated, so each update only groups
+    the new answers; percentile ranks and z-scores are recomputed lazily in a
+    single vectorised pass when next requested.
+    """
+
+    def __init__(self, axes: List[str]) -> None:
+        self.axes = list(axes)
+        self.last_id = 0
+        self._sums = pd.DataFrame(columns=self.axes, dtype=float)
+        self._counts = pd.DataFrame(columns=self.axes, dtype=np.int64)
+        self._sessions = pd.DataFrame(columns=["user_id", "timestamp"])
+        self._scores: dict[str, pd.DataFrame] | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sums)
+
+    def update(self, answers: pd.DataFrame) -> None:
+        """Add answers with ``id`` greater than any seen before."""
+        if answers is None or answers.empty:
+            return
+        with self._lock:
+            answers = answers[answers["id"] > self.last_id]
+            if answers.empty:
+                return
+            sums, counts = session_axis_sums(answers, self.axes)
+            self._sums = self._sums.add(sums, fill_value=0.0)
+            self._counts = self._counts.add(counts, fill_value=0).astype(np.int64)
+            sessions = answers.drop_duplicates("session_id").set_index("session_id")
+            self._sessions = pd.concat(
+                [self._sessions, sessions[["user_id", "timestamp"]]]
+            )
+            self._sessions = self._sessions[~self._sessions.index.duplicated()]
+            self.last_id = int(answers["id"].max())
+            self._scores = None
+
+    def scores(self) -> dict[str, pd.DataFrame]:
+        """Return means, percentiles and z-scores for every session."""
+        with self._lock:
+            if self._scores is None:
+                means = self._sums / self._counts.where(self._counts > 0)
+                self._scores = cohort_scores(means.astype(float))
+            return self._scores
+
+    def session_id(self, user_id: str, timestamp: str):
+        """Return the session id for a user and start time, if known."""
+        match = self._sessions[
+            (self._sessions["user_id"] == user_id) & (self._sessions["timestamp"] == timestamp)
+        ]
+        return match.index[0] if len(match) else None
+
+    def position(self, session_id) -> pd.DataFrame:
+        """Return one session's score, percentile and z-score per axis."""
+        scores = self.scores()
+        return pd.DataFrame(
+            {
+                "score": scores["means"].loc[session_id],
+                "percentile": scores["percentiles"].loc[session_id],
+                "z_score": scores["z_scores"].loc[session_id],
+            }
+        )
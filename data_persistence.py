@@ -1,15 +1,40 @@
-"""Utilities for saving interaction data to CSV."""
+"""Utilities for saving interaction data.
+
+Data is written to CSV files under ``data/`` by default.  Setting the
+``DATA_BACKEND`` environment variable to ``sqlite`` stores the same records in
+an indexed SQLite database instead (see :mod:`sqlite_storage`); run
+``python sqlite_storage.py`` once to migrate existing CSV files.
+
+CSV writes take an advisory lock on a sidecar ``.lock`` file so several
+Streamlit processes can safely share one ``data/`` directory.
+"""
 
 from __future__ import annotations
 
 import csv
+import io
+import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import sqlite_storage
+
 DATA_DIR = Path(__file__).resolve().parent / "data"
 DATA_DIR.mkdir(exist_ok=True)
 CSV_PATH = DATA_DIR / "interactions.csv"
 USERS_PATH = DATA_DIR / "users.csv"
+REPORTS_PATH = DATA_DIR / "reports.csv"
+DB_PATH = DATA_DIR / "monster.sqlite3"
+
+BACKEND = os.getenv("DATA_BACKEND", "csv")
 
 
 COLUMNS = [
@@ -23,6 +48,10 @@ COLUMNS = [
 
 USER_COLUMNS = ["user_id", "user_name"]
 
+REPORT_COLUMNS = ["timestamp", "user_id", "report_type", "content", "created_at"]
+PATIENT_FEEDBACK = "patient"
+STAFF_REPORT = "staff"
+
 
 def save_interaction(
     user_id: str,
@@ -32,44 +61,217 @@ def save_interaction(
     evaluation_summary: str,
     start_timestamp: str | None = None,
 ) -> None:
-    """Append a single interaction row to the CSV file."""
+    """Append a single interaction row to the configured store."""
     ts = start_timestamp or datetime.now(timezone.utc).isoformat()
-    new_file = not CSV_PATH.exists()
-    with CSV_PATH.open("a", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=COLUMNS)
-        if new_file:
-            writer.writeheader()
-        writer.writerow(
+    row = {
+        "timestamp": ts,
+        "user_id": user_id,
+        "question_text": question_text,
+        "answer_text": answer_text,
+        "total_question_count": total_question_count,
+        "evaluation_summary": evaluation_summary,
+    }
+    if BACKEND == "sqlite":
+        sqlite_storage.save_interaction(DB_PATH, row)
+        return
+    _append_rows(CSV_PATH, COLUMNS, [row])
+
+
+def save_session(
+    user_id: str,
+    interactions: list[tuple[str, str]],
+    evaluation_summary: str,
+    start_timestamp: str | None = None,
+    axes: list[str] | None = None,
+    scores: dict[str, float] | None = None,
+) -> None:
+    """Store every ``(question_text, answer_text)`` pair of a session at once.
+
+    With the CSV backend all rows are rendered in memory and appended under
+    the file lock with a single write followed by ``fsync``, so neither a
+    crash nor a concurrent writer can leave half a session behind.  The
+    SQLite backend inserts the rows in one transaction.
+    """
+    save_sessions(
+        [
             {
-                "timestamp": ts,
                 "user_id": user_id,
+                "interactions": interactions,
+                "evaluation_summary": evaluation_summary,
+                "start_timestamp": start_timestamp,
+                "axes": axes,
+                "scores": scores,
+            }
+        ]
+    )
+
+
+def save_sessions(sessions: list[dict], sync: bool = True) -> None:
+    """Store several sessions, each given as the arguments of :func:`save_session`.
+
+    All rows go into one CSV append or one SQLite transaction.  With
+    ``sync=False`` the CSV write is not fsynced; see :func:`sync_files`.
+    """
+    if not sessions:
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    batch = []
+    for s in sessions:
+        interactions = s["interactions"]
+        rows = [
+            {
+                "timestamp": s.get("start_timestamp") or now,
+                "user_id": s["user_id"],
                 "question_text": question_text,
                 "answer_text": answer_text,
-                "total_question_count": total_question_count,
-                "evaluation_summary": evaluation_summary,
+                "total_question_count": len(interactions),
+                "evaluation_summary": s["evaluation_summary"],
             }
-        )
+            for question_text, answer_text in interactions
+        ]
+        batch.append((rows, s.get("axes"), s.get("scores")))
+    if BACKEND == "sqlite":
+        for rows, axes, _ in batch:
+            for row, axis in zip(rows, axes or []):
+                row["axis"] = axis
+        sqlite_storage.save_sessions(DB_PATH, [(rows, scores) for rows, _, scores in batch])
+        return
+    _append_rows(CSV_PATH, COLUMNS, [row for rows, _, _ in batch for row in rows], sync)
+
+
+def update_sessions(updates: list[dict]) -> None:
+    """Replace the evaluation summary of several stored sessions at once.
+
+    Each update names the session by ``user_id`` and ``timestamp`` and gives
+    the new ``evaluation_summary``; optional axis ``scores`` are kept by the
+    SQLite backend only.  With the CSV backend the file is rewritten to a
+    temporary file under the lock and swapped in atomically.
+    """
+    if not updates:
+        return
+    if BACKEND == "sqlite":
+        sqlite_storage.update_sessions(DB_PATH, updates)
+        return
+    summaries = {(u["user_id"], u["timestamp"]): u["evaluation_summary"] for u in updates}
+    with file_lock(CSV_PATH):
+        if not CSV_PATH.exists():
+            return
+        tmp_path = CSV_PATH.with_name(CSV_PATH.name + ".tmp")
+        with CSV_PATH.open(newline="", encoding="utf-8") as src, tmp_path.open(
+            "w", newline="", encoding="utf-8"
+        ) as dst:
+            writer = csv.DictWriter(dst, fieldnames=COLUMNS)
+            writer.writeheader()
+            for row in csv.DictReader(src):
+                summary = summaries.get((row["user_id"], row["timestamp"]))
+                if summary is not None:
+                    row["evaluation_summary"] = summary
+                writer.writerow(row)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, CSV_PATH)
+
+
+@contextmanager
+def file_lock(path: Path):
+    """Hold an exclusive advisory lock on ``path`` across processes.
+
+    The lock is taken on a sidecar ``.lock`` file so readers of ``path`` are
+    never blocked.
+    """
+    lock_path = path.with_name(path.name + ".lock")
+    with lock_path.open("a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _append_rows(path: Path, fieldnames: list[str], rows: list[dict], sync: bool = True) -> None:
+    """Append CSV rows under the file lock, writing the header for a new file."""
+    with file_lock(path):
+        _write_rows(path, fieldnames, rows, sync)
+
+
+def _write_rows(path: Path, fieldnames: list[str], rows: list[dict], sync: bool = True) -> None:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fieldnames)
+    if not path.exists() or path.stat().st_size == 0:
+        writer.writeheader()
+    writer.writerows(rows)
+    _append_bytes(path, buf.getvalue().encode("utf-8"), sync)
+
+
+def _append_bytes(path: Path, data: bytes, sync: bool = True) -> None:
+    """Append ``data`` with one O_APPEND write and, if ``sync``, flush it to disk."""
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        if sync:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def sync_files() -> None:
+    """Flush the CSV files to disk after writes made with ``sync=False``.
+
+    The SQLite backend needs no call: it runs in WAL mode with
+    ``synchronous=NORMAL`` and syncs at checkpoints.
+    """
+    if BACKEND == "sqlite":
+        return
+    for path in (CSV_PATH, USERS_PATH, REPORTS_PATH):
+        if path.exists():
+            fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
 
 
 def save_user(user_id: str, user_name: str) -> None:
     """Persist user ID and name mapping if not already stored."""
-    new_file = not USERS_PATH.exists()
-    users: dict[str, str] = {}
-    if USERS_PATH.exists():
-        with USERS_PATH.open(newline="", encoding="utf-8") as f:
-            for row in csv.DictReader(f):
-                users[row["user_id"]] = row["user_name"]
-    if user_id in users:
+    save_users([(user_id, user_name)])
+
+
+def save_users(users: list[tuple[str, str]], sync: bool = True) -> None:
+    """Persist several ``(user_id, user_name)`` pairs, skipping known IDs."""
+    if not users:
         return
-    with USERS_PATH.open("a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=USER_COLUMNS)
-        if new_file:
-            writer.writeheader()
-        writer.writerow({"user_id": user_id, "user_name": user_name})
+    if BACKEND == "sqlite":
+        sqlite_storage.save_users(DB_PATH, users)
+        return
+    with file_lock(USERS_PATH):
+        known: set[str] = set()
+        if USERS_PATH.exists():
+            with USERS_PATH.open(newline="", encoding="utf-8") as f:
+                known = {row["user_id"] for row in csv.DictReader(f)}
+        rows = []
+        for user_id, user_name in users:
+            if user_id not in known:
+                known.add(user_id)
+                rows.append({"user_id": user_id, "user_name": user_name})
+        if rows:
+            _write_rows(USERS_PATH, USER_COLUMNS, rows, sync)
 
 
 def get_user_name(user_id: str) -> str | None:
     """Return stored user name for ID if available."""
+    if BACKEND == "sqlite":
+        return sqlite_storage.get_user_name(DB_PATH, user_id)
     if not USERS_PATH.exists():
         return None
     with USERS_PATH.open(newline="", encoding="utf-8") as f:
@@ -81,6 +283,8 @@ def get_user_name(user_id: str) -> str | None:
 
 def get_question_history(user_id: str) -> list[str]:
     """Return list of past question texts for the given user."""
+    if BACKEND == "sqlite":
+        return sqlite_storage.get_question_history(DB_PATH, user_id)
     if not CSV_PATH.exists():
         return []
     history: list[str] = []
@@ -89,3 +293,201 @@ def get_question_history(user_id: str) -> list[str]:
             if row["user_id"] == user_id:
                 history.append(row["question_text"])
     return history
+
+
+def load_sessions() -> list[dict]:
+    """Return every stored session with its answers, oldest first.
+
+    Each session holds ``user_id``, ``timestamp``, ``evaluation_summary`` and
+    ``answers``, a list of ``question_text``/``answer_text``/``axis`` dicts.
+    Only the SQLite backend records the axis; it is ``None`` for CSV rows.
+    """
+    if BACKEND == "sqlite":
+        return sqlite_storage.load_sessions(DB_PATH) if DB_PATH.exists() else []
+    if not CSV_PATH.exists():
+        return []
+    sessions: dict[tuple[str, str], dict] = {}
+    with CSV_PATH.open(newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            key = (row["user_id"], row["timestamp"])
+            session = sessions.get(key)
+            if session is None:
+                session = sessions[key] = {
+                    "user_id": row["user_id"],
+                    "timestamp": row["timestamp"],
+                    "evaluation_summary": row["evaluation_summary"],
+                    "answers": [],
+                }
+            session["answers"].append(
+                {"question_text": row["question_text"], "answer_text": row["answer_text"], "axis": None}
+            )
+    return list(sessions.values())
+
+
+def save_report(user_id: str, start_timestamp: str, report_type: str, content: str) -> None:
+    """Store a generated report for the session identified by user and start time.
+
+    Reports are appended, so saving again for the same session supersedes the
+    previous version.
+    """
+    row = {
+        "timestamp": start_timestamp,
+        "user_id": user_id,
+        "report_type": report_type,
+        "content": content,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if BACKEND == "sqlite":
+        sqlite_storage.save_report(DB_PATH, row)
+        return
+    _append_rows(REPORTS_PATH, REPORT_COLUMNS, [row])
+
+
+def save_reports(reports: list[dict], sync: bool = True) -> None:
+    """Store several reports, each with ``user_id``, ``timestamp``,
+    ``report_type``, ``content`` and optionally ``created_at``, in one write."""
+    if not reports:
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    rows = [
+        {
+            "timestamp": r["timestamp"],
+            "user_id": r["user_id"],
+            "report_type": r["report_type"],
+            "content": r["content"],
+            "created_at": r.get("created_at") or now,
+        }
+        for r in reports
+    ]
+    if BACKEND == "sqlite":
+        sqlite_storage.save_reports(DB_PATH, rows)
+        return
+    _append_rows(REPORTS_PATH, REPORT_COLUMNS, rows, sync)
+
+
+def get_report(user_id: str, start_timestamp: str, report_type: str) -> str | None:
+    """Return the latest stored report for the session, if any."""
+    if BACKEND == "sqlite":
+        return sqlite_storage.get_report(DB_PATH, user_id, start_timestamp, report_type)
+    if not REPORTS_PATH.exists():
+        return None
+    content = None
+    with REPORTS_PATH.open(newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if (
+                row["user_id"] == user_id
+                and row["timestamp"] == start_timestamp
+                and row["report_type"] == report_type
+            ):
+                content = row["content"]
+    return content
+
+
+# Dashboard-friendly dtypes: repeated strings become categoricals.
+CATEGORY_COLUMNS = ["timestamp", "user_id", "question_text", "answer_text", "evaluation_summary"]
+
+_interactions_cache: dict = {}
+_interactions_lock = threading.Lock()
+
+
+def _typed(df):
+    df = df.astype({c: "string" for c in CATEGORY_COLUMNS}).astype(
+        {c: "category" for c in CATEGORY_COLUMNS}
+    )
+    return df.astype({"total_question_count": "int16"})
+
+
+def _concat_typed(old, new):
+    """Concatenate frames, merging categorical categories without upcasting."""
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+
+    if old is None or old.empty:
+        return new.reset_index(drop=True)
+    if new.empty:
+        return old
+    data = {}
+    for col in old.columns:
+        if isinstance(old[col].dtype, pd.CategoricalDtype):
+            data[col] = union_categoricals([old[col], new[col]], ignore_order=True)
+        else:
+            data[col] = pd.concat([old[col], new[col]], ignore_index=True)
+    return pd.DataFrame(data)
+
+
+def _load_csv_incremental():
+    import pandas as pd
+
+    stat = CSV_PATH.stat()
+    cache = _interactions_cache
+    same_file = (
+        cache.get("key") == ("csv", str(CSV_PATH), stat.st_ino)
+        and stat.st_size >= cache.get("size", 0)
+    )
+    if same_file and stat.st_size == cache["size"]:
+        if stat.st_mtime_ns == cache["mtime"]:
+            return cache["frame"]
+        same_file = False  # rewritten in place
+    if not same_file:
+        cache.clear()
+        cache.update(key=("csv", str(CSV_PATH), stat.st_ino), size=0, frame=None)
+    with CSV_PATH.open("rb") as f:
+        f.seek(cache["size"])
+        chunk = f.read(stat.st_size - cache["size"])
+    # Leave a partially written trailing row for the next call.
+    chunk = chunk[: chunk.rfind(b"\n") + 1]
+    if cache["size"] == 0:
+        new = pd.read_csv(io.BytesIO(chunk), dtype=str, keep_default_na=False)
+    else:
+        new = pd.read_csv(
+            io.BytesIO(chunk), header=None, names=COLUMNS, dtype=str, keep_default_na=False
+        )
+    cache["frame"] = _concat_typed(cache["frame"], _typed(new[COLUMNS]))
+    cache["size"] = cache["size"] + len(chunk)
+    cache["mtime"] = stat.st_mtime_ns
+    return cache["frame"]
+
+
+def _load_sqlite_incremental():
+    cache = _interactions_cache
+    revision = sqlite_storage.sessions_revision(DB_PATH)
+    if cache.get("key") != ("sqlite", str(DB_PATH)) or cache.get("revision") != revision:
+        # Rewritten summaries (see update_sessions) are not picked up by id.
+        cache.clear()
+        cache.update(key=("sqlite", str(DB_PATH)), revision=revision, last_id=0, frame=None)
+    new = sqlite_storage.load_interactions(DB_PATH, after_id=cache["last_id"])
+    if new.empty and cache["frame"] is not None:
+        return cache["frame"]
+    if not new.empty:
+        cache["last_id"] = int(new["id"].max())
+    cache["frame"] = _concat_typed(cache["frame"], _typed(new[COLUMNS]))
+    return cache["frame"]
+
+
+def load_interactions():
+    """Return all stored interactions as a DataFrame with ``COLUMNS``.
+
+    The parsed frame is cached in memory and only rows appended since the
+    previous call are parsed (new bytes of the CSV file, or rows with a
+    higher id in SQLite).  After :func:`update_sessions` everything is
+    reloaded.  String columns are categoricals to keep memory
+    low; treat the returned frame as read-only.  Returns ``None`` when
+    nothing has been stored yet.
+    """
+    with _interactions_lock:
+        if BACKEND == "sqlite":
+            return _load_sqlite_incremental() if DB_PATH.exists() else None
+        if not CSV_PATH.exists():
+            return None
+        return _load_csv_incremental()
+
+
+def load_answers(after_id: int = 0):
+    """Return per-answer scores with their axis for cohort statistics.
+
+    Only the SQLite backend records which axis each question belongs to, so
+    ``None`` is returned for the CSV backend or an empty store.
+    """
+    if BACKEND != "sqlite" or not DB_PATH.exists():
+        return None
+    return sqlite_storage.load_answers(DB_PATH, after_id)
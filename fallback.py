@@ -0,0 +1,84 @@
+"""Curated questions and template texts used when the OpenAI API is unavailable.
+
+Patients must always be able to finish the questionnaire, so when live
+generation fails, misses its deadline or the circuit breaker is open these
+fixed items and templates are used instead of showing an error.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional
+
+QUESTIONS: Dict[str, List[str]] = {
+    "特権意識と期待": [
+        "予約の時間どおりに診察が始まることは、あなたにとってとても大切ですか？",
+        "治療について、自分の希望をできるだけ取り入れてほしいと思いますか？",
+        "受付や会計の手続きは、できるだけ手早く済ませてほしいと感じますか？",
+        "担当のスタッフには、いつでもすぐに対応してもらえると安心ですか？",
+        "病院のサービスには、細かな要望にも応えてほしいと思いますか？",
+    ],
+    "情動の不安定性": [
+        "体調や治療のことで、気分が大きく変わることがありますか？",
+        "ちょっとした出来事で、その日の気持ちが左右されることがありますか？",
+        "不安を感じたとき、それがしばらく続くことがありますか？",
+        "ストレスがたまると、自分でも落ち着かなくなることがありますか？",
+        "気持ちが高ぶったあと、急に落ち込むことがありますか？",
+    ],
+    "不信感と猜疑心": [
+        "治療の説明を聞いたあと、ほかの意見も確かめたくなりますか？",
+        "検査結果は、数値や根拠まで詳しく見せてほしいと思いますか？",
+        "説明の内容に、隠されていることがあるのではと感じることがありますか？",
+        "以前の病院と比べて、ここでの対応が気になることがありますか？",
+        "説明に納得できるまで、何度でも質問したいと思いますか？",
+    ],
+    "依存性と操作性": [
+        "治療について迷ったとき、誰かに決めてもらえると安心しますか？",
+        "困ったときに、すぐ相談できる相手がいてほしいと思いますか？",
+        "スタッフから声をかけてもらえると、気持ちが落ち着きますか？",
+        "一人で過ごす時間が長いと、心細くなることがありますか？",
+        "支えてくれる人には、できるだけそばにいてほしいと思いますか？",
+    ],
+    "統制欲求と完璧主義": [
+        "治療のスケジュールは、事前にすべて把握しておきたいですか？",
+        "予定が急に変わると、落ち着かない気持ちになりますか？",
+        "毎日の生活リズムは、決まった通りに守りたいと思いますか？",
+        "物事は細かいところまで、きちんと進めたいと感じますか？",
+        "自分で立てた計画どおりに進まないと、気になりますか？",
+    ],
+}
+
+PATIENT_FEEDBACK = (
+    "{name}、アンケートへのご協力ありがとうございました。\n\n"
+    "いただいた回答は、これからの診療や治療計画を一緒に考えていくための大切な手がかりになります。"
+    "日々の過ごし方や、治療で大切にしたいことについて率直にお答えいただいたことで、"
+    "{name}のご希望やお気持ちに沿った進め方を検討しやすくなりました。\n\n"
+    "診察の際には、気になっていることや不安に感じていること、ご希望があれば、どんな小さなことでも"
+    "お気軽にスタッフにお伝えください。ご自身のペースを大切にしながら、安心して治療に取り組めるよう、"
+    "私たちも丁寧にお手伝いしていきます。\n\n"
+    "詳しいフィードバックはただいま準備できないため、担当スタッフから改めてご説明いたします。"
+)
+
+EVALUATION_SUMMARY = "自動要約を生成できなかったため、各軸の平均スコアのみを記録しました: {scores}"
+
+
+def question(axis: str, exclude: Iterable[str] = ()) -> dict:
+    """Return a curated question for ``axis`` not contained in ``exclude``.
+
+    When every curated item for the axis is already used, the first one is
+    returned again rather than failing.
+    """
+    used = set(exclude)
+    items = QUESTIONS.get(axis) or [q for qs in QUESTIONS.values() for q in qs]
+    text = next((q for q in items if q not in used), items[0])
+    return {"question_text": text, "axis": axis}
+
+
+def patient_feedback(user_name: Optional[str] = None) -> str:
+    """Return the template patient feedback."""
+    return PATIENT_FEEDBACK.format(name=f"{user_name}さん" if user_name else "患者様")
+
+
+def evaluation_summary(scores: dict) -> str:
+    """Return a template summary listing the average score per axis."""
+    parts = "、".join(f"{axis} {float(score):.1f}" for axis, score in scores.items())
+    return EVALUATION_SUMMARY.format(scores=parts)
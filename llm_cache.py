@@ -0,0 +1,117 @@
+"""Persistent content-addressed cache for chat completion responses."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Dict, List
+
+import data_persistence
+
+CACHE_PATH = data_persistence.DATA_DIR / "llm_cache.sqlite3"
+ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+TTL_SECONDS = 30 * 24 * 3600
+MAX_BYTES = 50 * 1024 * 1024
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+
+def make_key(model: str, messages: List[dict], temperature: float) -> str:
+    """Return the cache key for a request."""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(CACHE_PATH, timeout=10)
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+
+
+def get(key: str) -> str | None:
+    """Return the cached response for ``key`` or ``None`` if absent/expired."""
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        row = conn.execute(
+            "SELECT value, created FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or now - row[1] > TTL_SECONDS:
+            _count("misses")
+            return None
+        conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+    _count("hits")
+    return row[0]
+
+
+def put(key: str, value: str) -> None:
+    """Store a response and evict expired or least recently used entries."""
+    now = time.time()
+    size = len(value.encode("utf-8"))
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+            (key, value, size, now, now),
+        )
+        evicted = conn.execute(
+            "DELETE FROM responses WHERE created < ?", (now - TTL_SECONDS,)
+        ).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > MAX_BYTES:
+            for old_key, old_size in conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed"
+            ).fetchall():
+                if total <= MAX_BYTES:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                total -= old_size
+                evicted += 1
+    if evicted:
+        _count("evictions", evicted)
+
+
+def stats() -> Dict[str, int]:
+    """Return hit/miss/eviction counters for this process and the entry count."""
+    with _stats_lock:
+        result = dict(_stats)
+    if CACHE_PATH.exists():
+        with closing(_connect()) as conn:
+            result["entries"] = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    else:
+        result["entries"] = 0
+    return result
+
+
+def clear() -> None:
+    """Remove every cached response and reset the counters."""
+    if CACHE_PATH.exists():
+        with closing(_connect()) as conn, conn:
+            conn.execute("DELETE FROM responses")
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
@@ -0,0 +1,531 @@
+"""Process-wide OpenAI client with a concurrency cap, timeouts and retries.
+
+Clients are created once and reused so HTTP keep-alive connections and TLS
+sessions survive between calls.  A single semaphore shared by every thread
+(and therefore every Streamlit session) limits in-flight requests, and rate
+limit or transient errors are retried with jittered exponential backoff.
+
+Every call is bounded by an overall deadline.  Asynchronous calls that take
+longer than the recent p95 latency of the same caller are hedged with a
+duplicate request (traced like any other attempt), and a
+circuit breaker fails calls fast while the endpoint is erroring or slow so
+callers can fall back to local content.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, TypeVar
+
+import openai
+
+import tracing
+
+MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+TIMEOUT = 30.0
+# Overall budget per call including retries and backoff.
+DEADLINE = float(os.getenv("OPENAI_DEADLINE", "20"))
+
+# Hedge a request once it has been outstanding longer than this percentile
+# of recent successful latencies of the same caller (at least HEDGE_MIN_DELAY
+# seconds); a yes/no similarity check and a staff report differ tenfold.
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.2
+
+T = TypeVar("T")
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+_slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+_latency_lock = threading.Lock()
+_latencies: Dict[str | None, deque] = {}  # caller -> recent latencies
+_hedges = 0
+_client_lock = threading.Lock()
+_client: openai.OpenAI | None = None
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, openai.AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+class DeadlineExceeded(openai.OpenAIError):
+    """The call did not complete within its overall deadline."""
+
+
+class CircuitOpenError(openai.OpenAIError):
+    """The circuit breaker is open and the call was not attempted."""
+
+
+class CircuitBreaker:
+    """Trip when too many recent calls failed or were slow.
+
+    Outcomes of the last ``window`` calls are kept; once at least
+    ``min_calls`` are recorded and the share of failures (errors, deadline
+    misses and calls slower than ``slow_call`` seconds) reaches
+    ``failure_ratio`` the breaker opens.  After ``cooldown`` seconds a single
+    probe call is let through; its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_calls: int = 10,
+        failure_ratio: float = 0.5,
+        slow_call: float = 10.0,
+        cooldown: float = 30.0,
+    ) -> None:
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+        self._outcomes: deque = deque(maxlen=window)
+        self._opened_at: float | None = None
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Return ``"closed"``, ``"open"`` or ``"half_open"``."""
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Return True if a call may be attempted now."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            # A probe whose outcome was never recorded (e.g. it was cancelled)
+            # is replaced after another cooldown.
+            now = time.monotonic()
+            if state == "half_open" and (
+                not self._probing or now - self._probe_started >= self.cooldown
+            ):
+                self._probing = True
+                self._probe_started = now
+                return True
+            return False
+
+    def record(self, ok: bool, latency: float = 0.0) -> None:
+        """Record the outcome of an attempted call."""
+        ok = ok and latency <= self.slow_call
+        with self._lock:
+            if self._opened_at is not None:
+                if not self._probing:
+                    return  # late result of a call started before tripping
+                self._probing = False
+                if ok:
+                    self._opened_at = None
+                    self._outcomes.clear()
+                else:
+                    self._opened_at = time.monotonic()
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if (
+                len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.failure_ratio
+            ):
+                self._opened_at = time.monotonic()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._outcomes.clear()
+            self._opened_at = None
+            self._probing = False
+
+
+breaker = CircuitBreaker()
+
+
+def available() -> bool:
+    """Return False while the circuit breaker is open."""
+    return breaker.state != "open"
+
+
+def _api_key() -> str:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not set")
+    return api_key
+
+
+def get_client() -> openai.OpenAI:
+    """Return the shared synchronous client."""
+    global _client
+    api_key = _api_key()
+    with _client_lock:
+        if _client is None or _client.api_key != api_key:
+            _client = openai.OpenAI(api_key=api_key, timeout=TIMEOUT, max_retries=0)
+        return _client
+
+
+def get_async_client() -> openai.AsyncOpenAI:
+    """Return the shared asynchronous client for the running event loop.
+
+    Async connection pools are bound to the loop that created them, so one
+    client is kept per live loop.
+    """
+    api_key = _api_key()
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        client = _async_clients.get(loop)
+        if client is None or client.api_key != api_key:
+            client = openai.AsyncOpenAI(api_key=api_key, timeout=TIMEOUT, max_retries=0)
+            _async_clients[loop] = client
+        return client
+
+
+def reset() -> None:
+    """Drop cached clients and latency/breaker state, e.g. after changing the
+    API key or base URL."""
+    global _client, _hedges
+    with _client_lock:
+        _client = None
+        _async_clients.clear()
+    with _latency_lock:
+        _latencies.clear()
+        _hedges = 0
+    breaker.reset()
+
+
+def _record_latency(latency: float, caller: str | None = None) -> None:
+    with _latency_lock:
+        _latencies.setdefault(caller, deque(maxlen=200)).append(latency)
+
+
+def hedge_delay(caller: str | None = None) -> float | None:
+    """Return how long to wait before hedging a call from ``caller``, or None
+    without enough samples of that caller."""
+    with _latency_lock:
+        samples = _latencies.get(caller, ())
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+    index = min(len(ordered) - 1, len(ordered) * HEDGE_PERCENTILE // 100)
+    return max(HEDGE_MIN_DELAY, ordered[index])
+
+
+def hedge_count() -> int:
+    """Return the number of hedged requests sent by this process."""
+    with _latency_lock:
+        return _hedges
+
+
+def _start_call(caller: str | None) -> float:
+    """Check the breaker and return the current monotonic time."""
+    if not breaker.allow():
+        error = CircuitOpenError("OpenAI circuit breaker is open")
+        tracing.record_completion(caller, 0, 0.0, error=error)
+        raise error
+    return time.monotonic()
+
+
+def _remaining(end: float) -> float:
+    remaining = end - time.monotonic()
+    if remaining <= 0:
+        breaker.record(False)
+        raise DeadlineExceeded("OpenAI call exceeded its deadline")
+    return remaining
+
+
+def _backoff(attempt: int, error: Exception) -> float:
+    """Return the delay before retry ``attempt`` honouring ``Retry-After``."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after is not None:
+            return min(float(retry_after), BACKOFF_MAX)
+    except ValueError:
+        pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+
+def chat_completion(
+    model: str,
+    messages: List[dict],
+    temperature: float,
+    timeout: float | None = None,
+    deadline: float | None = None,
+    caller: str | None = None,
+):
+    """Create a chat completion, retrying transient failures.
+
+    The last error is re-raised once ``MAX_RETRIES`` retries are exhausted;
+    :class:`DeadlineExceeded` is raised once ``deadline`` seconds (default
+    ``DEADLINE``) have passed and :class:`CircuitOpenError` while the breaker
+    is open.  Each attempt is traced under ``caller`` (see :mod:`tracing`).
+    """
+    client = get_client()
+    end = _start_call(caller) + (deadline or DEADLINE)
+    for attempt in range(MAX_RETRIES + 1):
+        remaining = _remaining(end)
+        with _slots:
+            start = time.monotonic()
+            try:
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    timeout=min(timeout or TIMEOUT, remaining),
+                )
+            except openai.OpenAIError as e:
+                tracing.record_completion(caller, attempt, time.monotonic() - start, error=e)
+                if not isinstance(e, RETRYABLE_ERRORS):
+                    raise
+                breaker.record(False)
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = _backoff(attempt, e)
+            else:
+                latency = time.monotonic() - start
+                tracing.record_completion(caller, attempt, latency, response)
+                _record_latency(latency, caller)
+                breaker.record(True, latency)
+                return response
+        time.sleep(min(delay, _remaining(end)))
+
+
+async def _acquire_slot() -> None:
+    delay = 0.005
+    while not _slots.acquire(blocking=False):
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.1)
+
+
+async def _in_slot(call: Callable[[], Awaitable[T]], timing: Dict[str, float]) -> T:
+    """Await ``call`` holding a concurrency slot.
+
+    The request is timed from the moment the slot is acquired, so waiting
+    for a slot never counts as endpoint latency: ``timing["start"]`` is set
+    once the request is sent and ``timing["latency"]`` once it finishes.
+    """
+    await _acquire_slot()
+    try:
+        timing["start"] = time.monotonic()
+        try:
+            return await call()
+        finally:
+            timing["latency"] = time.monotonic() - timing["start"]
+    finally:
+        _slots.release()
+
+
+def _trace_loser(
+    task: asyncio.Future, timing: Dict[str, float], winner, caller: str | None, attempt: int
+) -> None:
+    """Trace the request of a hedged pair whose response was not used.
+
+    A request cancelled in flight has no usage; its prompt matches the
+    winner's, so the winner's prompt token count is recorded for it.  One
+    cancelled while still waiting for a slot was never sent and is not traced.
+    """
+    if "start" not in timing:
+        return
+    latency = timing.get("latency", time.monotonic() - timing["start"])
+    if not task.done():
+        usage = getattr(winner, "usage", None)
+        tracing.record(
+            "llm_call",
+            caller=caller,
+            attempt=attempt,
+            latency=round(latency, 4),
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=None,
+            cache_hit=False,
+            error=None,
+            hedge=True,
+            cancelled=True,
+        )
+    elif task.exception() is not None:
+        tracing.record_completion(caller, attempt, latency, error=task.exception(), hedge=True)
+    else:
+        tracing.record_completion(caller, attempt, latency, task.result(), hedge=True)
+
+
+async def _hedged(
+    call: Callable[[], Awaitable[T]],
+    caller: str | None = None,
+    attempt: int = 0,
+    timing: Dict[str, float] | None = None,
+) -> T:
+    """Await ``call``, racing a duplicate once it exceeds :func:`hedge_delay`.
+
+    The first successful response wins and the other request is cancelled
+    and traced; if both fail the last error is raised.  ``timing`` receives
+    the request timing (see :func:`_in_slot`) of the request that decided
+    the outcome, or of the primary while none has.
+    """
+    global _hedges
+    timing = {} if timing is None else timing
+    primary = asyncio.ensure_future(_in_slot(call, timing))
+    delay = hedge_delay(caller)
+    if delay is None:
+        return await primary
+    timings = {primary: timing}
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            with _latency_lock:
+                _hedges += 1
+            hedge_timing: Dict[str, float] = {}
+            hedge = asyncio.ensure_future(_in_slot(call, hedge_timing))
+            timings[hedge] = hedge_timing
+            pending.add(hedge)
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                timing.update(timings[task])
+                if task.exception() is None:
+                    winner = task.result()
+                    for other, other_timing in timings.items():
+                        if other is not task:
+                            _trace_loser(other, other_timing, winner, caller, attempt)
+                    return winner
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def achat_completion(
+    model: str,
+    messages: List[dict],
+    temperature: float,
+    timeout: float | None = None,
+    deadline: float | None = None,
+    caller: str | None = None,
+):
+    """Asynchronous variant of :func:`chat_completion` with hedging."""
+    client = get_async_client()
+    end = _start_call(caller) + (deadline or DEADLINE)
+    for attempt in range(MAX_RETRIES + 1):
+        remaining = _remaining(end)
+
+        def create():
+            return client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                timeout=min(timeout or TIMEOUT, remaining),
+            )
+
+        timing: Dict[str, float] = {}
+        try:
+            response = await asyncio.wait_for(
+                _hedged(create, caller, attempt, timing), remaining
+            )
+        except asyncio.TimeoutError:
+            # Only a request that was sent says anything about the endpoint;
+            # a deadline spent waiting for a local slot does not.
+            sent = "start" in timing
+            if sent:
+                breaker.record(False)
+            error = DeadlineExceeded("OpenAI call exceeded its deadline")
+            latency = time.monotonic() - timing["start"] if sent else 0.0
+            tracing.record_completion(caller, attempt, latency, error=error)
+            raise error from None
+        except openai.OpenAIError as e:
+            tracing.record_completion(caller, attempt, timing["latency"], error=e)
+            if not isinstance(e, RETRYABLE_ERRORS):
+                raise
+            breaker.record(False)
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _backoff(attempt, e)
+        else:
+            latency = timing["latency"]
+            tracing.record_completion(caller, attempt, latency, response)
+            _record_latency(latency, caller)
+            breaker.record(True, latency)
+            return response
+        await asyncio.sleep(min(delay, _remaining(end)))
+
+
+async def astream_chat_completion(
+    model: str,
+    messages: List[dict],
+    temperature: float,
+    timeout: float | None = None,
+    deadline: float | None = None,
+    caller: str | None = None,
+) -> AsyncIterator[str]:
+    """Yield content deltas of a streamed chat completion.
+
+    Opening the stream is retried like :func:`achat_completion` (without
+    hedging) within the same deadline; once the first chunk has arrived
+    errors propagate to the caller.  The concurrency slot is held until the
+    stream is exhausted or closed.
+    """
+    client = get_async_client()
+    end = _start_call(caller) + (deadline or DEADLINE)
+    for attempt in range(MAX_RETRIES + 1):
+        remaining = _remaining(end)
+        await _acquire_slot()
+        try:
+            start = time.monotonic()
+            try:
+                stream = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    timeout=min(timeout or TIMEOUT, remaining),
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+            except openai.OpenAIError as e:
+                tracing.record_completion(caller, attempt, time.monotonic() - start, error=e)
+                if not isinstance(e, RETRYABLE_ERRORS):
+                    raise
+                breaker.record(False)
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = _backoff(attempt, e)
+            else:
+                # Time to first byte; not comparable with full completions,
+                # so it is not used for hedging.
+                first_byte = time.monotonic() - start
+                breaker.record(True, first_byte)
+                last = error = None
+                try:
+                    async for chunk in stream:
+                        last = chunk
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
+                except openai.OpenAIError as e:
+                    error = e
+                    raise
+                finally:
+                    tracing.record_completion(
+                        caller, attempt, time.monotonic() - start, last, error,
+                        stream=True, first_byte=round(first_byte, 4),
+                    )
+                return
+        finally:
+            _slots.release()
+        await asyncio.sleep(min(delay, _remaining(end)))
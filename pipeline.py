@@ -0,0 +1,132 @@
+"""Concurrent end-of-questionnaire pipeline.
+
+Once the last answer is in, the evaluation summary is generated first; the
+patient feedback and the staff report then run concurrently, so the total
+latency is that of the slowest branch rather than the sum of all steps.  The
+session and both reports are handed to :mod:`write_queue`, so no step waits
+for the disk.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Dict, List, TypeVar
+
+import data_persistence
+import prompts
+import questionnaire
+import write_queue
+
+logger = logging.getLogger(__name__)
+
+PATIENT_FEEDBACK = data_persistence.PATIENT_FEEDBACK
+STAFF_REPORT = data_persistence.STAFF_REPORT
+
+T = TypeVar("T")
+
+
+@dataclass
+class PipelineResult:
+    """Outputs and per-stage wall-clock timings (seconds) of one run."""
+
+    scores: Dict[str, float] = field(default_factory=dict)
+    summary: str = ""
+    patient_feedback: str = ""
+    staff_report: str = ""
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+async def _timed(result: PipelineResult, stage: str, aw: Awaitable[T]) -> T:
+    start = time.perf_counter()
+    try:
+        return await aw
+    finally:
+        result.timings[stage] = time.perf_counter() - start
+
+
+async def stream_post_questionnaire(
+    questions: List[dict],
+    answers: List[dict],
+    user_id: str,
+    user_name: str,
+    start_timestamp: str,
+    result: PipelineResult,
+    persist: bool = True,
+) -> AsyncIterator[str]:
+    """Run the pipeline, yielding patient feedback chunks as they arrive.
+
+    ``result`` is filled in as stages complete; it is final once the
+    generator is exhausted, which happens only after every branch has
+    finished.  Its records are then queued for writing, not yet written.
+    With ``persist=False`` nothing is stored, for reruns of a session whose
+    first run already queued its records.
+    """
+    start = time.perf_counter()
+    result.scores = questionnaire.score_answers(answers)
+    result.summary = await _timed(
+        result, "summary", prompts.evaluation_summary_async(result.scores)
+    )
+
+    if persist:
+        write_queue.save_session(
+            user_id,
+            [(q["question_text"], str(a["score"])) for q, a in zip(questions, answers)],
+            result.summary,
+            start_timestamp,
+            [q["axis"] for q in questions],
+            result.scores,
+        )
+
+    async def staff_report() -> None:
+        result.staff_report = await prompts.feedback_for_staff_async(result.summary)
+        if persist and not result.staff_report.startswith("APIError"):
+            write_queue.save_report(user_id, start_timestamp, STAFF_REPORT, result.staff_report)
+
+    branches = [asyncio.create_task(_timed(result, "staff_report", staff_report()))]
+    patient_start = time.perf_counter()
+    parts: List[str] = []
+    try:
+        try:
+            async for chunk in prompts.feedback_for_patient_stream(result.summary, user_name):
+                if not parts:
+                    result.timings["patient_first_chunk"] = time.perf_counter() - patient_start
+                parts.append(chunk)
+                yield chunk
+        except prompts.StreamError as e:
+            # The patient keeps the partial text; it is not stored as feedback.
+            logger.warning("patient feedback stream interrupted: %s", e)
+        else:
+            if persist:
+                write_queue.save_report(
+                    user_id, start_timestamp, PATIENT_FEEDBACK, "".join(parts)
+                )
+        result.timings["patient_feedback"] = time.perf_counter() - patient_start
+        result.patient_feedback = "".join(parts)
+        await asyncio.gather(*branches)
+    finally:
+        for task in branches:
+            task.cancel()
+    result.timings["total"] = time.perf_counter() - start
+    logger.info(
+        "post-questionnaire pipeline: %s",
+        ", ".join(f"{k}={v:.2f}s" for k, v in result.timings.items()),
+    )
+
+
+async def run_post_questionnaire(
+    questions: List[dict],
+    answers: List[dict],
+    user_id: str,
+    user_name: str,
+    start_timestamp: str,
+) -> PipelineResult:
+    """Run the whole pipeline without streaming and return its result."""
+    result = PipelineResult()
+    async for _ in stream_post_questionnaire(
+        questions, answers, user_id, user_name, start_timestamp, result
+    ):
+        pass
+    return result
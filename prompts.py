@@ -1,12 +1,16 @@
 """Prompt templates for the AI-driven patient profiling system."""
 from __future__ import annotations
 
-import os
 import random
 import asyncio
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 import openai
 
+import fallback
+import llm_cache
+import llm_client
+import tracing
+
 MODEL = "gpt-4.1-mini"
 
 # Predefined categories for each axis to diversify questions
@@ -19,34 +23,121 @@ AXIS_CATEGORIES = {
 }
 
 
-def _call_openai(messages: List[dict], temperature: float) -> str:
-    """Helper to call OpenAI chat completion."""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not set")
-    client = openai.OpenAI(api_key=api_key)
+class StreamError(RuntimeError):
+    """A streamed completion failed; ``partial`` is the text already yielded."""
+
+    def __init__(self, message: str, partial: str) -> None:
+        super().__init__(message)
+        self.partial = partial
+
+
+def is_error(reply: str) -> bool:
+    """Return True if ``reply`` is the error marker rather than model output."""
+    return reply.startswith("APIError")
+
+
+def _call_openai(
+    messages: List[dict],
+    temperature: float,
+    cache: bool = True,
+    default: str | None = None,
+    caller: str | None = None,
+) -> str:
+    """Helper to call OpenAI chat completion.
+
+    Successful responses are served from and stored in :mod:`llm_cache`
+    unless ``cache`` is false, which creative calls such as question
+    generation use to get a fresh reply every time.  On API errors,
+    deadline misses or an open circuit breaker ``default`` is returned when
+    given, otherwise an ``"APIError: ..."`` string.
+    """
+    key = llm_cache.make_key(MODEL, messages, temperature)
+    if cache and llm_cache.ENABLED:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            tracing.record("llm_call", caller=caller, latency=0.0, cache_hit=True)
+            return cached
     try:
-        response = client.chat.completions.create(
-            model=MODEL, messages=messages, temperature=temperature
-        )
-        return response.choices[0].message.content.strip()
+        response = llm_client.chat_completion(MODEL, messages, temperature, caller=caller)
+        content = response.choices[0].message.content.strip()
     except openai.OpenAIError as e:
-        return f"APIError: {e}"
+        return default if default is not None else f"APIError: {e}"
+    if cache and llm_cache.ENABLED:
+        llm_cache.put(key, content)
+    return content
 
 
-async def _acall_openai(messages: List[dict], temperature: float) -> str:
-    """Asynchronous helper to call OpenAI chat completion."""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not set")
-    client = openai.AsyncOpenAI(api_key=api_key)
+async def _acall_openai(
+    messages: List[dict],
+    temperature: float,
+    cache: bool = True,
+    default: str | None = None,
+    caller: str | None = None,
+) -> str:
+    """Asynchronous helper to call OpenAI chat completion.
+
+    Cache lookups and stores hit SQLite, so they run in a worker thread to
+    keep the shared event loop free.
+    """
+    key = llm_cache.make_key(MODEL, messages, temperature)
+    if cache and llm_cache.ENABLED:
+        cached = await asyncio.to_thread(llm_cache.get, key)
+        if cached is not None:
+            tracing.record("llm_call", caller=caller, latency=0.0, cache_hit=True)
+            return cached
     try:
-        response = await client.chat.completions.create(
-            model=MODEL, messages=messages, temperature=temperature
+        response = await llm_client.achat_completion(
+            MODEL, messages, temperature, caller=caller
         )
-        return response.choices[0].message.content.strip()
+        content = response.choices[0].message.content.strip()
+    except openai.OpenAIError as e:
+        return default if default is not None else f"APIError: {e}"
+    if cache and llm_cache.ENABLED:
+        await asyncio.to_thread(llm_cache.put, key, content)
+    return content
+
+
+async def _astream_openai(
+    messages: List[dict],
+    temperature: float,
+    cache: bool = True,
+    default: str | None = None,
+    caller: str | None = None,
+) -> AsyncIterator[str]:
+    """Stream a chat completion, yielding text chunks as they arrive.
+
+    A cached response is yielded in one piece.  Once the stream completes the
+    full text is stored in the cache, so later non-streaming calls with the
+    same prompt are served from it.  If the call fails before any text was
+    yielded, ``default`` is yielded when given.  Otherwise the failure raises
+    :class:`StreamError`, so callers never mistake a broken stream for a
+    complete reply.
+    """
+    key = llm_cache.make_key(MODEL, messages, temperature)
+    if cache and llm_cache.ENABLED:
+        cached = await asyncio.to_thread(llm_cache.get, key)
+        if cached is not None:
+            tracing.record("llm_call", caller=caller, latency=0.0, cache_hit=True)
+            yield cached
+            return
+    parts: List[str] = []
+    try:
+        async for delta in llm_client.astream_chat_completion(
+            MODEL, messages, temperature, caller=caller
+        ):
+            if not parts:
+                delta = delta.lstrip()
+                if not delta:
+                    continue
+            parts.append(delta)
+            yield delta
     except openai.OpenAIError as e:
-        return f"APIError: {e}"
+        if default is None or parts:
+            raise StreamError(f"APIError: {e}", "".join(parts)) from e
+        yield default
+        return
+    if cache and llm_cache.ENABLED:
+        await asyncio.to_thread(llm_cache.put, key, "".join(parts).strip())
 
 
 def generate_question(axis: str, category: str | None = None, temperature: float = 0.4) -> str:
@@ -71,7 +162,7 @@ def generate_question(axis: str, category: str | None = None, temperature: float
         {"role": "system", "content": system},
         {"role": "user", "content": user},
     ]
-    return _call_openai(messages, temperature)
+    return _call_openai(messages, temperature, cache=False, caller="generate_question")
 
 
 async def generate_question_async(
@@ -98,38 +189,48 @@ async def generate_question_async(
         {"role": "system", "content": system},
         {"role": "user", "content": user},
     ]
-    return await _acall_openai(messages, temperature)
+    return await _acall_openai(messages, temperature, cache=False, caller="generate_question_async")
 
 
 
+async def generate_questions_batch_async(
+    axis_categories: Dict[str, List[str]], temperature: float = 0.6
+) -> str:
+    """Generate several questions for one or more axes in a single request.
 
-def feedback_for_patient(summary: str, user_name: Optional[str] = None, temperature: float = 0.1) -> str:
-    """Generate patient-facing feedback based on answer summary."""
+    ``axis_categories`` maps each axis to one category per requested question.
+    The reply is a JSON object mapping every axis to a list of
+    ``{"question_text", "axis"}`` objects.
+    """
     system = (
-        "あなたは共感的なカウンセラーです。SAPAS と MSI-BPD を参考にした質問への回答を踏まえ、"
-        "患者が大切にしている価値観を要約し、安心感を与えるフィードバックを提供します。"
-        "あなたのトーンは常に協力的で、患者を分類したり評価したりする言葉を完全に避けてください。"
-        "否定的な名詞や評価的表現を使わず、安心感を与える前向きな言葉を選んでください。"
-        "リスクについては一切言及してはいけません。ここでの主目的は、患者が『自分の気持ちを理解してもらえた』と感じることです。"
-        "フィードバックは、回答内容を反映した個別のアドバイスとして、今後の治療計画に活かすための前向きなものとして構成してください。"
-        "心理的な分析や診断と受け取られる可能性のある表現は、いかなる場合も使用しないでください。"
-        "内容は日本語で300文字以上600文字未満にまとめてください。"
+        "あなたは医療調査の設計者です。SAPAS と MSI-BPD の質問項目を可能な限り踏襲し、"
+        "非臨床的な言葉で治療計画の一環として患者の好みや懸念を尋ねます。"
+        "質問文に軸の名称やそれを連想させる単語（特別扱い、疑う、期待など）を含めてはいけません。"
+        "返信は必ず軸の名称をキー、'question_text' と 'axis' をキーに持つオブジェクトの配列を値とする JSON のみとし、"
+        "前後に説明文を追加してはいけません。"
+        "各質問は指定されたカテゴリに沿って作成し、互いに意味的に重複しないようにしてください。"
+        "同じ趣旨の質問を異なる言葉で言い換えることは避けてください。"
+        "質問文は、患者が『全くそう思わない』から『とてもそう思う』までの5段階の選択肢で"
+        "直感的に回答できる、自己完結した短い問いかけにしてください。"
     )
-    name_part = f"{user_name}さん" if user_name else "患者様"
+    lines = [
+        f"- Axis '{axis}': {len(cats)} questions, one for each category: {', '.join(cats)}"
+        for axis, cats in axis_categories.items()
+    ]
     user = (
-        f"{name_part}に向けて、以下の回答要約を参考に 診療方針に関するご確認 というタイトルでフィードバックを作成してください。"
-        " 出力は300文字以上600文字未満の日本語にしてください。\n" + summary
+        "Generate distinct short questions that feel like part of routine consultation.\n"
+        + "\n".join(lines)
     )
     messages = [
         {"role": "system", "content": system},
         {"role": "user", "content": user},
     ]
-    return _call_openai(messages, temperature)
+    return await _acall_openai(messages, temperature, cache=False, caller="generate_questions_batch_async")
 
 
-async def feedback_for_patient_async(summary: str, user_name: Optional[str] = None, temperature: float = 0.1) -> str:
-    """Asynchronously generate patient feedback."""
-    name_part = f"{user_name}さん" if user_name else "患者様"
+
+
+def _patient_feedback_messages(summary: str, user_name: Optional[str]) -> List[dict]:
     system = (
         "あなたは共感的なカウンセラーです。SAPAS と MSI-BPD を参考にした質問への回答を踏まえ、"
         "患者が大切にしている価値観を要約し、安心感を与えるフィードバックを提供します。"
@@ -140,46 +241,50 @@ async def feedback_for_patient_async(summary: str, user_name: Optional[str] = No
         "心理的な分析や診断と受け取られる可能性のある表現は、いかなる場合も使用しないでください。"
         "内容は日本語で300文字以上600文字未満にまとめてください。"
     )
+    name_part = f"{user_name}さん" if user_name else "患者様"
     user = (
         f"{name_part}に向けて、以下の回答要約を参考に 診療方針に関するご確認 というタイトルでフィードバックを作成してください。"
         " 出力は300文字以上600文字未満の日本語にしてください。\n" + summary
     )
-    messages = [
+    return [
         {"role": "system", "content": system},
         {"role": "user", "content": user},
     ]
-    return await _acall_openai(messages, temperature)
 
 
-def feedback_for_staff(summary: str, temperature: float = 0.1) -> str:
-    """Generate staff-facing feedback in structured JSON."""
-    system = (
-        "You are an experienced clinical psychologist and hospital risk assessment specialist."
-        " The questionnaire items follow SAPAS and MSI-BPD as closely as possible."
-        " Provide actionable suggestions in Japanese and avoid stigmatizing or"
-        " labeling the patient."
-        " 回答内容に基づいたパーソナライズされた助言を、各項目合計300文字以上600文字未満に収まるよう調整してください。"
+def feedback_for_patient(summary: str, user_name: Optional[str] = None, temperature: float = 0.1) -> str:
+    """Generate patient-facing feedback based on answer summary."""
+    return _call_openai(
+        _patient_feedback_messages(summary, user_name),
+        temperature,
+        default=fallback.patient_feedback(user_name),
+        caller="feedback_for_patient",
     )
-    user = (
-        "以下のスコア概要を使用して、指定のJSON形式で分析レポートを生成してください。\n"
-        "各キーには以下の内容を含めてください:\n"
-        "- 'risk_profile_summary': スコア全体から読み取れる、患者のコミュニケーションにおける全体的な傾向の要約\n"
-        "- 'caution_points': 患者との信頼関係を損なう可能性があるため、スタッフが避けるべき具体的な言動のリスト\n"
-        "- 'recommended_actions': 信頼関係を構築するために推奨される、具体的な声かけや対応のリスト\n"
-        "- 'escalation_plan': 万が一、問題行動が見られた場合に備えた段階的な対応計画\n\n"
-        "出力は合計300文字以上600文字未満になるようにしてください。\n"
-        "JSONオブジェクト以外の文字列は出力しないでください。\n"
-        f"スコア概要: {summary}"
+
+
+async def feedback_for_patient_async(summary: str, user_name: Optional[str] = None, temperature: float = 0.1) -> str:
+    """Asynchronously generate patient feedback."""
+    return await _acall_openai(
+        _patient_feedback_messages(summary, user_name),
+        temperature,
+        default=fallback.patient_feedback(user_name),
+        caller="feedback_for_patient_async",
     )
-    messages = [
-        {"role": "system", "content": system},
-        {"role": "user", "content": user},
-    ]
-    return _call_openai(messages, temperature)
 
 
-async def feedback_for_staff_async(summary: str, temperature: float = 0.1) -> str:
-    """Asynchronously generate staff-facing feedback."""
+def feedback_for_patient_stream(
+    summary: str, user_name: Optional[str] = None, temperature: float = 0.1
+) -> AsyncIterator[str]:
+    """Stream patient feedback as text chunks while it is generated."""
+    return _astream_openai(
+        _patient_feedback_messages(summary, user_name),
+        temperature,
+        default=fallback.patient_feedback(user_name),
+        caller="feedback_for_patient_stream",
+    )
+
+
+def _staff_feedback_messages(summary: str) -> List[dict]:
     system = (
         "You are an experienced clinical psychologist and hospital risk assessment specialist."
         " The questionnaire items follow SAPAS and MSI-BPD as closely as possible."
@@ -198,11 +303,44 @@ async def feedback_for_staff_async(summary: str, temperature: float = 0.1) -> st
         "JSONオブジェクト以外の文字列は出力しないでください。\n"
         f"スコア概要: {summary}"
     )
-    messages = [
+    return [
         {"role": "system", "content": system},
         {"role": "user", "content": user},
     ]
-    return await _acall_openai(messages, temperature)
+
+
+def feedback_for_staff(summary: str, temperature: float = 0.1) -> str:
+    """Generate staff-facing feedback in structured JSON."""
+    return _call_openai(
+        _staff_feedback_messages(summary), temperature, caller="feedback_for_staff"
+    )
+
+
+async def feedback_for_staff_async(
+    summary: str, temperature: float = 0.1, cache: bool = True
+) -> str:
+    """Asynchronously generate staff-facing feedback.
+
+    Pass ``cache=False`` to force a fresh report instead of a cached one.
+    """
+    return await _acall_openai(
+        _staff_feedback_messages(summary),
+        temperature,
+        cache=cache,
+        caller="feedback_for_staff_async",
+    )
+
+
+def feedback_for_staff_stream(
+    summary: str, temperature: float = 0.1, cache: bool = True
+) -> AsyncIterator[str]:
+    """Stream the staff report JSON as text chunks while it is generated."""
+    return _astream_openai(
+        _staff_feedback_messages(summary),
+        temperature,
+        cache=cache,
+        caller="feedback_for_staff_stream",
+    )
 
 
 def evaluation_summary(scores: dict, temperature: float = 0.1) -> str:
@@ -216,11 +354,23 @@ def evaluation_summary(scores: dict, temperature: float = 0.1) -> str:
         {"role": "system", "content": system},
         {"role": "user", "content": user},
     ]
-    return _call_openai(messages, temperature)
+    return _call_openai(
+        messages,
+        temperature,
+        default=fallback.evaluation_summary(scores),
+        caller="evaluation_summary",
+    )
 
 
-async def evaluation_summary_async(scores: dict, temperature: float = 0.1) -> str:
-    """Asynchronously summarize score rationale."""
+async def evaluation_summary_async(
+    scores: dict, temperature: float = 0.1, cache: bool = True, use_fallback: bool = True
+) -> str:
+    """Asynchronously summarize score rationale.
+
+    With ``use_fallback=False`` a failed call returns the ``"APIError: ..."``
+    marker instead of the template summary, so batch jobs can tell the two
+    apart and retry later.
+    """
     system = (
         "You summarize patient questionnaire results in around 200 Japanese characters."
         " The questions are based on SAPAS and MSI-BPD, mapped to five behavioral axes."
@@ -230,4 +380,10 @@ async def evaluation_summary_async(scores: dict, temperature: float = 0.1) -> st
         {"role": "system", "content": system},
         {"role": "user", "content": user},
     ]
-    return await _acall_openai(messages, temperature)
+    return await _acall_openai(
+        messages,
+        temperature,
+        cache=cache,
+        default=fallback.evaluation_summary(scores) if use_fallback else None,
+        caller="evaluation_summary_async",
+    )
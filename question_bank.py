@@ -0,0 +1,174 @@
+"""Persistent bank of pre-generated questions with background refill."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+from typing import Awaitable, Callable, Dict, List
+
+import async_runtime
+import data_persistence
+import prompts
+
+logger = logging.getLogger(__name__)
+
+BANK_PATH = data_persistence.DATA_DIR / "question_bank.json"
+
+# Refill a category once it holds fewer than LOW_WATER_MARK questions and
+# top it up to TARGET_SIZE.
+LOW_WATER_MARK = 5
+TARGET_SIZE = 12
+REFILL_INTERVAL = 30.0
+
+_lock = threading.Lock()
+
+Bank = Dict[str, Dict[str, List[str]]]
+GenerateFn = Callable[[str, str, List[str]], Awaitable[dict]]
+
+
+def _empty_bank() -> Bank:
+    return {axis: {cat: [] for cat in cats} for axis, cats in prompts.AXIS_CATEGORIES.items()}
+
+
+def _normalise(text: str) -> str:
+    return "".join(text.split())
+
+
+def load() -> Bank:
+    """Return the stored bank, filling in any missing axes or categories."""
+    bank = _empty_bank()
+    if not BANK_PATH.exists():
+        return bank
+    try:
+        stored = json.loads(BANK_PATH.read_text(encoding="utf-8"))
+    except (json.JSONDecodeError, OSError):
+        return bank
+    for axis, cats in stored.items():
+        for cat, texts in cats.items():
+            bank.setdefault(axis, {})[cat] = list(texts)
+    return bank
+
+
+def _write(bank: Bank) -> None:
+    tmp = BANK_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(bank, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, BANK_PATH)
+
+
+def counts() -> Dict[str, Dict[str, int]]:
+    """Return the number of stored questions per axis and category."""
+    with _lock:
+        bank = load()
+    return {axis: {cat: len(texts) for cat, texts in cats.items()} for axis, cats in bank.items()}
+
+
+def add(axis: str, category: str, texts: List[str]) -> int:
+    """Store new questions, skipping ones already banked. Return count added."""
+    with _lock, data_persistence.file_lock(BANK_PATH):
+        bank = load()
+        seen = {_normalise(t) for cats in bank.values() for ts in cats.values() for t in ts}
+        bucket = bank.setdefault(axis, {}).setdefault(category, [])
+        added = 0
+        for text in texts:
+            key = _normalise(text)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            bucket.append(text)
+            added += 1
+        if added:
+            _write(bank)
+    return added
+
+
+def draw(axes: List[str], num_per_axis: int) -> Dict[str, List[dict]]:
+    """Remove and return up to ``num_per_axis`` distinct questions per axis.
+
+    Questions are taken round-robin across a shuffled category order so that a
+    single patient sees a spread of categories.  Drawn questions are removed
+    from the bank so subsequent patients receive fresh ones.
+    """
+    drawn: Dict[str, List[dict]] = {axis: [] for axis in axes}
+    with _lock, data_persistence.file_lock(BANK_PATH):
+        bank = load()
+        seen: set[str] = set()
+        for axis in axes:
+            cats = [c for c, texts in bank.get(axis, {}).items() if texts]
+            random.shuffle(cats)
+            while len(drawn[axis]) < num_per_axis and cats:
+                for cat in list(cats):
+                    texts = bank[axis][cat]
+                    while texts:
+                        text = texts.pop(random.randrange(len(texts)))
+                        if _normalise(text) not in seen:
+                            seen.add(_normalise(text))
+                            drawn[axis].append({"question_text": text, "axis": axis})
+                            break
+                    if not texts:
+                        cats.remove(cat)
+                    if len(drawn[axis]) >= num_per_axis:
+                        break
+        if any(drawn.values()):
+            _write(bank)
+    return drawn
+
+
+def needs_refill() -> bool:
+    """Return True when any category is below the low-water mark."""
+    return any(
+        n < LOW_WATER_MARK for cats in counts().values() for n in cats.values()
+    )
+
+
+async def refill_async(generate: GenerateFn, target: int = TARGET_SIZE) -> int:
+    """Top up every category below the low-water mark to ``target`` questions."""
+    total = 0
+    # File access runs in worker threads: this coroutine shares the event
+    # loop with every patient session.
+    for axis, cats in (await asyncio.to_thread(counts)).items():
+        for cat, n in cats.items():
+            if n >= LOW_WATER_MARK:
+                continue
+            bank = await asyncio.to_thread(load)
+            existing = [t for ts in bank.get(axis, {}).values() for t in ts]
+            new: List[str] = []
+            for _ in range(target - n):
+                q = await generate(axis, cat, existing + new)
+                if q.get("question_text"):
+                    new.append(q["question_text"])
+            total += await asyncio.to_thread(add, axis, cat, new)
+    return total
+
+
+class RefillWorker(threading.Thread):
+    """Daemon thread keeping the bank above its low-water mark."""
+
+    def __init__(self, generate: GenerateFn, interval: float = REFILL_INTERVAL) -> None:
+        super().__init__(name="question-bank-refill", daemon=True)
+        self.generate = generate
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def request_refill(self) -> None:
+        """Wake the worker to check the bank immediately."""
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.clear()
+            try:
+                if needs_refill():
+                    added = async_runtime.run(refill_async(self.generate))
+                    logger.info("question bank refilled with %d questions", added)
+            except Exception:  # keep the worker alive on API failures
+                logger.exception("question bank refill failed")
+            self._wake.wait(self.interval)
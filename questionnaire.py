@@ -2,156 +2,343 @@
 
 from __future__ import annotations
 
+import collections
+import concurrent.futures
+import dataclasses
+import functools
 import json
+import math
 import os
 import random
-from typing import Dict, List
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List
 
 import openai
 import asyncio
 
-import plotly.graph_objects as go
-
+import async_runtime
+import fallback
+import llm_client
 import prompts
+import question_bank
+import similarity
+import tracing
+from axes import AXES
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+
+# Ask the LLM to settle candidates whose local similarity score falls in the
+# ambiguous band; disable to rely on the local index alone.
+LLM_TIE_BREAK = True
 
-AXES = [
-    "特権意識と期待",
-    "情動の不安定性",
-    "不信感と猜疑心",
-    "依存性と操作性",
-    "統制欲求と完璧主義",
-]
+_SIMILARITY_SYSTEM = "次の二つの質問がほぼ同じ内容か判定し、似ていれば'はい'、違えば'いいえ'のみを返してください。"
 
 
-def _is_similar(text: str, existing: List[str]) -> bool:
-    """Check similarity using GPT-4.1 mini rather than embeddings."""
+def _is_yes(ans: str) -> bool:
+    return ans.startswith("はい") or ans.lower().startswith("yes")
+
+
+def _is_similar(
+    text: str, existing: List[str], threshold: float = similarity.THRESHOLD
+) -> bool:
+    """Check similarity with the local n-gram index.
+
+    Only candidates in the ambiguous score band are sent to GPT-4.1 mini for a
+    tie-break, and only when ``LLM_TIE_BREAK`` is enabled.
+    """
+    index = similarity.SimilarityIndex(existing)
+    if index.is_duplicate(text, threshold):
+        return True
     api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    candidates = index.ambiguous(text, threshold) if LLM_TIE_BREAK else []
+    if not candidates or not api_key:
         return False
-    client = openai.OpenAI(api_key=api_key)
-    for t in existing:
+    for t in candidates:
         messages = [
-            {
-                "role": "system",
-                "content": "次の二つの質問がほぼ同じ内容か判定し、似ていれば'はい'、違えば'いいえ'のみを返してください。",
-            },
+            {"role": "system", "content": _SIMILARITY_SYSTEM},
             {"role": "user", "content": f"Q1: {text}\nQ2: {t}"},
         ]
         try:
-            resp = client.chat.completions.create(model=prompts.MODEL, messages=messages, temperature=0)
-            ans = resp.choices[0].message.content.strip()
-            if ans.startswith("はい") or ans.lower().startswith("yes"):
+            resp = llm_client.chat_completion(
+                prompts.MODEL, messages, temperature=0, caller="_is_similar"
+            )
+            if _is_yes(resp.choices[0].message.content.strip()):
                 return True
         except openai.OpenAIError:
             return False
     return False
 
 
-async def _is_similar_async(text: str, existing: List[str]) -> bool:
-    """Asynchronously check similarity using GPT-4.1 mini."""
+async def _is_similar_async(
+    text: str, existing: List[str], threshold: float = similarity.THRESHOLD
+) -> bool:
+    """Asynchronous variant of :func:`_is_similar`."""
+    index = similarity.SimilarityIndex(existing)
+    if index.is_duplicate(text, threshold):
+        return True
     api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    candidates = index.ambiguous(text, threshold) if LLM_TIE_BREAK else []
+    if not candidates or not api_key:
         return False
-    client = openai.AsyncOpenAI(api_key=api_key)
-    for t in existing:
+    for t in candidates:
         messages = [
-            {
-                "role": "system",
-                "content": "次の二つの質問がほぼ同じ内容か判定し、似ていれば'はい'、違えば'いいえ'のみを返してください。",
-            },
+            {"role": "system", "content": _SIMILARITY_SYSTEM},
             {"role": "user", "content": f"Q1: {text}\nQ2: {t}"},
         ]
         try:
-            resp = await client.chat.completions.create(model=prompts.MODEL, messages=messages, temperature=0)
-            ans = resp.choices[0].message.content.strip()
-            if ans.startswith("はい") or ans.lower().startswith("yes"):
+            resp = await llm_client.achat_completion(
+                prompts.MODEL, messages, temperature=0, caller="_is_similar_async"
+            )
+            if _is_yes(resp.choices[0].message.content.strip()):
                 return True
         except openai.OpenAIError:
             return False
     return False
 
 
-def _generate_unique_question(axis: str, existing: List[str], temp: float, category: str) -> dict:
-    """Generate a question avoiding semantic similarity.
+# Number of candidates requested concurrently per question slot.  With k > 1
+# the first candidate to pass the similarity check wins and the others are
+# cancelled, trading extra API calls for lower tail latency.
+SPECULATIVE_CANDIDATES = int(os.getenv("QUESTION_CANDIDATES", "1"))
+MAX_ATTEMPTS = 5
+# Spread of sampling temperatures across concurrent candidates.
+CANDIDATE_TEMPERATURE_STEP = 0.05
+# Longest a patient waits for the next question before a curated fallback
+# question is shown instead.
+QUESTION_DEADLINE = float(os.getenv("QUESTION_DEADLINE", "8"))
+# "fixed" asks every axis the same number of questions; "adaptive" stops an
+# axis once its score is stable (see AdaptiveQuestionnaire).
+QUESTIONNAIRE_MODE = os.getenv("QUESTIONNAIRE_MODE", "fixed")
 
-    The OpenAI API may occasionally return non-dictionary JSON such as a list or
-    a plain string.  To ensure robustness we normalise the parsed value to a
-    dictionary with ``question_text`` and ``axis`` keys before checking for
-    similarity.
-    """
 
-    for _ in range(5):
-        q_json = prompts.generate_question(axis, category=category, temperature=temp)
-        try:
-            parsed = json.loads(q_json)
-        except json.JSONDecodeError:
-            parsed = q_json
-
-        # Normalise to a dict with required keys
-        if isinstance(parsed, dict):
-            question_text = parsed.get("question_text", "")
-            axis_val = parsed.get("axis", axis)
-        elif isinstance(parsed, list):
-            if parsed:
-                item = parsed[0]
-                if isinstance(item, dict):
-                    question_text = item.get("question_text", "")
-                    axis_val = item.get("axis", axis)
-                else:
-                    question_text = str(item)
-                    axis_val = axis
+def _parse_question(q_json: str, axis: str) -> dict:
+    """Normalise one generation reply to ``question_text`` and ``axis`` keys.
+
+    The OpenAI API may occasionally return non-dictionary JSON such as a list
+    or a plain string, so every shape is mapped onto a dictionary.
+    """
+    try:
+        parsed = json.loads(q_json)
+    except json.JSONDecodeError:
+        parsed = q_json
+
+    if isinstance(parsed, dict):
+        question_text = parsed.get("question_text", "")
+        axis_val = parsed.get("axis", axis)
+    elif isinstance(parsed, list):
+        if parsed:
+            item = parsed[0]
+            if isinstance(item, dict):
+                question_text = item.get("question_text", "")
+                axis_val = item.get("axis", axis)
             else:
-                question_text = ""
+                question_text = str(item)
                 axis_val = axis
         else:
-            question_text = str(parsed)
+            question_text = ""
             axis_val = axis
+    else:
+        question_text = str(parsed)
+        axis_val = axis
+
+    return {"question_text": question_text, "axis": axis_val}
 
-        q = {"question_text": question_text, "axis": axis_val}
 
-        if not _is_similar(q["question_text"], existing):
+def _generate_unique_question(axis: str, existing: List[str], temp: float, category: str) -> dict:
+    """Generate a question avoiding semantic similarity.
+
+    A curated fallback question is returned if the API cannot produce one.
+    """
+    q = None
+    for _ in range(MAX_ATTEMPTS):
+        if not llm_client.available():
+            break
+        reply = prompts.generate_question(axis, category=category, temperature=temp)
+        if prompts.is_error(reply):
+            continue
+        q = _parse_question(reply, axis)
+        rejected = _is_similar(q["question_text"], existing)
+        tracing.record("similarity", rejected=rejected, source="live")
+        if not rejected:
             return q
 
-    return q
+    return q if q and q["question_text"] else fallback.question(axis, existing)
 
 
-async def _generate_unique_question_async(axis: str, existing: List[str], temp: float, category: str) -> dict:
-    """Asynchronously generate a question avoiding semantic similarity."""
-    for _ in range(5):
-        q_json = await prompts.generate_question_async(axis, category=category, temperature=temp)
-        try:
-            parsed = json.loads(q_json)
-        except json.JSONDecodeError:
-            parsed = q_json
-
-        if isinstance(parsed, dict):
-            question_text = parsed.get("question_text", "")
-            axis_val = parsed.get("axis", axis)
-        elif isinstance(parsed, list):
-            if parsed:
-                item = parsed[0]
-                if isinstance(item, dict):
-                    question_text = item.get("question_text", "")
-                    axis_val = item.get("axis", axis)
-                else:
-                    question_text = str(item)
-                    axis_val = axis
-            else:
-                question_text = ""
-                axis_val = axis
-        else:
-            question_text = str(parsed)
-            axis_val = axis
+_spec_lock = threading.Lock()
+_spec_stats: Dict[str, int] = {
+    "slots": 0,
+    "rounds": 0,
+    "requested": 0,
+    "rejected": 0,
+    "cancelled": 0,
+    "errors": 0,
+    "fallbacks": 0,
+}
+_spec_latencies: collections.deque = collections.deque(maxlen=1000)
 
-        q = {"question_text": question_text, "axis": axis_val}
 
-        if not await _is_similar_async(q["question_text"], existing):
-            return q
+def _count(name: str, n: int = 1) -> None:
+    with _spec_lock:
+        _spec_stats[name] += n
 
-    return q
 
+def speculation_stats() -> Dict[str, float]:
+    """Return speculative generation counters and slot latency percentiles.
 
-import asyncio
+    ``calls_per_slot`` is the API cost (1.0 for serial generation without
+    rejections); ``p50``/``p95``/``p99`` are the seconds taken to fill one
+    question slot over the most recent slots.
+    """
+    with _spec_lock:
+        result: Dict[str, float] = dict(_spec_stats)
+        latencies = sorted(_spec_latencies)
+    result["calls_per_slot"] = result["requested"] / result["slots"] if result["slots"] else 0.0
+    for pct in (50, 95, 99):
+        result[f"p{pct}"] = (
+            latencies[min(len(latencies) - 1, len(latencies) * pct // 100)] if latencies else 0.0
+        )
+    return result
+
+
+def reset_speculation_stats() -> None:
+    """Zero the speculative generation counters."""
+    with _spec_lock:
+        for name in _spec_stats:
+            _spec_stats[name] = 0
+        _spec_latencies.clear()
+
+
+async def _candidate_async(
+    axis: str, existing: List[str], temp: float, category: str
+) -> tuple[dict | None, bool]:
+    q_json = await prompts.generate_question_async(axis, category=category, temperature=temp)
+    if prompts.is_error(q_json):
+        _count("errors")
+        return None, False
+    q = _parse_question(q_json, axis)
+    rejected = await _is_similar_async(q["question_text"], existing)
+    tracing.record("similarity", rejected=rejected, source="live")
+    return q, not rejected
+
+
+async def _generate_unique_question_async(
+    axis: str,
+    existing: List[str],
+    temp: float,
+    category: str,
+    k: int | None = None,
+    use_fallback: bool = True,
+) -> dict:
+    """Asynchronously generate a question avoiding semantic similarity.
+
+    Each round requests ``k`` candidates (default ``SPECULATIVE_CANDIDATES``)
+    concurrently at slightly different temperatures and deduplicates them in
+    parallel; the first acceptable one is returned and the rest cancelled.
+    Rounds are capped so that at most about ``MAX_ATTEMPTS`` candidates are
+    requested, as with serial retries.
+
+    API errors never become questions: if no candidate could be generated
+    (or the circuit breaker is open) a curated fallback question is returned,
+    or an empty one when ``use_fallback`` is false.
+    """
+    k = max(1, k or SPECULATIVE_CANDIDATES)
+    start = time.perf_counter()
+    _count("slots")
+    q: dict = {"question_text": "", "axis": axis}
+    try:
+        for _ in range(max(1, math.ceil(MAX_ATTEMPTS / k))):
+            if not llm_client.available():
+                break
+            _count("rounds")
+            _count("requested", k)
+            pending = {
+                asyncio.ensure_future(
+                    _candidate_async(
+                        axis, existing, temp + CANDIDATE_TEMPERATURE_STEP * j, category
+                    )
+                )
+                for j in range(k)
+            }
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        candidate, unique = task.result()
+                        if unique:
+                            return candidate
+                        if candidate is not None:
+                            _count("rejected")
+                            q = candidate
+            finally:
+                for task in pending:
+                    task.cancel()
+                _count("cancelled", len(pending))
+        if not q["question_text"] and use_fallback:
+            _count("fallbacks")
+            return fallback.question(axis, existing)
+        return q
+    finally:
+        with _spec_lock:
+            _spec_latencies.append(time.perf_counter() - start)
+
+
+def _parse_batch(q_json: str, axes: List[str]) -> Dict[str, List[str]]:
+    """Extract valid question texts per axis from a batched generation reply.
+
+    Both ``{axis: [{"question_text": ...}, ...]}`` and a flat list of
+    ``{"question_text", "axis"}`` objects are accepted.  Items that are not
+    dictionaries, lack text or name an unknown axis are dropped so the caller
+    can regenerate those slots individually.
+    """
+    texts: Dict[str, List[str]] = {axis: [] for axis in axes}
+    try:
+        parsed = json.loads(q_json)
+    except json.JSONDecodeError:
+        return texts
+    if isinstance(parsed, dict):
+        items = []
+        for key, value in parsed.items():
+            for item in value if isinstance(value, list) else [value]:
+                if isinstance(item, dict):
+                    items.append({"axis": key, **item})
+    elif isinstance(parsed, list):
+        items = [item for item in parsed if isinstance(item, dict)]
+    else:
+        items = []
+    for item in items:
+        text = item.get("question_text")
+        axis = item.get("axis")
+        if isinstance(text, str) and text.strip() and axis in texts:
+            texts[axis].append(text.strip())
+    return texts
+
+
+async def _batch_candidates_async(needed: Dict[str, int], batch: str) -> Dict[str, List[str]]:
+    """Request candidate questions in one call per axis or one call overall."""
+    def categories(axis: str) -> List[str]:
+        cats = prompts.AXIS_CATEGORIES.get(axis, ["一般"])
+        cats = random.sample(cats, len(cats))
+        return [cats[i % len(cats)] for i in range(needed[axis])]
+
+    axes = [axis for axis, n in needed.items() if n > 0]
+    if not axes:
+        return {}
+    if batch == "all":
+        reply = await prompts.generate_questions_batch_async({a: categories(a) for a in axes})
+        return _parse_batch(reply, axes)
+    replies = await asyncio.gather(
+        *(prompts.generate_questions_batch_async({a: categories(a)}) for a in axes)
+    )
+    candidates: Dict[str, List[str]] = {}
+    for axis, reply in zip(axes, replies):
+        candidates.update(_parse_batch(reply, [axis]))
+    return candidates
 
 
 async def _generate_axis_questions_async(
@@ -159,39 +346,534 @@ async def _generate_axis_questions_async(
     num_questions: int,
     existing: List[str],
     lock: asyncio.Lock,
+    candidates: List[str] | None = None,
+    batch: str | None = None,
+    on_question: Callable[[dict], None] | None = None,
 ) -> List[dict]:
-    """Generate questions for a single axis asynchronously."""
+    """Generate questions for a single axis asynchronously.
+
+    Pre-generated ``candidates`` are accepted first when they pass the
+    similarity check; with ``batch="axis"`` and no candidates the axis
+    requests its own batch.  Any remaining slots are generated one at a time.
+    ``on_question`` is called with each question as soon as it is accepted.
+    """
+    if candidates is None and batch == "axis" and num_questions > 0:
+        candidates = (await _batch_candidates_async({axis: num_questions}, batch)).get(axis)
     axis_questions: List[dict] = []
-    for i in range(num_questions):
+
+    def accept(q: dict) -> None:
+        axis_questions.append(q)
+        if on_question is not None:
+            on_question(q)
+
+    for text in candidates or []:
+        if len(axis_questions) >= num_questions:
+            break
+        rejected = await _is_similar_async(text, existing)
+        tracing.record("similarity", rejected=rejected, source="batch")
+        if rejected:
+            continue
+        async with lock:
+            existing.append(text)
+        accept({"question_text": text, "axis": axis})
+    for i in range(len(axis_questions), num_questions):
         temp = 0.4 + 0.02 * i
         category = random.choice(prompts.AXIS_CATEGORIES.get(axis, ["一般"]))
         q = await _generate_unique_question_async(axis, existing, temp, category)
         async with lock:
             existing.append(q["question_text"])
-        axis_questions.append(q)
+        accept(q)
     return axis_questions
 
 
-async def generate_questionnaire_async(num_questions_per_axis: int = 3) -> List[dict]:
-    """Asynchronously generate questions for all axes."""
+async def _draw_from_bank_async(axes: List[str], num_per_axis: int) -> Dict[str, List[dict]]:
+    """Draw banked questions and ask for a refill when the bank runs low."""
+    # The bank takes file locks and rewrites its JSON file: keep that off
+    # the event loop shared by every session.
+    drawn = await asyncio.to_thread(question_bank.draw, axes, num_per_axis)
+    if _refill_worker is not None and await asyncio.to_thread(question_bank.needs_refill):
+        _refill_worker.request_refill()
+    return drawn
+
+
+async def generate_questionnaire_async(
+    num_questions_per_axis: int = 3,
+    use_bank: bool = True,
+    batch: str | None = "axis",
+    on_question: Callable[[int, dict], None] | None = None,
+) -> List[dict]:
+    """Asynchronously generate questions for all axes.
+
+    When ``use_bank`` is true questions are drawn from the pre-generated
+    question bank and only axes the bank cannot fully serve fall back to live
+    generation.  ``batch`` selects how live questions are requested: ``"axis"``
+    issues one request per axis, ``"all"`` a single request for every axis and
+    ``None`` one request per question.
+
+    Questions are ordered axis by axis.  ``on_question(index, question)`` is
+    called as soon as the question for position ``index`` is final, which may
+    be long before the whole questionnaire is ready.
+    """
     questions: List[dict] = []
-    existing_texts: List[str] = []
+    drawn: Dict[str, List[dict]] = {axis: [] for axis in AXES}
+    if use_bank:
+        drawn = await _draw_from_bank_async(AXES, num_questions_per_axis)
+    existing_texts: List[str] = [q["question_text"] for qs in drawn.values() for q in qs]
     lock = asyncio.Lock()
+    needed = {axis: num_questions_per_axis - len(drawn[axis]) for axis in AXES}
+    candidates = await _batch_candidates_async(needed, batch) if batch == "all" else {}
+
+    def reporter(axis_index: int, axis: str) -> Callable[[dict], None] | None:
+        if on_question is None:
+            return None
+        positions = iter(range(
+            axis_index * num_questions_per_axis + len(drawn[axis]),
+            (axis_index + 1) * num_questions_per_axis,
+        ))
+        return lambda q: on_question(next(positions), q)
+
+    if on_question is not None:
+        for i, axis in enumerate(AXES):
+            for j, q in enumerate(drawn[axis]):
+                on_question(i * num_questions_per_axis + j, q)
 
     tasks = [
-        _generate_axis_questions_async(axis, num_questions_per_axis, existing_texts, lock)
-        for axis in AXES
+        tracing.bind(
+            _generate_axis_questions_async(
+                axis,
+                needed[axis],
+                existing_texts,
+                lock,
+                candidates.get(axis),
+                batch,
+                reporter(i, axis),
+            ),
+            axis=axis,
+        )
+        for i, axis in enumerate(AXES)
     ]
     results = await asyncio.gather(*tasks)
-    for qs in results:
+    for axis, qs in zip(AXES, results):
+        questions.extend(drawn[axis])
         questions.extend(qs)
 
     return questions
 
 
-def generate_questionnaire(num_questions_per_axis: int = 3) -> List[dict]:
+def generate_questionnaire(
+    num_questions_per_axis: int = 3, use_bank: bool = True, batch: str | None = "axis"
+) -> List[dict]:
     """Synchronous wrapper around asynchronous questionnaire generation."""
-    return asyncio.run(generate_questionnaire_async(num_questions_per_axis))
+    return async_runtime.run(
+        generate_questionnaire_async(num_questions_per_axis, use_bank, batch)
+    )
+
+
+class QuestionnaireStream:
+    """Questionnaire generated on the background loop and read as it fills.
+
+    Positions follow the same axis-by-axis order as
+    :func:`generate_questionnaire`, so callers can show question ``i`` as soon
+    as it exists while later questions are still being generated.  LLM calls
+    made for it are traced under ``session``.
+    """
+
+    def __init__(
+        self,
+        num_questions_per_axis: int = 3,
+        use_bank: bool = True,
+        batch: str | None = "axis",
+        session: str | None = None,
+    ) -> None:
+        self.total = num_questions_per_axis * len(AXES)
+        self.session = session
+        self._args = (num_questions_per_axis, use_bank, batch)
+        self._slots: List[dict | None] = [None] * self.total
+        self._cond = threading.Condition()
+        self._error: BaseException | None = None
+        self._finished = False
+        self._future: concurrent.futures.Future | None = None
+
+    def start(self) -> "QuestionnaireStream":
+        self._future = async_runtime.submit(
+            tracing.bind(
+                generate_questionnaire_async(*self._args, on_question=self._put),
+                session=self.session,
+            )
+        )
+        self._future.add_done_callback(self._done)
+        return self
+
+    def _put(self, index: int, q: dict) -> None:
+        with self._cond:
+            if self._slots[index] is None:  # keep a fallback already shown
+                self._slots[index] = q
+            self._cond.notify_all()
+
+    def _done(self, future: concurrent.futures.Future) -> None:
+        if future.cancelled():
+            self._error = concurrent.futures.CancelledError()
+        else:
+            self._error = future.exception()  # surfaced to readers in get()
+        with self._cond:
+            self._finished = True
+            self._cond.notify_all()
+
+    def ready(self, index: int) -> bool:
+        return self._slots[index] is not None
+
+    def get(self, index: int, timeout: float | None = None, use_fallback: bool = False) -> dict:
+        """Return question ``index``, waiting until it has been generated.
+
+        With ``use_fallback`` a curated question is put in the slot instead of
+        raising when it is not ready within ``timeout`` or generation failed,
+        so the patient is never kept waiting longer than ``timeout``.
+        """
+        with self._cond:
+            ready = self._cond.wait_for(
+                lambda: self._slots[index] is not None or self._finished, timeout
+            )
+            if self._slots[index] is None:
+                if not use_fallback:
+                    if not ready:
+                        raise TimeoutError(f"question {index} not ready")
+                    raise RuntimeError("questionnaire generation failed") from self._error
+                axis = AXES[index // self._args[0]]
+                used = [q["question_text"] for q in self._slots if q is not None]
+                self._slots[index] = fallback.question(axis, used)
+                _count("fallbacks")
+            return self._slots[index]
+
+    def questions(self, timeout: float | None = None) -> List[dict]:
+        """Return the full questionnaire, waiting for every position."""
+        return [self.get(i, timeout) for i in range(self.total)]
+
+    def answer(self, index: int, score: int) -> None:
+        """Answers do not change a fixed questionnaire."""
+
+
+@dataclasses.dataclass(frozen=True)
+class AdaptivePolicy:
+    """When to stop asking about an axis and which axis to ask next.
+
+    An axis' score estimate is the mean of its answers and its uncertainty
+    the half-width of a normal confidence interval (``z``) whose variance is
+    shrunk towards ``prior_variance``, weighted as ``prior_weight`` answers,
+    so two identical answers do not look perfectly certain.  An axis is done
+    with ``min_per_axis`` answers and a half-width of at most ``tolerance``,
+    or with ``max_per_axis`` answers.
+    """
+
+    min_per_axis: int = 2
+    max_per_axis: int = 4
+    max_questions: int = 15
+    tolerance: float = 0.85
+    z: float = 1.645
+    prior_variance: float = 1.0
+    prior_weight: float = 1.0
+
+    def uncertainty(self, scores: List[int]) -> float:
+        """Return the confidence half-width of the mean of ``scores``."""
+        n = len(scores)
+        if n == 0:
+            return math.inf
+        mean = sum(scores) / n
+        squares = sum((s - mean) ** 2 for s in scores)
+        variance = (self.prior_weight * self.prior_variance + squares) / (
+            self.prior_weight + n - 1
+        )
+        return self.z * math.sqrt(variance / n)
+
+    def stopped(self, scores: List[int]) -> bool:
+        n = len(scores)
+        return n >= self.max_per_axis or (
+            n >= self.min_per_axis and self.uncertainty(scores) <= self.tolerance
+        )
+
+    def next_axis(self, answers: Dict[str, List[int]]) -> str | None:
+        """Return the axis to ask about next, or ``None`` when finished.
+
+        Axes are first asked round-robin up to ``min_per_axis``; after that
+        the open axis with the widest interval is chosen.
+        """
+        if sum(len(v) for v in answers.values()) >= self.max_questions:
+            return None
+        counts = {axis: len(answers.get(axis, [])) for axis in AXES}
+        short = [axis for axis in AXES if counts[axis] < self.min_per_axis]
+        if short:
+            return min(short, key=counts.__getitem__)
+        open_axes = [axis for axis in AXES if not self.stopped(answers.get(axis, []))]
+        if not open_axes:
+            return None
+        return max(open_axes, key=lambda axis: self.uncertainty(answers.get(axis, [])))
+
+    def remaining(self, answers: Dict[str, List[int]]) -> int:
+        """Return the fewest questions still to be asked."""
+        if self.next_axis(answers) is None:
+            return 0
+        asked = sum(len(v) for v in answers.values())
+        needed = sum(max(0, self.min_per_axis - len(answers.get(axis, []))) for axis in AXES)
+        return min(max(1, needed), self.max_questions - asked)
+
+
+class AdaptiveQuestionnaire:
+    """Questionnaire that asks each axis only as often as its score needs.
+
+    The first ``policy.min_per_axis`` questions of every axis are generated
+    up front, as by :class:`QuestionnaireStream`, and asked round-robin.
+    Each answer may then close its axis, and further questions go to the most
+    uncertain open axis.  Extra questions are fetched lazily in rounds: once
+    every axis has its minimum and whenever the open axes have run out, one
+    more question for each axis still open, so axes that close early cost
+    nothing.  They are drawn from the question bank first; with batching
+    enabled any shortfall is generated live in one request for all of them.
+
+    The question at each position is chosen when it is reached, so
+    :meth:`answer` must be called before the next :meth:`get`.  ``total`` is
+    the number answered plus the fewest still needed and is final once
+    :attr:`done`.
+    """
+
+    def __init__(
+        self,
+        policy: AdaptivePolicy | None = None,
+        use_bank: bool = True,
+        batch: str | None = "axis",
+        session: str | None = None,
+    ) -> None:
+        self.policy = policy or AdaptivePolicy()
+        self.session = session
+        self.generated = 0
+        self._args = (use_bank, batch)
+        self._cond = threading.Condition()
+        self._pool: Dict[str, List[dict]] = {axis: [] for axis in AXES}
+        self._inflight: Dict[str, int] = {axis: 0 for axis in AXES}
+        self._asked: List[dict] = []
+        self._asked_axes: List[str] = []
+        self._answered: Dict[int, int] = {}
+        self._scores: Dict[str, List[int]] = {axis: [] for axis in AXES}
+        self._initial_done = False
+        self._error: BaseException | None = None
+
+    def start(self) -> "AdaptiveQuestionnaire":
+        n = self.policy.min_per_axis
+        future = async_runtime.submit(
+            tracing.bind(
+                generate_questionnaire_async(
+                    n,
+                    *self._args,
+                    on_question=lambda i, q: self._put(AXES[i // n], q),
+                ),
+                session=self.session,
+            )
+        )
+        future.add_done_callback(self._initial_finished)
+        return self
+
+    def _put(self, axis: str, q: dict) -> None:
+        with self._cond:
+            self._pool[axis].append(q)
+            self.generated += 1
+            self._cond.notify_all()
+
+    def _initial_finished(self, future: concurrent.futures.Future) -> None:
+        with self._cond:
+            if future.cancelled():
+                self._error = concurrent.futures.CancelledError()
+            elif future.exception() is not None:
+                self._error = future.exception()
+            self._initial_done = True
+            self._cond.notify_all()
+
+    def _texts(self) -> List[str]:
+        pooled = [q["question_text"] for qs in self._pool.values() for q in qs]
+        return [q["question_text"] for q in self._asked] + pooled
+
+    async def _extra_async(
+        self, axes: List[str], existing: List[str], on_question: Callable[[str, dict], None]
+    ) -> None:
+        """Fetch one more question for each of ``axes``: banked, else live."""
+        use_bank, batch = self._args
+        drawn = await _draw_from_bank_async(axes, 1) if use_bank else {}
+        needed = {}
+        for axis in axes:
+            fresh = [q for q in drawn.get(axis, []) if q["question_text"] not in existing]
+            existing.extend(q["question_text"] for q in fresh)
+            for q in fresh:
+                on_question(axis, q)
+            needed[axis] = 1 - len(fresh)
+        candidates = await _batch_candidates_async(needed, "all") if batch else {}
+        lock = asyncio.Lock()
+        await asyncio.gather(*(
+            tracing.bind(
+                _generate_axis_questions_async(
+                    axis,
+                    needed[axis],
+                    existing,
+                    lock,
+                    candidates.get(axis),
+                    on_question=functools.partial(on_question, axis),
+                ),
+                axis=axis,
+            )
+            for axis in axes
+            if needed[axis] > 0
+        ))
+
+    def _generate(self, axes: List[str], at_least: int = 0) -> None:
+        """Start fetching one more question for each of ``axes`` (lock held).
+
+        Only as many axes as the question budget leaves room for are fetched,
+        the most uncertain first, but at least ``at_least``.
+        """
+        budget = self.policy.max_questions - len(self._answered)
+        queued = sum(len(qs) for qs in self._pool.values()) + sum(self._inflight.values())
+        axes = sorted(axes, key=lambda axis: -self.policy.uncertainty(self._scores[axis]))
+        axes = axes[: max(at_least, budget - queued)]
+        if not axes:
+            return
+        pending = set(axes)
+        for axis in axes:
+            self._inflight[axis] += 1
+
+        def arrived(axis: str, q: dict) -> None:
+            with self._cond:
+                pending.discard(axis)
+                self._inflight[axis] -= 1
+                self._pool[axis].append(q)
+                self.generated += 1
+                self._cond.notify_all()
+
+        future = async_runtime.submit(
+            tracing.bind(self._extra_async(axes, self._texts(), arrived), session=self.session)
+        )
+
+        def finished(f: concurrent.futures.Future) -> None:
+            with self._cond:
+                for axis in pending:
+                    self._inflight[axis] -= 1
+                pending.clear()
+                if f.cancelled():
+                    self._error = concurrent.futures.CancelledError()
+                elif f.exception() is not None:
+                    self._error = f.exception()
+                self._cond.notify_all()
+
+        future.add_done_callback(finished)
+
+    def _needs_question(self, axis: str) -> bool:
+        """True if ``axis`` has nothing queued although it may be asked again."""
+        scores = self._scores[axis]
+        return (
+            not self._pool[axis]
+            and not self._inflight[axis]
+            and (self._initial_done or len(scores) >= self.policy.min_per_axis)
+            and not self.policy.stopped(scores)
+        )
+
+    def ready(self, index: int) -> bool:
+        with self._cond:
+            if index < len(self._asked):
+                return True
+            axis = self.policy.next_axis(self._scores)
+            return axis is not None and bool(self._pool[axis])
+
+    def get(self, index: int, timeout: float | None = None, use_fallback: bool = False) -> dict:
+        """Return question ``index``, choosing and waiting for it if it is next.
+
+        ``timeout`` and ``use_fallback`` behave as in
+        :meth:`QuestionnaireStream.get`.
+        """
+        with self._cond:
+            if index < len(self._asked):
+                return self._asked[index]
+            if index > len(self._asked) or len(self._answered) < len(self._asked):
+                raise IndexError(f"question {index} is not the next one to ask")
+            axis = self.policy.next_axis(self._scores)
+            if axis is None:
+                raise IndexError("the questionnaire is complete")
+            end = None if timeout is None else time.monotonic() + timeout
+            while not self._pool[axis] and self._error is None:
+                if self._needs_question(axis):
+                    self._generate([axis], at_least=1)
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if self._pool[axis]:
+                q = self._pool[axis].pop(0)
+            elif use_fallback:
+                q = fallback.question(axis, self._texts())
+                _count("fallbacks")
+            elif self._error is not None:
+                raise RuntimeError("questionnaire generation failed") from self._error
+            else:
+                raise TimeoutError(f"question {index} not ready")
+            self._asked.append(q)
+            self._asked_axes.append(axis)
+            return q
+
+    def answer(self, index: int, score: int) -> None:
+        """Record the answer to question ``index`` and prefetch what it implies."""
+        with self._cond:
+            if index in self._answered or index >= len(self._asked):
+                return
+            self._answered[index] = int(score)
+            self._scores[self._asked_axes[index]].append(int(score))
+            if self.policy.next_axis(self._scores) is None:
+                return
+            # Fetch in rounds, once no open axis has a question left, so the
+            # open axes share one request.
+            if any(len(s) < self.policy.min_per_axis for s in self._scores.values()):
+                return
+            due = [axis for axis in AXES if not self.policy.stopped(self._scores[axis])]
+            if all(self._needs_question(axis) for axis in due):
+                self._generate(due)
+
+    @property
+    def done(self) -> bool:
+        with self._cond:
+            return (
+                len(self._answered) == len(self._asked)
+                and self.policy.next_axis(self._scores) is None
+            )
+
+    @property
+    def total(self) -> int:
+        with self._cond:
+            return len(self._answered) + self.policy.remaining(self._scores)
+
+    def questions(self, timeout: float | None = None) -> List[dict]:
+        """Return the questions asked so far, in order."""
+        with self._cond:
+            return list(self._asked)
+
+    def stats(self) -> Dict[str, int]:
+        """Return questions asked, generated and generated but never asked."""
+        with self._cond:
+            unused = sum(len(qs) for qs in self._pool.values()) + sum(self._inflight.values())
+            return {"asked": len(self._asked), "generated": self.generated, "unused": unused}
+
+
+_refill_worker: question_bank.RefillWorker | None = None
+
+
+async def _generate_bank_question_async(axis: str, category: str, existing: List[str]) -> dict:
+    temp = random.uniform(0.4, 0.8)
+    # Never bank fallback questions; an empty text is skipped by the refill.
+    with tracing.context(job="bank", axis=axis):
+        return await _generate_unique_question_async(
+            axis, existing, temp, category, use_fallback=False
+        )
+
+
+def start_bank_refill() -> question_bank.RefillWorker:
+    """Start the background question bank refill worker once per process."""
+    global _refill_worker
+    if _refill_worker is None or not _refill_worker.is_alive():
+        _refill_worker = question_bank.RefillWorker(_generate_bank_question_async)
+        _refill_worker.start()
+    return _refill_worker
 
 
 def score_answers(responses: List[dict]) -> Dict[str, float]:
@@ -211,8 +893,14 @@ def score_answers(responses: List[dict]) -> Dict[str, float]:
     return averages
 
 
-def radar_chart(scores: Dict[str, float]) -> go.Figure:
+def radar_chart(scores: Dict[str, float]) -> "go.Figure":
     """Create a radar chart from axis scores."""
+    # plotly uses pandas if it is in ``sys.modules``; importing it here waits
+    # for another script thread that may be importing it, rather than letting
+    # plotly see a partially initialised module.
+    import pandas  # noqa: F401
+    import plotly.graph_objects as go
+
     categories = list(scores.keys())
     values = list(scores.values())
     values.append(values[0])
@@ -0,0 +1,254 @@
+"""Offline batch re-scoring and re-summarising of stored sessions.
+
+After a change to ``prompts.evaluation_summary`` or ``feedback_for_staff`` the
+stored results of earlier sessions can be regenerated with::
+
+    python rescore.py                      # summaries and staff reports
+    python rescore.py --steps staff --concurrency 8
+    python rescore.py --restart            # ignore the previous checkpoint
+
+Sessions are processed with at most ``--concurrency`` in flight through the
+async prompt functions.  Results are written back in batches of
+``--batch-size`` (one transaction or file write per batch) and every written
+session is appended to a checkpoint file, so an interrupted run continues
+where it stopped.  Sessions whose generation failed are not checkpointed and
+are retried by the next run.
+
+The ``summary`` step recomputes the axis scores from the stored answers, which
+needs the axis of every question; only the SQLite backend records it.  For
+sessions without axes the summary is kept and only the staff report is
+regenerated, from the stored summary.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, List, Set, Tuple
+
+import data_persistence
+import llm_client
+import prompts
+import questionnaire
+import tracing
+
+CHECKPOINT_PATH = data_persistence.DATA_DIR / "rescore_checkpoint.jsonl"
+STEPS = ("summary", "staff")
+
+
+@dataclass
+class Stats:
+    """Progress of one batch run."""
+
+    total: int = 0
+    already_done: int = 0
+    done: int = 0
+    failed: int = 0
+    unscorable: int = 0
+    elapsed: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def sessions_per_min(self) -> float:
+        return self.done / self.elapsed * 60 if self.elapsed else 0.0
+
+
+def load_checkpoint(path: Path) -> Set[Tuple[str, str]]:
+    """Return the ``(user_id, timestamp)`` of sessions already written back."""
+    done: Set[Tuple[str, str]] = set()
+    if not path.exists():
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partially written line
+            done.add((entry["user_id"], entry["timestamp"]))
+    return done
+
+
+def write_back(results: List[dict], checkpoint: Path) -> None:
+    """Persist a batch of results, then record its sessions as done."""
+    data_persistence.update_sessions([r for r in results if "evaluation_summary" in r])
+    data_persistence.save_reports(
+        [
+            {
+                "user_id": r["user_id"],
+                "timestamp": r["timestamp"],
+                "report_type": data_persistence.STAFF_REPORT,
+                "content": r["staff_report"],
+            }
+            for r in results
+            if "staff_report" in r
+        ]
+    )
+    with open(checkpoint, "a", encoding="utf-8") as f:
+        for r in results:
+            f.write(json.dumps({"user_id": r["user_id"], "timestamp": r["timestamp"]}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class UnscorableSession(ValueError):
+    """The session has no answers with a known axis to score."""
+
+
+async def process_session(session: dict, steps: Iterable[str], cache: bool = True) -> dict:
+    """Regenerate the requested results of one stored session.
+
+    A session without axis data keeps its summary and still gets the other
+    steps; the result then lacks ``evaluation_summary``.  Raises
+    :class:`RuntimeError` when a generation failed and
+    :class:`UnscorableSession` when the summary was the only step requested
+    and there is nothing to score.
+    """
+    result = {"user_id": session["user_id"], "timestamp": session["timestamp"]}
+    summary = session["evaluation_summary"]
+    answers = [
+        {"axis": a["axis"], "score": a["answer_text"]}
+        for a in session["answers"]
+        if a["axis"] and str(a["answer_text"]).strip().isdigit()
+    ]
+    if not answers and set(steps) == {"summary"}:
+        raise UnscorableSession("no answers with a known axis")
+    if "summary" in steps and answers:
+        scores = questionnaire.score_answers(answers)
+        summary = await prompts.evaluation_summary_async(scores, cache=cache, use_fallback=False)
+        if prompts.is_error(summary):
+            raise RuntimeError(summary)
+        result.update(evaluation_summary=summary, scores=scores)
+    if "staff" in steps:
+        report = await prompts.feedback_for_staff_async(summary, cache=cache)
+        if prompts.is_error(report):
+            raise RuntimeError(report)
+        result["staff_report"] = report
+    return result
+
+
+async def run(
+    sessions: List[dict],
+    steps: Iterable[str] = STEPS,
+    concurrency: int = 4,
+    batch_size: int = 20,
+    checkpoint: Path | None = None,
+    cache: bool = True,
+    progress=None,
+) -> Stats:
+    """Process ``sessions`` not yet in ``checkpoint`` and write results back.
+
+    ``progress`` is called with the :class:`Stats` after every batch.
+    """
+    checkpoint = checkpoint or CHECKPOINT_PATH
+    steps = tuple(steps)
+    done = load_checkpoint(checkpoint)
+    todo = [s for s in sessions if (s["user_id"], s["timestamp"]) not in done]
+    stats = Stats(total=len(sessions), already_done=len(sessions) - len(todo))
+    pending: List[dict] = []
+    lock = asyncio.Lock()
+    start = time.perf_counter()
+
+    async def flush() -> None:
+        nonlocal pending
+        async with lock:
+            batch, pending = pending, []
+            if batch:
+                await asyncio.to_thread(write_back, batch, checkpoint)
+                stats.done += len(batch)
+                stats.elapsed = time.perf_counter() - start
+                if progress is not None:
+                    progress(stats)
+
+    async def worker(queue: Iterable[dict]) -> None:
+        for session in queue:
+            while not llm_client.available():
+                await asyncio.sleep(1.0)  # let the circuit breaker cool down
+            try:
+                result = await process_session(session, steps, cache)
+            except UnscorableSession:
+                stats.unscorable += 1
+                continue
+            except Exception as e:  # not checkpointed, so retried by the next run
+                stats.failed += 1
+                stats.errors.append(f"{session['user_id']} {session['timestamp']}: {e}")
+                continue
+            if "summary" in steps and "evaluation_summary" not in result:
+                stats.unscorable += 1  # summary kept, other steps regenerated
+            pending.append(result)
+            if len(pending) >= batch_size:
+                await flush()
+
+    queue = iter(todo)
+    with tracing.context(job="rescore"):
+        try:
+            await asyncio.gather(*(worker(queue) for _ in range(max(1, concurrency))))
+            await flush()
+        finally:
+            if pending:  # interrupted: keep what was already generated
+                write_back(pending, checkpoint)
+                stats.done += len(pending)
+                pending = []
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Regenerate summaries and staff reports.")
+    parser.add_argument("--steps", nargs="+", choices=STEPS, default=list(STEPS))
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--checkpoint", type=Path, default=CHECKPOINT_PATH)
+    parser.add_argument("--restart", action="store_true", help="discard the checkpoint")
+    parser.add_argument("--limit", type=int, help="process at most this many sessions")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the LLM response cache")
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default=data_persistence.BACKEND)
+    args = parser.parse_args()
+
+    data_persistence.BACKEND = args.backend
+    if args.restart and args.checkpoint.exists():
+        args.checkpoint.unlink()
+    sessions = data_persistence.load_sessions()[: args.limit]
+    if "summary" in args.steps and args.backend != "sqlite":
+        print(
+            "note: the CSV backend stores no question axes; summaries are kept"
+            " and only staff reports are regenerated"
+        )
+
+    def report(stats: Stats) -> None:
+        todo = stats.total - stats.already_done
+        print(
+            f"{stats.done}/{todo} sessions written ({stats.sessions_per_min:.1f}/min),"
+            f" {stats.failed} failed"
+        )
+
+    try:
+        stats = asyncio.run(
+            run(
+                sessions,
+                args.steps,
+                args.concurrency,
+                args.batch_size,
+                args.checkpoint,
+                cache=not args.no_cache,
+                progress=report,
+            )
+        )
+    except KeyboardInterrupt:
+        print("interrupted; run again to resume from the checkpoint")
+        raise SystemExit(130)
+    print(
+        f"done: {stats.done} written, {stats.already_done} already done, {stats.failed} failed,"
+        f" {stats.unscorable} summaries kept for lack of axis data in {stats.elapsed:.1f}s"
+        f" ({stats.sessions_per_min:.1f} sessions/min)"
+    )
+    for error in stats.errors[:5]:
+        print("  " + error)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Local character n-gram TF-IDF similarity for deduplicating questions."""
+
+from __future__ import annotations
+
+import re
+import zlib
+from typing import Iterable, List
+
+import numpy as np
+
+# Cosine similarity at or above THRESHOLD counts as a duplicate; scores in
+# [AMBIGUOUS_LOW, THRESHOLD) may be settled by an optional LLM tie-break.
+THRESHOLD = 0.5
+AMBIGUOUS_LOW = 0.3
+NGRAM_SIZES = (2, 3)
+DIMENSIONS = 4096
+
+_STRIP = re.compile(r"[\s、。，．,.!?！？「」『』（）()・]+")
+
+
+def _ngrams(text: str) -> List[str]:
+    text = _STRIP.sub("", text)
+    grams: List[str] = []
+    for n in NGRAM_SIZES:
+        grams.extend(text[i : i + n] for i in range(max(len(text) - n + 1, 0)))
+    return grams or ([text] if text else [])
+
+
+def _hash_counts(text: str) -> np.ndarray:
+    vec = np.zeros(DIMENSIONS, dtype=np.float32)
+    for gram in _ngrams(text):
+        vec[zlib.crc32(gram.encode("utf-8")) % DIMENSIONS] += 1.0
+    return vec
+
+
+class SimilarityIndex:
+    """Hashed n-gram count matrix scored with TF-IDF cosine similarity.
+
+    Raw counts are stored so IDF weights can be recomputed as questions are
+    added; scoring a candidate against every stored text is a single
+    matrix-vector product.
+    """
+
+    def __init__(self, texts: Iterable[str] = ()) -> None:
+        self.texts: List[str] = []
+        self._counts = np.zeros((0, DIMENSIONS), dtype=np.float32)
+        for t in texts:
+            self.add(t)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def add(self, text: str) -> None:
+        self.texts.append(text)
+        self._counts = np.vstack([self._counts, _hash_counts(text)])
+
+    def scores(self, text: str) -> np.ndarray:
+        """Return cosine similarity of ``text`` against every indexed text."""
+        if not self.texts:
+            return np.zeros(0, dtype=np.float32)
+        query = _hash_counts(text)
+        df = np.count_nonzero(self._counts, axis=0) + (query > 0)
+        idf = np.log((len(self.texts) + 2) / (df + 1)) + 1.0
+        matrix = self._counts * idf
+        vec = query * idf
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vec)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sims = np.where(norms > 0, matrix @ vec / norms, 0.0)
+        return sims.astype(np.float32)
+
+    def ambiguous(self, text: str, threshold: float = THRESHOLD, low: float = AMBIGUOUS_LOW) -> List[str]:
+        """Return indexed texts whose score falls in the ambiguous band."""
+        sims = self.scores(text)
+        return [self.texts[i] for i in np.flatnonzero((sims >= low) & (sims < threshold))]
+
+    def is_duplicate(self, text: str, threshold: float = THRESHOLD) -> bool:
+        sims = self.scores(text)
+        return bool(sims.size and sims.max() >= threshold)
@@ -0,0 +1,451 @@
+"""SQLite storage engine used by :mod:`data_persistence`.
+
+Every function takes the database path explicitly so the module has no
+knowledge of where data lives.  Connections are cached per thread and opened
+in WAL mode so readers never block the writer.  Databases created with the
+original flat ``interactions`` table are upgraded to the normalised schema the
+first time they are opened.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+_local = threading.local()
+
+SCHEMA_VERSION = 2
+
+# Sessions, questions and answers are normalised: the summary is stored once
+# per session and each distinct question text once, keyed by a content hash.
+# The ``interactions`` view reconstructs the legacy one-row-per-answer layout.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    start_timestamp TEXT NOT NULL,
+    total_question_count INTEGER NOT NULL,
+    evaluation_summary TEXT NOT NULL,
+    scores TEXT,
+    UNIQUE (user_id, start_timestamp)
+);
+CREATE INDEX IF NOT EXISTS sessions_timestamp ON sessions (start_timestamp);
+CREATE TABLE IF NOT EXISTS questions (
+    hash TEXT PRIMARY KEY,
+    question_text TEXT NOT NULL,
+    axis TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    question_hash TEXT NOT NULL REFERENCES questions (hash),
+    answer_text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answers_session ON answers (session_id);
+CREATE VIEW IF NOT EXISTS interactions AS
+    SELECT a.id AS id,
+           s.start_timestamp AS timestamp,
+           s.user_id AS user_id,
+           q.question_text AS question_text,
+           a.answer_text AS answer_text,
+           s.total_question_count AS total_question_count,
+           s.evaluation_summary AS evaluation_summary,
+           q.axis AS axis,
+           a.session_id AS session_id
+    FROM answers a
+    JOIN sessions s ON s.id = a.session_id
+    JOIN questions q ON q.hash = a.question_hash;
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    user_name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    report_type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_session ON reports (user_id, timestamp, report_type);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+INTERACTION_COLUMNS = [
+    "timestamp",
+    "user_id",
+    "question_text",
+    "answer_text",
+    "total_question_count",
+    "evaluation_summary",
+]
+
+
+def question_hash(text: str) -> str:
+    """Return the content hash used as the primary key of a question."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    """Create the schema statement by statement, inside any open transaction
+    (``executescript`` would commit it first)."""
+    for statement in SCHEMA.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def _upgrade_flat_interactions(conn: sqlite3.Connection) -> None:
+    """Move rows from the version 1 flat ``interactions`` table into the
+    normalised tables."""
+    row = conn.execute(
+        "SELECT type FROM sqlite_master WHERE name = 'interactions'"
+    ).fetchone()
+    if row is None or row[0] != "table":
+        return
+    conn.execute("ALTER TABLE interactions RENAME TO interactions_v1")
+    conn.execute("DROP INDEX IF EXISTS interactions_user")
+    conn.execute("DROP INDEX IF EXISTS interactions_session")
+    conn.execute("DROP INDEX IF EXISTS interactions_timestamp")
+    _create_schema(conn)
+    cols = ", ".join(INTERACTION_COLUMNS)
+    rows = conn.execute(f"SELECT {cols} FROM interactions_v1 ORDER BY id").fetchall()
+    _insert_rows(conn, [dict(zip(INTERACTION_COLUMNS, r)) for r in rows])
+    conn.execute("DROP TABLE interactions_v1")
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    """Return this thread's connection to ``path``, creating the schema once."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    key = str(path)
+    conn = conns.get(key)
+    if conn is None:
+        conn = sqlite3.connect(key, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            # One explicit transaction: DDL would otherwise autocommit, and an
+            # interrupted upgrade must leave the version 1 table untouched.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-check under the write lock: another process may have won.
+                if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                    _upgrade_flat_interactions(conn)
+                    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            except BaseException:
+                conn.rollback()
+                conn.close()
+                raise
+            conn.commit()
+        conn.executescript(SCHEMA)
+        conns[key] = conn
+    return conn
+
+
+def close_all() -> None:
+    """Close the connections cached by the calling thread."""
+    for conn in getattr(_local, "conns", {}).values():
+        conn.close()
+    _local.conns = {}
+
+
+def _insert_rows(
+    conn: sqlite3.Connection,
+    rows: list[dict],
+    scores: dict | None = None,
+    skip_existing: bool = False,
+) -> None:
+    """Insert legacy-shaped rows, creating sessions and questions as needed.
+
+    Rows sharing ``user_id`` and ``timestamp`` belong to one session.  Rows may
+    carry an optional ``axis`` which is stored with the question.  With
+    ``skip_existing`` the rows of a session that is already stored are
+    dropped, so saving a whole session twice does not duplicate its answers.
+    """
+    session_ids: dict[tuple[str, str], int] = {}
+    skipped: set[tuple[str, str]] = set()
+    for row in rows:
+        session_key = (row["user_id"], row["timestamp"])
+        if session_key in skipped:
+            continue
+        session_id = session_ids.get(session_key)
+        if session_id is None:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO sessions (user_id, start_timestamp,"
+                " total_question_count, evaluation_summary, scores) VALUES (?, ?, ?, ?, ?)",
+                (
+                    row["user_id"],
+                    row["timestamp"],
+                    int(row["total_question_count"]),
+                    row["evaluation_summary"],
+                    json.dumps(scores, ensure_ascii=False) if scores else None,
+                ),
+            )
+            if skip_existing and cur.rowcount == 0:
+                skipped.add(session_key)
+                continue
+            session_id = conn.execute(
+                "SELECT id FROM sessions WHERE user_id = ? AND start_timestamp = ?",
+                session_key,
+            ).fetchone()[0]
+            session_ids[session_key] = session_id
+        qhash = question_hash(row["question_text"])
+        conn.execute(
+            "INSERT INTO questions (hash, question_text, axis) VALUES (?, ?, ?)"
+            " ON CONFLICT (hash) DO UPDATE SET axis = COALESCE(questions.axis, excluded.axis)",
+            (qhash, row["question_text"], row.get("axis")),
+        )
+        conn.execute(
+            "INSERT INTO answers (session_id, question_hash, answer_text) VALUES (?, ?, ?)",
+            (session_id, qhash, row["answer_text"]),
+        )
+
+
+def save_interaction(path: Path, row: dict) -> None:
+    conn = connect(path)
+    with conn:
+        _insert_rows(conn, [row])
+
+
+def save_interactions(path: Path, rows: list[dict], scores: dict | None = None) -> None:
+    """Insert all rows of a session, and its axis scores, in one transaction.
+
+    A session that is already stored is left unchanged.
+    """
+    conn = connect(path)
+    with conn:
+        _insert_rows(conn, rows, scores, skip_existing=True)
+
+
+def save_sessions(path: Path, sessions: list[tuple[list[dict], dict | None]]) -> None:
+    """Insert the ``(rows, scores)`` of several sessions in one transaction.
+
+    Sessions that are already stored are left unchanged.
+    """
+    conn = connect(path)
+    with conn:
+        for rows, scores in sessions:
+            _insert_rows(conn, rows, scores, skip_existing=True)
+
+
+def save_user(path: Path, user_id: str, user_name: str) -> None:
+    save_users(path, [(user_id, user_name)])
+
+
+def save_users(path: Path, users: list[tuple[str, str]]) -> None:
+    """Insert several ``(user_id, user_name)`` pairs, keeping existing names."""
+    conn = connect(path)
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO users (user_id, user_name) VALUES (?, ?)", users)
+
+
+def get_user_name(path: Path, user_id: str) -> str | None:
+    row = connect(path).execute(
+        "SELECT user_name FROM users WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def get_question_history(path: Path, user_id: str) -> list[str]:
+    rows = connect(path).execute(
+        "SELECT question_text FROM interactions WHERE user_id = ? ORDER BY id", (user_id,)
+    )
+    return [r[0] for r in rows]
+
+
+def save_report(path: Path, row: dict) -> None:
+    save_reports(path, [row])
+
+
+def save_reports(path: Path, rows: list[dict]) -> None:
+    """Insert several reports in one transaction."""
+    conn = connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO reports (timestamp, user_id, report_type, content, created_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (
+                (r["timestamp"], r["user_id"], r["report_type"], r["content"], r["created_at"])
+                for r in rows
+            ),
+        )
+
+
+def get_report(path: Path, user_id: str, start_timestamp: str, report_type: str) -> str | None:
+    row = connect(path).execute(
+        "SELECT content FROM reports WHERE user_id = ? AND timestamp = ? AND report_type = ?"
+        " ORDER BY id DESC LIMIT 1",
+        (user_id, start_timestamp, report_type),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def load_sessions(path: Path) -> list[dict]:
+    """Return every session with its answers, oldest first.
+
+    Each session holds ``user_id``, ``timestamp``, ``evaluation_summary`` and
+    ``answers``, a list of ``question_text``/``answer_text``/``axis`` dicts.
+    """
+    conn = connect(path)
+    sessions = {
+        sid: {"user_id": user_id, "timestamp": ts, "evaluation_summary": summary, "answers": []}
+        for sid, user_id, ts, summary in conn.execute(
+            "SELECT id, user_id, start_timestamp, evaluation_summary FROM sessions ORDER BY id"
+        )
+    }
+    rows = conn.execute(
+        "SELECT a.session_id, q.question_text, a.answer_text, q.axis FROM answers a"
+        " JOIN questions q ON q.hash = a.question_hash ORDER BY a.id"
+    )
+    for sid, question_text, answer_text, axis in rows:
+        sessions[sid]["answers"].append(
+            {"question_text": question_text, "answer_text": answer_text, "axis": axis}
+        )
+    return list(sessions.values())
+
+
+def sessions_revision(path: Path) -> int:
+    """Return a counter bumped by every :func:`update_sessions` call.
+
+    Rows are otherwise only appended, so incremental readers that fetch rows
+    by id reload everything when this changes.
+    """
+    row = connect(path).execute(
+        "SELECT value FROM meta WHERE key = 'sessions_revision'"
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def update_sessions(path: Path, updates: list[dict]) -> None:
+    """Replace the summary, and scores when given, of sessions in one transaction."""
+    conn = connect(path)
+    with conn:
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('sessions_revision', 1)"
+            " ON CONFLICT (key) DO UPDATE SET value = value + 1"
+        )
+        conn.executemany(
+            "UPDATE sessions SET evaluation_summary = ?, scores = COALESCE(?, scores)"
+            " WHERE user_id = ? AND start_timestamp = ?",
+            (
+                (
+                    u["evaluation_summary"],
+                    json.dumps(u["scores"], ensure_ascii=False) if u.get("scores") else None,
+                    u["user_id"],
+                    u["timestamp"],
+                )
+                for u in updates
+            ),
+        )
+
+
+def load_interactions(path: Path, after_id: int = 0):
+    """Return interactions with ``id > after_id`` as a DataFrame.
+
+    The frame holds the row ``id`` followed by the legacy CSV columns.
+    """
+    import pandas as pd
+
+    return pd.read_sql_query(
+        f"SELECT id, {', '.join(INTERACTION_COLUMNS)} FROM interactions WHERE id > ? ORDER BY id",
+        connect(path),
+        params=(after_id,),
+    )
+
+
+def load_answers(path: Path, after_id: int = 0):
+    """Return numeric answers with a known axis and ``id > after_id``.
+
+    Columns are ``id``, ``session_id``, ``user_id``, ``timestamp``, ``axis``
+    and the integer ``score``.
+    """
+    import pandas as pd
+
+    return pd.read_sql_query(
+        "SELECT a.id AS id, a.session_id AS session_id, s.user_id AS user_id,"
+        " s.start_timestamp AS timestamp, q.axis AS axis,"
+        " CAST(a.answer_text AS INTEGER) AS score"
+        " FROM answers a"
+        " JOIN sessions s ON s.id = a.session_id"
+        " JOIN questions q ON q.hash = a.question_hash"
+        " WHERE a.id > ? AND q.axis IS NOT NULL ORDER BY a.id",
+        connect(path),
+        params=(after_id,),
+    )
+
+
+def migrate_from_csv(
+    path: Path, csv_path: Path, users_path: Path, reports_path: Path | None = None
+) -> dict[str, int]:
+    """Copy existing CSV data into the database in a single transaction.
+
+    Tables that already contain rows are left untouched so the migration can
+    safely be run more than once.  Returns the number of rows copied per table.
+    """
+    conn = connect(path)
+    copied = {"interactions": 0, "users": 0, "reports": 0}
+
+    def empty(table: str) -> bool:
+        return conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None
+
+    def read(csv_file: Path | None) -> list[dict]:
+        if csv_file is None or not csv_file.exists():
+            return []
+        with csv_file.open(newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+
+    with conn:
+        if empty("answers"):
+            rows = read(csv_path)
+            _insert_rows(conn, rows)
+            copied["interactions"] = len(rows)
+        if empty("users"):
+            rows = read(users_path)
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (user_id, user_name) VALUES (?, ?)",
+                ((r["user_id"], r["user_name"]) for r in rows),
+            )
+            copied["users"] = len(rows)
+        if empty("reports"):
+            rows = read(reports_path)
+            now = datetime.now(timezone.utc).isoformat()
+            conn.executemany(
+                "INSERT INTO reports (timestamp, user_id, report_type, content, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (
+                    (r["timestamp"], r["user_id"], r["report_type"], r["content"], r.get("created_at") or now)
+                    for r in rows
+                ),
+            )
+            copied["reports"] = len(rows)
+    return copied
+
+
+def main() -> None:
+    import data_persistence
+
+    parser = argparse.ArgumentParser(description="Migrate CSV data into SQLite.")
+    parser.add_argument("--db", type=Path, default=data_persistence.DB_PATH)
+    args = parser.parse_args()
+    copied = migrate_from_csv(
+        args.db,
+        data_persistence.CSV_PATH,
+        data_persistence.USERS_PATH,
+        data_persistence.REPORTS_PATH,
+    )
+    for table, n in copied.items():
+        print(f"{table}: {n} rows")
+
+
+if __name__ == "__main__":
+    main()
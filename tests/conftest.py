@@ -0,0 +1,14 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import tracing
+
+
+@pytest.fixture(autouse=True)
+def _trace_to_tmp(tmp_path, monkeypatch):
+    """Keep trace records written by any test out of the repository."""
+    monkeypatch.setattr(tracing, "TRACE_PATH", tmp_path / "trace.jsonl")
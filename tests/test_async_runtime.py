@@ -0,0 +1,84 @@
+import sys
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import async_runtime
+import llm_client
+
+
+def test_calls_share_one_loop_and_its_clients(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+    async def current():
+        return asyncio.get_running_loop(), llm_client.get_async_client()
+
+    first_loop, first_client = async_runtime.run(current())
+    second_loop, second_client = async_runtime.run(current())
+    assert first_loop is second_loop
+    assert first_client is second_client
+    assert async_runtime.get_loop() is first_loop
+
+
+def test_submit_returns_pollable_future():
+    release = threading.Event()
+
+    async def wait():
+        await asyncio.to_thread(release.wait)
+        return 42
+
+    future = async_runtime.submit(wait())
+    assert not future.done()
+    release.set()
+    assert future.result(timeout=5) == 42
+
+
+def test_run_from_loop_thread_is_rejected():
+    async def nested():
+        coro = asyncio.sleep(0)
+        try:
+            async_runtime.run(coro)
+        finally:
+            coro.close()
+
+    with pytest.raises(RuntimeError):
+        async_runtime.run(nested())
+
+
+def test_iterate_yields_items_and_propagates_errors():
+    async def numbers():
+        for i in range(3):
+            await asyncio.sleep(0)
+            yield i
+
+    assert list(async_runtime.iterate(numbers())) == [0, 1, 2]
+
+    async def failing():
+        yield "a"
+        raise ValueError("boom")
+
+    items = async_runtime.iterate(failing())
+    assert next(items) == "a"
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def test_iterate_finishes_generator_when_reader_stops():
+    finished = threading.Event()
+
+    async def numbers():
+        try:
+            for i in range(3):
+                await asyncio.sleep(0.01)
+                yield i
+        finally:
+            finished.set()
+
+    items = async_runtime.iterate(numbers())
+    assert next(items) == 0
+    items.close()
+    assert finished.wait(5)
@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import cohort
+import data_persistence
+
+AXES = ["A", "B"]
+
+
+def _answers(rows, start_id=1):
+    df = pd.DataFrame(rows, columns=["session_id", "axis", "score"])
+    df.insert(0, "id", range(start_id, start_id + len(df)))
+    df["user_id"] = "u" + df["session_id"].astype(str)
+    df["timestamp"] = "t"
+    return df
+
+
+def test_score_cohort_means_percentiles_and_z():
+    answers = _answers([
+        (1, "A", 1), (1, "A", 3), (1, "B", 5),
+        (2, "A", 4), (2, "B", 1),
+        (3, "A", 5),
+    ])
+    result = cohort.score_cohort(answers, AXES)
+    assert result["means"].loc[1, "A"] == 2.0
+    assert np.isnan(result["means"].loc[3, "B"])
+    assert result["percentiles"].loc[3, "A"] == 100.0
+    z = result["z_scores"]["A"]
+    assert abs(z.mean()) < 1e-9
+    assert z.loc[1] < 0 < z.loc[3]
+
+
+def test_incremental_update_matches_batch():
+    first = _answers([(1, "A", 2), (2, "A", 4), (1, "B", 3)])
+    second = _answers([(1, "A", 4), (3, "B", 5)], start_id=4)
+    stats = cohort.Cohort(AXES)
+    stats.update(first)
+    stats.update(second)
+    stats.update(second)  # already seen rows are ignored
+    expected = cohort.score_cohort(pd.concat([first, second]), AXES)
+    pd.testing.assert_frame_equal(stats.scores()["means"], expected["means"], check_names=False)
+    assert stats.last_id == 5
+    assert stats.session_id("u1", "t") == 1
+    assert stats.position(1).loc["A", "score"] == 3.0
+
+
+def test_load_answers_from_sqlite(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_persistence, "BACKEND", "sqlite")
+    monkeypatch.setattr(data_persistence, "DB_PATH", tmp_path / "db.sqlite3")
+    data_persistence.save_session("u", [("q1", "2"), ("q2", "5")], "s", "t", axes=AXES)
+    answers = data_persistence.load_answers()
+    assert list(answers["axis"]) == AXES
+    assert list(answers["score"]) == [2, 5]
+    assert data_persistence.load_answers(after_id=int(answers["id"].max())).empty
@@ -45,3 +45,92 @@ def test_get_question_history(tmp_path, monkeypatch):
     data_persistence.save_interaction("u1", "q3", "a", 1, "s", start_timestamp=ts)
     history = data_persistence.get_question_history("u1")
     assert history == ["q1", "q3"]
+
+
+def test_save_and_get_report(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_persistence, "REPORTS_PATH", tmp_path / "reports.csv")
+    ts = "2024-01-01T00:00:00+00:00"
+    assert data_persistence.get_report("u", ts, "staff") is None
+    data_persistence.save_report("u", ts, "staff", "first")
+    data_persistence.save_report("u", "other", "staff", "other")
+    data_persistence.save_report("u", ts, "staff", "second")
+    assert data_persistence.get_report("u", ts, "staff") == "second"
+    assert data_persistence.get_report("u", ts, "patient") is None
+
+
+def test_save_session_writes_all_rows(tmp_path, monkeypatch):
+    path = tmp_path / "interactions.csv"
+    monkeypatch.setattr(data_persistence, "CSV_PATH", path)
+    ts = "2024-01-01T00:00:00+00:00"
+    data_persistence.save_interaction("u0", "q0", "1", 1, "s0", start_timestamp=ts)
+    data_persistence.save_session("u1", [("q1", "3"), ("q2", "4")], "s1", start_timestamp=ts)
+    rows = list(csv.DictReader(path.open(newline="", encoding="utf-8")))
+    assert [r["question_text"] for r in rows] == ["q0", "q1", "q2"]
+    assert rows[1]["total_question_count"] == "2"
+    assert rows[2]["evaluation_summary"] == "s1"
+
+
+def _stress_writer(worker: int, csv_path, users_path) -> None:
+    data_persistence.CSV_PATH = csv_path
+    data_persistence.USERS_PATH = users_path
+    for i in range(20):
+        data_persistence.save_user(f"user{i % 5}", f"name{worker}")
+        data_persistence.save_session(
+            f"w{worker}", [(f"q{worker}-{i}-{j}" * 50, str(j)) for j in range(15)], "s" * 500
+        )
+        data_persistence.save_interaction(f"w{worker}", f"single{worker}-{i}", "1", 1, "s")
+
+
+def test_concurrent_writers_do_not_interleave(tmp_path):
+    import multiprocessing
+
+    import pytest
+
+    try:
+        ctx = multiprocessing.get_context("fork")
+    except ValueError:
+        pytest.skip("fork start method not available")
+    csv_path = tmp_path / "interactions.csv"
+    users_path = tmp_path / "users.csv"
+    procs = [
+        ctx.Process(target=_stress_writer, args=(w, csv_path, users_path)) for w in range(8)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+        assert p.exitcode == 0
+    rows = list(csv.DictReader(csv_path.open(newline="", encoding="utf-8")))
+    assert len(rows) == 8 * 20 * 16
+    assert all(r["evaluation_summary"] == "s" * 500 or r["evaluation_summary"] == "s" for r in rows)
+    users = list(csv.DictReader(users_path.open(newline="", encoding="utf-8")))
+    assert sorted(u["user_id"] for u in users) == [f"user{i}" for i in range(5)]
+
+
+def test_load_interactions_parses_only_appended_rows(tmp_path, monkeypatch):
+    import pandas as pd
+
+    monkeypatch.setattr(data_persistence, "CSV_PATH", tmp_path / "interactions.csv")
+    monkeypatch.setattr(data_persistence, "_interactions_cache", {})
+    assert data_persistence.load_interactions() is None
+    data_persistence.save_session("007", [("q1", "3"), ("q2", "4")], "s1", "t1")
+    df = data_persistence.load_interactions()
+    assert len(df) == 2
+    assert isinstance(df["user_id"].dtype, pd.CategoricalDtype)
+    assert df["user_id"][0] == "007"
+    assert data_persistence.load_interactions() is df
+
+    parsed = []
+    real_read_csv = pd.read_csv
+
+    def counting_read_csv(buf, *args, **kwargs):
+        frame = real_read_csv(buf, *args, **kwargs)
+        parsed.append(len(frame))
+        return frame
+
+    monkeypatch.setattr(pd, "read_csv", counting_read_csv)
+    data_persistence.save_session("u2", [("q1", "5")], "s2", "t2")
+    df = data_persistence.load_interactions()
+    assert parsed == [1]
+    assert list(df["question_text"]) == ["q1", "q2", "q1"]
+    assert list(df.columns) == data_persistence.COLUMNS
@@ -0,0 +1,33 @@
+import sys
+import subprocess
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _loaded_after(module: str) -> set:
+    code = (
+        "import sys, warnings, logging; warnings.simplefilter('ignore');"
+        "logging.disable(logging.WARNING);"
+        f"sys.path.insert(0, {str(ROOT)!r}); import {module}; print(' '.join(sys.modules))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=ROOT
+    ).stdout
+    return set(out.split())
+
+
+@pytest.mark.parametrize(
+    "module, forbidden",
+    [
+        ("app", {"pandas", "openai", "questionnaire", "prompts", "cohort"}),
+        ("data_persistence", {"pandas", "openai"}),
+        ("tracing", {"pandas", "openai"}),
+        ("write_queue", {"pandas", "openai"}),
+        ("questionnaire", {"pandas", "plotly.graph_objects"}),
+    ],
+)
+def test_heavy_dependencies_load_lazily(module, forbidden):
+    assert not forbidden & _loaded_after(module)
@@ -0,0 +1,37 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import llm_cache
+
+
+def test_get_put_and_counters(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "CACHE_PATH", tmp_path / "cache.sqlite3")
+    llm_cache.clear()
+    key = llm_cache.make_key("m", [{"role": "user", "content": "x"}], 0.1)
+    assert key != llm_cache.make_key("m", [{"role": "user", "content": "x"}], 0.2)
+    assert llm_cache.get(key) is None
+    llm_cache.put(key, "value")
+    assert llm_cache.get(key) == "value"
+    stats = llm_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_ttl_expiry(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "CACHE_PATH", tmp_path / "cache.sqlite3")
+    llm_cache.put("k", "v")
+    monkeypatch.setattr(llm_cache, "TTL_SECONDS", -1)
+    assert llm_cache.get("k") is None
+
+
+def test_lru_eviction_by_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "CACHE_PATH", tmp_path / "cache.sqlite3")
+    monkeypatch.setattr(llm_cache, "MAX_BYTES", 10)
+    llm_cache.put("a", "aaaa")
+    llm_cache.put("b", "bbbb")
+    assert llm_cache.get("a") == "aaaa"  # a is now more recently used than b
+    llm_cache.put("c", "cccc")
+    assert llm_cache.get("b") is None
+    assert llm_cache.get("a") == "aaaa"
+    assert llm_cache.get("c") == "cccc"
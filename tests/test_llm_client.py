@@ -0,0 +1,283 @@
+import sys
+import json
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import openai
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import llm_cache
+import llm_client
+import prompts
+import tracing
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible chat completion endpoint."""
+
+    responses: list = []
+    requests: list = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).requests.append(body)
+        status, content, *delay = type(self).responses.pop(0)
+        if delay:
+            time.sleep(delay[0])
+        if status == 200 and body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for piece in content:
+                chunk = {
+                    "id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m",
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+        if status == 200:
+            payload = {
+                "id": "c", "object": "chat.completion", "created": 0, "model": "m",
+                "choices": [{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }],
+            }
+        else:
+            payload = {"error": {"message": content, "type": "rate_limit"}}
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    StubHandler.responses = []
+    StubHandler.requests = []
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setattr(llm_client, "BACKOFF_BASE", 0.0)
+    monkeypatch.setattr(llm_cache, "CACHE_PATH", tmp_path / "cache.sqlite3")
+    llm_client.reset()
+    yield StubHandler
+    server.shutdown()
+    llm_client.reset()
+
+
+def test_client_is_reused(stub_server):
+    assert llm_client.get_client() is llm_client.get_client()
+
+
+def test_retries_rate_limit_then_succeeds(stub_server):
+    stub_server.responses = [(429, "slow down"), (200, " hello ")]
+    assert prompts._call_openai([{"role": "user", "content": "hi"}], 0.1) == "hello"
+    assert len(stub_server.requests) == 2
+
+
+def test_async_gives_up_after_max_retries(stub_server, monkeypatch):
+    monkeypatch.setattr(llm_client, "MAX_RETRIES", 1)
+    stub_server.responses = [(429, "a"), (429, "b")]
+    result = asyncio.run(prompts._acall_openai([{"role": "user", "content": "hi"}], 0.1))
+    assert result.startswith("APIError")
+    assert len(stub_server.requests) == 2
+
+
+def test_missing_api_key_raises(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    with pytest.raises(ValueError):
+        llm_client.get_client()
+
+
+def test_deterministic_calls_are_cached(stub_server):
+    stub_server.responses = [(200, "report")]
+    assert asyncio.run(prompts.feedback_for_staff_async("summary")) == "report"
+    assert asyncio.run(prompts.feedback_for_staff_async("summary")) == "report"
+    assert len(stub_server.requests) == 1
+    assert llm_cache.stats()["entries"] == 1
+
+
+def test_question_generation_bypasses_cache(stub_server):
+    stub_server.responses = [(200, "q1"), (200, "q2")]
+    axis = next(iter(prompts.AXIS_CATEGORIES))
+    first = asyncio.run(prompts.generate_question_async(axis, category="c"))
+    second = asyncio.run(prompts.generate_question_async(axis, category="c"))
+    assert (first, second) == ("q1", "q2")
+    assert llm_cache.stats()["entries"] == 0
+
+
+def test_streaming_yields_chunks_and_caches_full_text(stub_server):
+    stub_server.responses = [(200, [" Hel", "lo", " there"])]
+
+    async def collect():
+        return [c async for c in prompts.feedback_for_patient_stream("summary", "Taro")]
+
+    assert asyncio.run(collect()) == ["Hel", "lo", " there"]
+    assert stub_server.requests[0]["stream"] is True
+    # The completed text is cached for the non-streaming variant.
+    assert asyncio.run(prompts.feedback_for_patient_async("summary", "Taro")) == "Hello there"
+    assert len(stub_server.requests) == 1
+
+
+def test_stream_failing_midway_raises_with_partial_text(monkeypatch):
+    async def broken(model, messages, temperature, caller=None):
+        yield '{"risk_profile_summary": "abc'
+        raise openai.OpenAIError("boom")
+
+    monkeypatch.setattr(llm_client, "astream_chat_completion", broken)
+    monkeypatch.setattr(llm_cache, "ENABLED", False)
+
+    async def collect(stream):
+        return [c async for c in stream]
+
+    with pytest.raises(prompts.StreamError) as info:
+        asyncio.run(collect(prompts.feedback_for_staff_stream("summary")))
+    assert info.value.partial == '{"risk_profile_summary": "abc'
+    # A patient stream that fails after text arrived is not padded with the fallback.
+    with pytest.raises(prompts.StreamError):
+        asyncio.run(collect(prompts.feedback_for_patient_stream("summary", "Taro")))
+
+
+def test_cache_access_does_not_block_the_event_loop(monkeypatch):
+    def slow_get(key):
+        time.sleep(0.3)
+        return "cached"
+
+    monkeypatch.setattr(llm_cache, "ENABLED", True)
+    monkeypatch.setattr(llm_cache, "get", slow_get)
+
+    async def run():
+        call = asyncio.create_task(prompts._acall_openai([{"role": "user", "content": "hi"}], 0.1))
+        start = time.monotonic()
+        await asyncio.sleep(0.05)
+        ticked = time.monotonic() - start
+        return ticked, await call
+
+    ticked, result = asyncio.run(run())
+    assert result == "cached"
+    assert ticked < 0.2
+
+
+def test_hedged_request_wins_over_slow_primary(stub_server):
+    stub_server.responses = [(200, "slow", 2.0), (200, "fast")]
+    for _ in range(llm_client.HEDGE_MIN_SAMPLES):
+        llm_client._record_latency(0.01)
+    start = time.monotonic()
+    result = asyncio.run(prompts._acall_openai([{"role": "user", "content": "hi"}], 0.1))
+    assert result == "fast"
+    assert time.monotonic() - start < 1.5
+    assert llm_client.hedge_count() == 1
+    assert len(stub_server.requests) == 2
+    calls = tracing.load()
+    calls = calls[calls["event"] == "llm_call"]
+    assert len(calls) == 2
+    assert calls["cancelled"].fillna(False).astype(bool).sum() == 1
+
+
+def test_hedge_delay_is_tracked_per_caller():
+    for _ in range(llm_client.HEDGE_MIN_SAMPLES):
+        llm_client._record_latency(0.01, "similarity")
+        llm_client._record_latency(3.0, "feedback_for_staff_async")
+    assert llm_client.hedge_delay("similarity") == llm_client.HEDGE_MIN_DELAY
+    assert llm_client.hedge_delay("feedback_for_staff_async") == 3.0
+    assert llm_client.hedge_delay("evaluation_summary_async") is None
+    llm_client.reset()
+
+
+def test_waiting_for_a_slot_is_not_endpoint_latency(stub_server, monkeypatch):
+    stub_server.responses = [(200, "ok", 0.3)] * 6
+    monkeypatch.setattr(llm_client, "_slots", threading.BoundedSemaphore(1))
+    breaker = llm_client.CircuitBreaker(window=4, min_calls=2, slow_call=0.5)
+    monkeypatch.setattr(llm_client, "breaker", breaker)
+
+    async def run():
+        return await asyncio.gather(*(
+            llm_client.achat_completion(prompts.MODEL, [{"role": "user", "content": "hi"}], 0.1)
+            for _ in range(6)
+        ))
+
+    assert asyncio.run(run()) and len(stub_server.requests) == 6
+    assert breaker.state == "closed"
+    assert max(llm_client._latencies[None]) < 0.5
+
+
+def test_deadline_bounds_slow_call(stub_server):
+    stub_server.responses = [(200, "late", 2.0)]
+
+    async def call():
+        return await llm_client.achat_completion(
+            prompts.MODEL, [{"role": "user", "content": "hi"}], 0.1, deadline=0.3
+        )
+
+    start = time.monotonic()
+    with pytest.raises(llm_client.DeadlineExceeded):
+        asyncio.run(call())
+    assert time.monotonic() - start < 1.5
+
+
+def test_circuit_breaker_trips_and_recovers():
+    breaker = llm_client.CircuitBreaker(window=4, min_calls=2, cooldown=0.05)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()  # single probe
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_slow_calls_count_as_failures():
+    breaker = llm_client.CircuitBreaker(window=4, min_calls=2, slow_call=1.0)
+    breaker.record(True, latency=5.0)
+    breaker.record(True, latency=5.0)
+    assert breaker.state == "open"
+
+
+def test_open_breaker_falls_back_without_calling_api(stub_server, monkeypatch):
+    monkeypatch.setattr(llm_cache, "ENABLED", False)
+    for _ in range(llm_client.breaker.min_calls):
+        llm_client.breaker.record(False)
+    feedback = asyncio.run(prompts.feedback_for_patient_async("summary", "Taro"))
+    assert feedback == prompts.fallback.patient_feedback("Taro")
+    assert prompts.evaluation_summary({"a": 3.0}).startswith("自動要約")
+    assert stub_server.requests == []
+
+
+def test_calls_are_traced_with_context(stub_server):
+    stub_server.responses = [(429, "slow down"), (200, "report")]
+
+    async def run():
+        with tracing.context(session="s1"):
+            await prompts.feedback_for_staff_async("summary")
+            await prompts.feedback_for_staff_async("summary")
+
+    asyncio.run(run())
+    records = tracing.load()
+    assert list(records["caller"]) == ["feedback_for_staff_async"] * 3
+    assert list(records["attempt"].fillna(-1)) == [0, 1, -1]
+    assert list(records["error"].fillna("")) == ["RateLimitError", "", ""]
+    assert list(records["cache_hit"]) == [False, False, True]
+    assert set(records["session"]) == {"s1"}
+    summary = tracing.summarise(records)
+    assert summary["calls"] == 2
+    assert summary["cache_hits"] == 1
+    assert summary["errors"] == 1
+    assert summary["calls_per_session"]["mean"] == 2
@@ -0,0 +1,109 @@
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import data_persistence
+import pipeline
+import prompts
+import questionnaire
+import write_queue
+
+
+def test_branches_run_concurrently_and_persist(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_persistence, "CSV_PATH", tmp_path / "interactions.csv")
+    monkeypatch.setattr(data_persistence, "REPORTS_PATH", tmp_path / "reports.csv")
+
+    async def summary(scores, temperature=0.1):
+        await asyncio.sleep(0.05)
+        return "summary"
+
+    async def staff(summary, temperature=0.1, cache=True):
+        await asyncio.sleep(0.3)
+        return '{"risk_profile_summary": "r"}'
+
+    async def patient_stream(summary, user_name=None, temperature=0.1):
+        for chunk in ["こんにちは", "、", f"{user_name}さん"]:
+            await asyncio.sleep(0.1)
+            yield chunk
+
+    monkeypatch.setattr(prompts, "evaluation_summary_async", summary)
+    monkeypatch.setattr(prompts, "feedback_for_staff_async", staff)
+    monkeypatch.setattr(prompts, "feedback_for_patient_stream", patient_stream)
+
+    questions = [{"question_text": f"q{i}", "axis": a} for i, a in enumerate(questionnaire.AXES)]
+    answers = [{"axis": q["axis"], "score": 3} for q in questions]
+    result = asyncio.run(
+        pipeline.run_post_questionnaire(questions, answers, "u1", "Taro", "t1")
+    )
+    assert result.summary == "summary"
+    assert result.patient_feedback == "こんにちは、Taroさん"
+    assert set(result.scores.values()) == {3.0}
+    assert result.timings["total"] < 0.05 + 0.3 + 0.3
+    assert {"summary", "staff_report", "patient_feedback"} <= set(result.timings)
+    write_queue.flush()
+    assert data_persistence.get_report("u1", "t1", pipeline.STAFF_REPORT) == result.staff_report
+    assert data_persistence.get_report("u1", "t1", pipeline.PATIENT_FEEDBACK) == result.patient_feedback
+    assert data_persistence.get_question_history("u1") == [q["question_text"] for q in questions]
+
+
+def test_interrupted_patient_stream_is_not_stored(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_persistence, "CSV_PATH", tmp_path / "interactions.csv")
+    monkeypatch.setattr(data_persistence, "REPORTS_PATH", tmp_path / "reports.csv")
+
+    async def summary(scores, temperature=0.1):
+        return "summary"
+
+    async def staff(summary, temperature=0.1, cache=True):
+        return "report"
+
+    async def patient_stream(summary, user_name=None, temperature=0.1):
+        yield "こんに"
+        raise prompts.StreamError("APIError: boom", "こんに")
+
+    monkeypatch.setattr(prompts, "evaluation_summary_async", summary)
+    monkeypatch.setattr(prompts, "feedback_for_staff_async", staff)
+    monkeypatch.setattr(prompts, "feedback_for_patient_stream", patient_stream)
+
+    questions = [{"question_text": "q0", "axis": questionnaire.AXES[0]}]
+    answers = [{"axis": questionnaire.AXES[0], "score": 3}]
+    result = asyncio.run(pipeline.run_post_questionnaire(questions, answers, "u1", "Taro", "t1"))
+    write_queue.flush()
+    assert result.patient_feedback == "こんに"
+    assert data_persistence.get_report("u1", "t1", pipeline.PATIENT_FEEDBACK) is None
+    assert data_persistence.get_report("u1", "t1", pipeline.STAFF_REPORT) == "report"
+
+
+def test_rerun_without_persist_stores_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_persistence, "CSV_PATH", tmp_path / "interactions.csv")
+    monkeypatch.setattr(data_persistence, "REPORTS_PATH", tmp_path / "reports.csv")
+
+    async def summary(scores, temperature=0.1):
+        return "summary"
+
+    async def staff(summary, temperature=0.1, cache=True):
+        return "report"
+
+    async def patient_stream(summary, user_name=None, temperature=0.1):
+        yield "こんにちは"
+
+    monkeypatch.setattr(prompts, "evaluation_summary_async", summary)
+    monkeypatch.setattr(prompts, "feedback_for_staff_async", staff)
+    monkeypatch.setattr(prompts, "feedback_for_patient_stream", patient_stream)
+
+    questions = [{"question_text": "q0", "axis": questionnaire.AXES[0]}]
+    answers = [{"axis": questionnaire.AXES[0], "score": 3}]
+
+    async def run(persist):
+        result = pipeline.PipelineResult()
+        async for _ in pipeline.stream_post_questionnaire(
+            questions, answers, "u1", "Taro", "t1", result, persist=persist
+        ):
+            pass
+        return result
+
+    assert asyncio.run(run(persist=False)).patient_feedback == "こんにちは"
+    write_queue.flush()
+    assert data_persistence.load_sessions() == []
+    assert data_persistence.get_report("u1", "t1", pipeline.STAFF_REPORT) is None
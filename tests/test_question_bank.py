@@ -0,0 +1,51 @@
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import question_bank
+import questionnaire
+
+
+def test_add_and_draw_removes_questions(tmp_path, monkeypatch):
+    monkeypatch.setattr(question_bank, "BANK_PATH", tmp_path / "bank.json")
+    axis = questionnaire.AXES[0]
+    cat = question_bank.prompts.AXIS_CATEGORIES[axis][0]
+    assert question_bank.add(axis, cat, ["q1", "q2", "q2", "q 1"]) == 2
+    drawn = question_bank.draw([axis], 3)
+    assert sorted(q["question_text"] for q in drawn[axis]) == ["q1", "q2"]
+    assert all(q["axis"] == axis for q in drawn[axis])
+    assert question_bank.counts()[axis][cat] == 0
+
+
+def test_refill_tops_up_low_categories(tmp_path, monkeypatch):
+    monkeypatch.setattr(question_bank, "BANK_PATH", tmp_path / "bank.json")
+    calls = []
+
+    async def fake_generate(axis, category, existing):
+        calls.append(axis)
+        return {"question_text": f"{axis}-{category}-{len(existing)}", "axis": axis}
+
+    assert question_bank.needs_refill()
+    asyncio.run(question_bank.refill_async(fake_generate, target=question_bank.LOW_WATER_MARK))
+    assert not question_bank.needs_refill()
+    n_cats = sum(len(c) for c in question_bank.prompts.AXIS_CATEGORIES.values())
+    assert len(calls) == n_cats * question_bank.LOW_WATER_MARK
+
+
+def test_generate_questionnaire_uses_bank(tmp_path, monkeypatch):
+    monkeypatch.setattr(question_bank, "BANK_PATH", tmp_path / "bank.json")
+    for axis in questionnaire.AXES:
+        cats = question_bank.prompts.AXIS_CATEGORIES[axis]
+        for i, cat in enumerate(cats):
+            question_bank.add(axis, cat, [f"{axis}{i}a", f"{axis}{i}b"])
+
+    async def fail_gen(*args, **kwargs):
+        raise AssertionError("live generation should not run")
+
+    monkeypatch.setattr(questionnaire.prompts, "generate_question_async", fail_gen)
+    qs = questionnaire.generate_questionnaire()
+    assert len(qs) == 15
+    assert [q["axis"] for q in qs] == [a for a in questionnaire.AXES for _ in range(3)]
+    assert len({q["question_text"] for q in qs}) == 15
@@ -1,6 +1,9 @@
 import sys
+import time
 from pathlib import Path
 
+import pytest
+
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
 import questionnaire
@@ -17,13 +20,20 @@ def test_score_answers():
     assert scores["情動の不安定性"] == 3
 
 
-def test_generate_questionnaire_count(monkeypatch):
+def test_generate_questionnaire_count(tmp_path, monkeypatch):
     import prompts
+    import question_bank
+
+    monkeypatch.setattr(question_bank, "BANK_PATH", tmp_path / "bank.json")
 
     async def dummy_gen(axis: str, category: str | None = None, temperature: float = 0.4) -> str:
         return '{"question_text": "dummy", "axis": "' + axis + '"}'
 
+    async def dummy_batch(*args, **kwargs) -> str:
+        return "APIError: unavailable"
+
     monkeypatch.setattr(prompts, "generate_question_async", dummy_gen)
+    monkeypatch.setattr(prompts, "generate_questions_batch_async", dummy_batch)
 
     async def dummy_similar(*args, **kwargs):
         return False
@@ -33,3 +43,336 @@ def test_generate_questionnaire_count(monkeypatch):
     assert len(qs) == 15
     axes = {q["axis"] for q in qs}
     assert axes == set(questionnaire.AXES)
+
+
+def test_generate_questionnaire_batched(tmp_path, monkeypatch):
+    import json
+    import prompts
+    import question_bank
+
+    monkeypatch.setattr(question_bank, "BANK_PATH", tmp_path / "bank.json")
+    calls = []
+
+    async def dummy_batch(axis_categories, temperature=0.6):
+        calls.append(axis_categories)
+        return json.dumps({
+            axis: [{"question_text": f"{axis}{i}", "axis": axis} for i in range(len(cats))]
+            for axis, cats in axis_categories.items()
+        })
+
+    async def fail_gen(*args, **kwargs):
+        raise AssertionError("per-question fallback should not run")
+
+    async def dummy_similar(text, existing):
+        return text in existing
+
+    monkeypatch.setattr(prompts, "generate_questions_batch_async", dummy_batch)
+    monkeypatch.setattr(prompts, "generate_question_async", fail_gen)
+    monkeypatch.setattr(questionnaire, "_is_similar_async", dummy_similar)
+    qs = questionnaire.generate_questionnaire(batch="all")
+    assert len(calls) == 1
+    assert len(qs) == 15
+    assert [q["axis"] for q in qs] == [a for a in questionnaire.AXES for _ in range(3)]
+
+
+def test_parse_batch_drops_invalid_items():
+    axis = questionnaire.AXES[0]
+    reply = (
+        '[{"question_text": "ok", "axis": "' + axis + '"}, '
+        '{"question_text": "", "axis": "' + axis + '"}, '
+        '{"question_text": "x", "axis": "unknown"}, "text"]'
+    )
+    assert questionnaire._parse_batch(reply, [axis]) == {axis: ["ok"]}
+
+
+def test_questionnaire_stream_delivers_first_question_early(tmp_path, monkeypatch):
+    import asyncio
+    import threading
+
+    import prompts
+    import question_bank
+
+    monkeypatch.setattr(question_bank, "BANK_PATH", tmp_path / "bank.json")
+    release = threading.Event()
+
+    async def gen(axis, category=None, temperature=0.4):
+        if axis != questionnaire.AXES[0]:
+            while not release.is_set():
+                await asyncio.sleep(0.01)
+        return '{"question_text": "' + axis + str(temperature) + '", "axis": "' + axis + '"}'
+
+    async def not_similar(*args, **kwargs):
+        return False
+
+    monkeypatch.setattr(prompts, "generate_question_async", gen)
+    monkeypatch.setattr(questionnaire, "_is_similar_async", not_similar)
+    stream = questionnaire.QuestionnaireStream(batch=None).start()
+    assert stream.get(0, timeout=5)["axis"] == questionnaire.AXES[0]
+    assert not stream.ready(3)
+    release.set()
+    qs = stream.questions(timeout=5)
+    assert [q["axis"] for q in qs] == [a for a in questionnaire.AXES for _ in range(3)]
+
+
+def test_speculative_candidates_take_first_unique(monkeypatch):
+    import asyncio
+    import prompts
+
+    started = []
+    cancelled = []
+
+    async def gen(axis, category=None, temperature=0.4):
+        started.append(temperature)
+        # The highest-temperature candidate answers first; the others hang.
+        if len(started) < 3:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(temperature)
+                raise
+        return '{"question_text": "fast", "axis": "' + axis + '"}'
+
+    async def not_similar(*args, **kwargs):
+        return False
+
+    monkeypatch.setattr(prompts, "generate_question_async", gen)
+    monkeypatch.setattr(questionnaire, "_is_similar_async", not_similar)
+    questionnaire.reset_speculation_stats()
+
+    async def run():
+        q = await questionnaire._generate_unique_question_async("a", [], 0.4, "c", k=3)
+        await asyncio.sleep(0)
+        return q
+
+    q = asyncio.run(run())
+    assert q["question_text"] == "fast"
+    assert len(started) == 3
+    assert len(cancelled) == 2
+    stats = questionnaire.speculation_stats()
+    assert stats["slots"] == 1
+    assert stats["requested"] == 3
+    assert stats["cancelled"] == 2
+
+
+def test_speculative_rounds_bound_total_attempts(monkeypatch):
+    import asyncio
+    import prompts
+
+    calls = []
+
+    async def gen(axis, category=None, temperature=0.4):
+        calls.append(temperature)
+        return '{"question_text": "dup", "axis": "' + axis + '"}'
+
+    async def similar(*args, **kwargs):
+        return True
+
+    monkeypatch.setattr(prompts, "generate_question_async", gen)
+    monkeypatch.setattr(questionnaire, "_is_similar_async", similar)
+    questionnaire.reset_speculation_stats()
+
+    q = asyncio.run(questionnaire._generate_unique_question_async("a", [], 0.4, "c", k=2))
+    assert q["question_text"] == "dup"
+    assert len(calls) == 6  # ceil(MAX_ATTEMPTS / k) rounds of k candidates
+    assert questionnaire.speculation_stats()["rejected"] == 6
+
+
+def test_api_errors_fall_back_to_curated_questions(monkeypatch):
+    import asyncio
+    import fallback
+    import prompts
+
+    async def failing(*args, **kwargs):
+        return "APIError: unavailable"
+
+    monkeypatch.setattr(prompts, "generate_question_async", failing)
+    axis = questionnaire.AXES[0]
+    existing = [fallback.QUESTIONS[axis][0]]
+    q = asyncio.run(questionnaire._generate_unique_question_async(axis, existing, 0.4, "c"))
+    assert q == {"question_text": fallback.QUESTIONS[axis][1], "axis": axis}
+    q = asyncio.run(
+        questionnaire._generate_unique_question_async(axis, [], 0.4, "c", use_fallback=False)
+    )
+    assert q["question_text"] == ""
+
+
+def test_stream_falls_back_when_generation_misses_deadline(tmp_path, monkeypatch):
+    import asyncio
+    import fallback
+    import prompts
+    import question_bank
+
+    monkeypatch.setattr(question_bank, "BANK_PATH", tmp_path / "bank.json")
+
+    async def hang(*args, **kwargs):
+        await asyncio.sleep(0.5)
+        return '{"question_text": "late", "axis": "x"}'
+
+    async def not_similar(*args, **kwargs):
+        return False
+
+    monkeypatch.setattr(prompts, "generate_question_async", hang)
+    monkeypatch.setattr(questionnaire, "_is_similar_async", not_similar)
+    stream = questionnaire.QuestionnaireStream(batch=None).start()
+    with pytest.raises(TimeoutError):
+        stream.get(0, timeout=0.01)
+    first = stream.get(0, timeout=0.05, use_fallback=True)
+    second = stream.get(1, timeout=0.05, use_fallback=True)
+    axis = questionnaire.AXES[0]
+    assert first["question_text"] in fallback.QUESTIONS[axis]
+    assert second["question_text"] in fallback.QUESTIONS[axis]
+    assert first != second
+    # Late generated questions do not replace what the patient already saw.
+    stream.questions(timeout=5)
+    assert stream.get(0) is first
+
+
+def test_adaptive_policy_stops_consistent_axes_early():
+    policy = questionnaire.AdaptivePolicy()
+    axes = questionnaire.AXES
+    assert policy.next_axis({}) == axes[0]
+    # Round-robin until every axis has the minimum.
+    assert policy.next_axis({axes[0]: [3]}) == axes[1]
+    consistent = {axis: [4, 4] for axis in axes}
+    assert policy.next_axis(consistent) is None
+    assert policy.remaining(consistent) == 0
+    mixed = dict(consistent, **{axes[2]: [1, 5], axes[3]: [2, 3]})
+    assert policy.next_axis(mixed) == axes[2]  # the widest interval first
+    mixed[axes[2]] += [3, 4]
+    assert policy.stopped(mixed[axes[2]])  # max_per_axis reached
+    assert policy.next_axis(mixed) == axes[3]
+    capped = {axis: [1, 5, 1] for axis in axes}
+    assert policy.next_axis(capped) is None  # max_questions reached
+
+
+def test_adaptive_questionnaire_asks_uncertain_axes_more(tmp_path, monkeypatch):
+    import prompts
+    import question_bank
+
+    monkeypatch.setattr(question_bank, "BANK_PATH", tmp_path / "bank.json")
+    counter = iter(range(1000))
+
+    async def gen(axis, category=None, temperature=0.4):
+        return '{"question_text": "q%d", "axis": "%s"}' % (next(counter), axis)
+
+    async def not_similar(*args, **kwargs):
+        return False
+
+    monkeypatch.setattr(prompts, "generate_question_async", gen)
+    monkeypatch.setattr(questionnaire, "_is_similar_async", not_similar)
+    noisy = questionnaire.AXES[1]
+    stream = questionnaire.AdaptiveQuestionnaire(batch=None).start()
+    index = 0
+    while index < stream.total:
+        q = stream.get(index, timeout=5)
+        with pytest.raises(IndexError):
+            stream.get(index + 1, timeout=0)
+        score = (1 if index % 2 else 5) if q["axis"] == noisy else 3
+        stream.answer(index, score)
+        stream.answer(index, 1)  # reruns may report an answer twice
+        index += 1
+    asked = [q["axis"] for q in stream.questions()]
+    assert stream.done and index == len(asked) == 12
+    assert asked.count(noisy) == 4
+    assert all(asked.count(axis) == 2 for axis in questionnaire.AXES if axis != noisy)
+    assert len({q["question_text"] for q in stream.questions()}) == 12
+    assert stream.stats()["unused"] == 0
+
+
+def _run_adaptive(stream, noisy, timeout=5):
+    """Answer ``stream`` to the end: ``noisy`` axes alternate 5 and 1."""
+    seen = {axis: 0 for axis in questionnaire.AXES}
+    index = 0
+    while index < stream.total:
+        axis = stream.get(index, timeout=timeout)["axis"]
+        stream.answer(index, (5 if seen[axis] % 2 else 1) if axis in noisy else 3)
+        seen[axis] += 1
+        index += 1
+    return seen
+
+
+def test_adaptive_extras_come_from_the_bank(tmp_path, monkeypatch):
+    import prompts
+    import question_bank
+
+    monkeypatch.setattr(question_bank, "BANK_PATH", tmp_path / "bank.json")
+    for axis in questionnaire.AXES:
+        for cat in prompts.AXIS_CATEGORIES.get(axis, ["一般"]):
+            question_bank.add(axis, cat, [f"{axis}/{cat}/{i}" for i in range(4)])
+
+    async def no_api(*args, **kwargs):
+        raise AssertionError("a warm bank needs no API call")
+
+    monkeypatch.setattr(prompts, "generate_question_async", no_api)
+    monkeypatch.setattr(prompts, "generate_questions_batch_async", no_api)
+    monkeypatch.setattr(questionnaire, "_is_similar_async", no_api)
+    noisy = questionnaire.AXES[:2]
+    seen = _run_adaptive(questionnaire.AdaptiveQuestionnaire().start(), noisy)
+    assert [seen[axis] for axis in questionnaire.AXES] == [4, 4, 2, 2, 2]
+
+
+def test_adaptive_extras_are_requested_together(tmp_path, monkeypatch):
+    import json
+    import prompts
+    import question_bank
+
+    monkeypatch.setattr(question_bank, "BANK_PATH", tmp_path / "bank.json")
+    calls = []
+
+    async def dummy_batch(axis_categories, temperature=0.6):
+        calls.append(sorted(axis_categories))
+        return json.dumps({
+            axis: [{"question_text": f"{axis}{len(calls)}-{i}", "axis": axis} for i in range(n)]
+            for axis, n in ((a, len(c)) for a, c in axis_categories.items())
+        })
+
+    async def not_similar(*args, **kwargs):
+        return False
+
+    monkeypatch.setattr(prompts, "generate_questions_batch_async", dummy_batch)
+    monkeypatch.setattr(questionnaire, "_is_similar_async", not_similar)
+    noisy = questionnaire.AXES[:3]
+    stream = questionnaire.AdaptiveQuestionnaire().start()
+    seen = _run_adaptive(stream, noisy)
+    # One request per axis for the minimum, then one per round for the axes
+    # still open; the last round fits only the two most uncertain in budget.
+    assert all(len(axes) == 1 for axes in calls[:5])
+    assert calls[5] == sorted(noisy)
+    assert len(calls) == 7 and len(calls[6]) == 2
+    assert sum(seen.values()) == 15
+    assert stream.stats()["unused"] == 0
+
+
+def test_adaptive_cancelled_generation_does_not_hang(tmp_path, monkeypatch):
+    import concurrent.futures
+    import prompts
+    import question_bank
+
+    monkeypatch.setattr(question_bank, "BANK_PATH", tmp_path / "bank.json")
+    counter = iter(range(1000))
+
+    async def gen(axis, category=None, temperature=0.4):
+        return '{"question_text": "q%d", "axis": "%s"}' % (next(counter), axis)
+
+    async def not_similar(*args, **kwargs):
+        return False
+
+    def cancelled(coro):
+        coro.close()
+        future = concurrent.futures.Future()
+        future.cancel()
+        return future
+
+    monkeypatch.setattr(prompts, "generate_question_async", gen)
+    monkeypatch.setattr(questionnaire, "_is_similar_async", not_similar)
+    stream = questionnaire.AdaptiveQuestionnaire(batch=None).start()
+    while stream.stats()["generated"] < 10:
+        time.sleep(0.01)
+    # Every later generation is cancelled before it runs.
+    monkeypatch.setattr(questionnaire.AdaptiveQuestionnaire, "_extra_async", lambda *a: None)
+    monkeypatch.setattr(questionnaire.async_runtime, "submit", cancelled)
+    for index in range(10):
+        stream.get(index, timeout=5)
+        stream.answer(index, 1 if index < 5 else 5)
+    with pytest.raises(RuntimeError):
+        stream.get(10, timeout=2)
@@ -0,0 +1,121 @@
+import sys
+import asyncio
+import csv
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import data_persistence
+import prompts
+import questionnaire
+import rescore
+import sqlite_storage
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_persistence, "BACKEND", "sqlite")
+    monkeypatch.setattr(data_persistence, "DB_PATH", tmp_path / "test.sqlite3")
+    axes = questionnaire.AXES
+    for i in range(5):
+        data_persistence.save_session(
+            f"u{i}", [(f"q{a}", str(i % 5 + 1)) for a in range(len(axes))], "old", f"t{i}", axes=axes
+        )
+    yield tmp_path
+    sqlite_storage.close_all()
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    calls = {"summary": 0, "staff": 0, "in_flight": 0, "max_in_flight": 0, "fail": set()}
+
+    async def summary(scores, temperature=0.1, cache=True, use_fallback=True):
+        calls["summary"] += 1
+        calls["in_flight"] += 1
+        calls["max_in_flight"] = max(calls["max_in_flight"], calls["in_flight"])
+        await asyncio.sleep(0.01)
+        calls["in_flight"] -= 1
+        score = next(iter(scores.values()))
+        if score in calls["fail"]:
+            return "APIError: boom"
+        return f"new {score:.0f}"
+
+    async def staff(summary, temperature=0.1, cache=True):
+        calls["staff"] += 1
+        return f"report for {summary}"
+
+    monkeypatch.setattr(prompts, "evaluation_summary_async", summary)
+    monkeypatch.setattr(prompts, "feedback_for_staff_async", staff)
+    return calls
+
+
+def test_rescores_and_writes_back(store, llm):
+    sessions = data_persistence.load_sessions()
+    stats = asyncio.run(
+        rescore.run(sessions, concurrency=2, batch_size=2, checkpoint=store / "ck.jsonl")
+    )
+    assert (stats.done, stats.failed) == (5, 0)
+    assert llm["max_in_flight"] == 2
+    summaries = {s["user_id"]: s["evaluation_summary"] for s in data_persistence.load_sessions()}
+    assert summaries == {f"u{i}": f"new {i % 5 + 1}" for i in range(5)}
+    assert data_persistence.get_report("u3", "t3", data_persistence.STAFF_REPORT) == "report for new 4"
+
+
+def test_resumes_from_checkpoint_and_retries_failures(store, llm):
+    checkpoint = store / "ck.jsonl"
+    llm["fail"] = {2.0}
+    stats = asyncio.run(rescore.run(data_persistence.load_sessions(), checkpoint=checkpoint))
+    assert (stats.done, stats.failed) == (4, 1)
+    assert len(rescore.load_checkpoint(checkpoint)) == 4
+
+    llm["fail"] = set()
+    llm["summary"] = 0
+    stats = asyncio.run(rescore.run(data_persistence.load_sessions(), checkpoint=checkpoint))
+    assert (stats.already_done, stats.done, llm["summary"]) == (4, 1, 1)
+
+
+def test_interrupted_run_keeps_generated_results(store, llm, monkeypatch):
+    checkpoint = store / "ck.jsonl"
+
+    async def staff(summary, temperature=0.1, cache=True):
+        if summary == "new 4":
+            raise KeyboardInterrupt
+        return "r"
+
+    monkeypatch.setattr(prompts, "feedback_for_staff_async", staff)
+    with pytest.raises(KeyboardInterrupt):
+        asyncio.run(
+            rescore.run(
+                data_persistence.load_sessions(), concurrency=1, batch_size=10,
+                checkpoint=checkpoint,
+            )
+        )
+    assert rescore.load_checkpoint(checkpoint) == {("u0", "t0"), ("u1", "t1"), ("u2", "t2")}
+
+
+def test_csv_backend_updates_summaries_in_place(tmp_path, monkeypatch, llm):
+    path = tmp_path / "interactions.csv"
+    monkeypatch.setattr(data_persistence, "CSV_PATH", path)
+    monkeypatch.setattr(data_persistence, "REPORTS_PATH", tmp_path / "reports.csv")
+    data_persistence.save_session("u1", [("q1", "1"), ("q2", "2")], "old", "t1")
+    data_persistence.save_session("u2", [("q1", "3")], "keep", "t2")
+
+    stats = asyncio.run(
+        rescore.run(data_persistence.load_sessions(), checkpoint=tmp_path / "ck.jsonl")
+    )
+    # CSV rows carry no axis: summaries are kept, staff reports regenerated.
+    assert (stats.unscorable, stats.done, llm["summary"], llm["staff"]) == (2, 2, 0, 2)
+    assert data_persistence.get_report("u2", "t2", data_persistence.STAFF_REPORT) == "report for keep"
+    with pytest.raises(rescore.UnscorableSession):
+        asyncio.run(rescore.process_session(data_persistence.load_sessions()[0], ["summary"]))
+
+    data_persistence.update_sessions(
+        [{"user_id": "u1", "timestamp": "t1", "evaluation_summary": "new"}]
+    )
+    rows = list(csv.DictReader(path.open(encoding="utf-8")))
+    assert [r["evaluation_summary"] for r in rows] == ["new", "new", "keep"]
+    assert data_persistence.load_interactions()["evaluation_summary"].tolist() == [
+        "new", "new", "keep"
+    ]
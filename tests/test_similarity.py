@@ -0,0 +1,40 @@
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import similarity
+import questionnaire
+
+EXISTING = [
+    "治療計画について事前に詳しく説明してほしいと思いますか？",
+    "待ち時間が長いと感じることがありますか？",
+]
+
+
+def test_scores_vectorized_against_all_texts():
+    index = similarity.SimilarityIndex(EXISTING)
+    sims = index.scores("待ち時間が長いと感じますか？")
+    assert sims.shape == (2,)
+    assert sims.argmax() == 1
+    assert sims[1] >= similarity.THRESHOLD
+    assert sims[0] < similarity.AMBIGUOUS_LOW
+
+
+def test_empty_index_is_never_duplicate():
+    assert not similarity.SimilarityIndex().is_duplicate("何でも")
+
+
+def test_is_similar_async_skips_llm_outside_band(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+    class Boom:
+        def __init__(self, *args, **kwargs):
+            raise AssertionError("LLM should not be called")
+
+    monkeypatch.setattr(questionnaire.openai, "AsyncOpenAI", Boom)
+    assert asyncio.run(questionnaire._is_similar_async("待ち時間が長いと感じますか？", EXISTING))
+    assert not asyncio.run(
+        questionnaire._is_similar_async("予約の変更は簡単にできるべきだと思いますか？", EXISTING)
+    )
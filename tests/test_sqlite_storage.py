@@ -0,0 +1,168 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import data_persistence
+import sqlite_storage
+
+
+def _use_sqlite(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_persistence, "BACKEND", "sqlite")
+    monkeypatch.setattr(data_persistence, "DB_PATH", tmp_path / "test.sqlite3")
+
+
+def test_sqlite_backend_roundtrip(tmp_path, monkeypatch):
+    _use_sqlite(tmp_path, monkeypatch)
+    ts = "2024-01-01T00:00:00+00:00"
+    data_persistence.save_user("abc", "Taro")
+    data_persistence.save_user("abc", "Jiro")
+    assert data_persistence.get_user_name("abc") == "Taro"
+    assert data_persistence.get_user_name("missing") is None
+    data_persistence.save_interaction("abc", "q1", "3", 2, "s", start_timestamp=ts)
+    data_persistence.save_interaction("xyz", "q2", "4", 2, "s", start_timestamp=ts)
+    data_persistence.save_interaction("abc", "q3", "5", 2, "s", start_timestamp=ts)
+    assert data_persistence.get_question_history("abc") == ["q1", "q3"]
+    data_persistence.save_report("abc", ts, "staff", "r1")
+    data_persistence.save_report("abc", ts, "staff", "r2")
+    assert data_persistence.get_report("abc", ts, "staff") == "r2"
+    df = data_persistence.load_interactions()
+    assert list(df.columns) == data_persistence.COLUMNS
+    assert len(df) == 3
+
+
+def test_sqlite_uses_wal_and_indexes(tmp_path):
+    conn = sqlite_storage.connect(tmp_path / "db.sqlite3")
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT question_text FROM interactions WHERE user_id = ?", ("u",)
+    ).fetchall()
+    assert "USING INDEX" in " ".join(str(r) for r in plan)
+
+
+def test_migrate_from_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_persistence, "CSV_PATH", tmp_path / "interactions.csv")
+    monkeypatch.setattr(data_persistence, "USERS_PATH", tmp_path / "users.csv")
+    monkeypatch.setattr(data_persistence, "REPORTS_PATH", tmp_path / "reports.csv")
+    ts = "2024-01-01T00:00:00+00:00"
+    data_persistence.save_user("u1", "Hanako")
+    data_persistence.save_interaction("u1", "q1", "2", 1, "s", start_timestamp=ts)
+    data_persistence.save_report("u1", ts, "staff", "r")
+    db = tmp_path / "db.sqlite3"
+    copied = sqlite_storage.migrate_from_csv(
+        db, data_persistence.CSV_PATH, data_persistence.USERS_PATH, data_persistence.REPORTS_PATH
+    )
+    assert copied == {"interactions": 1, "users": 1, "reports": 1}
+    again = sqlite_storage.migrate_from_csv(db, data_persistence.CSV_PATH, data_persistence.USERS_PATH)
+    assert again == {"interactions": 0, "users": 0, "reports": 0}
+    assert sqlite_storage.get_user_name(db, "u1") == "Hanako"
+    assert sqlite_storage.get_question_history(db, "u1") == ["q1"]
+
+
+def test_session_stored_once_and_questions_deduplicated(tmp_path, monkeypatch):
+    _use_sqlite(tmp_path, monkeypatch)
+    pairs = [("q1", "3"), ("q2", "4")]
+    data_persistence.save_session("u1", pairs, "summary", "t1", axes=["A", "B"], scores={"A": 3.0})
+    data_persistence.save_session("u2", pairs, "summary", "t2", axes=["A", "B"])
+    conn = sqlite_storage.connect(data_persistence.DB_PATH)
+    assert conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] == 4
+    assert conn.execute(
+        "SELECT axis FROM questions WHERE hash = ?", (sqlite_storage.question_hash("q2"),)
+    ).fetchone()[0] == "B"
+    df = data_persistence.load_interactions()
+    assert list(df["user_id"]) == ["u1", "u1", "u2", "u2"]
+    assert list(df["total_question_count"]) == [2, 2, 2, 2]
+
+
+def test_flat_schema_is_upgraded(tmp_path):
+    import sqlite3
+
+    db = tmp_path / "old.sqlite3"
+    conn = sqlite3.connect(db)
+    conn.executescript(
+        """
+        CREATE TABLE interactions (
+            id INTEGER PRIMARY KEY, timestamp TEXT, user_id TEXT, question_text TEXT,
+            answer_text TEXT, total_question_count INTEGER, evaluation_summary TEXT
+        );
+        CREATE INDEX interactions_user ON interactions (user_id);
+        INSERT INTO interactions VALUES (1, 't', 'u', 'q1', '1', 2, 's');
+        INSERT INTO interactions VALUES (2, 't', 'u', 'q2', '5', 2, 's');
+        """
+    )
+    conn.commit()
+    conn.close()
+    assert sqlite_storage.get_question_history(db, "u") == ["q1", "q2"]
+    conn = sqlite_storage.connect(db)
+    assert conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 1
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == sqlite_storage.SCHEMA_VERSION
+
+
+def test_interrupted_upgrade_keeps_the_flat_table(tmp_path, monkeypatch):
+    import sqlite3
+
+    db = tmp_path / "old.sqlite3"
+    conn = sqlite3.connect(db)
+    conn.executescript(
+        """
+        CREATE TABLE interactions (
+            id INTEGER PRIMARY KEY, timestamp TEXT, user_id TEXT, question_text TEXT,
+            answer_text TEXT, total_question_count INTEGER, evaluation_summary TEXT
+        );
+        INSERT INTO interactions VALUES (1, 't', 'u', 'q1', '1', 2, 's');
+        INSERT INTO interactions VALUES (2, 't', 'u', 'q2', '5', 2, 's');
+        """
+    )
+    conn.commit()
+    conn.close()
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr(sqlite_storage, "_insert_rows", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            sqlite_storage.connect(db)
+    conn = sqlite3.connect(db)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM interactions").fetchone()[0] == 2
+    conn.close()
+    assert sqlite_storage.get_question_history(db, "u") == ["q1", "q2"]
+
+
+def test_sqlite_batch_saves_use_one_transaction(tmp_path, monkeypatch):
+    _use_sqlite(tmp_path, monkeypatch)
+    data_persistence.save_users([("a", "Taro"), ("b", "Hanako"), ("a", "Jiro")])
+    data_persistence.save_sessions(
+        [
+            {"user_id": "a", "interactions": [("q1", "3")], "evaluation_summary": "s",
+             "start_timestamp": "t1", "axes": ["x"], "scores": {"x": 3.0}},
+            {"user_id": "b", "interactions": [("q1", "4"), ("q2", "5")],
+             "evaluation_summary": "s", "start_timestamp": "t2"},
+        ]
+    )
+    assert data_persistence.get_user_name("a") == "Taro"
+    sessions = data_persistence.load_sessions()
+    assert [len(s["answers"]) for s in sessions] == [1, 2]
+    assert sessions[0]["answers"][0]["axis"] == "x"
+
+
+def test_saving_a_session_twice_keeps_one_copy(tmp_path, monkeypatch):
+    _use_sqlite(tmp_path, monkeypatch)
+    for _ in range(2):
+        data_persistence.save_session("u", [("q1", "3"), ("q2", "4")], "s", "t1")
+    conn = sqlite_storage.connect(data_persistence.DB_PATH)
+    assert conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 1
+
+
+def test_loaded_interactions_reflect_updated_summaries(tmp_path, monkeypatch):
+    _use_sqlite(tmp_path, monkeypatch)
+    data_persistence.save_session("u", [("q1", "3"), ("q2", "4")], "old", "t1")
+    assert data_persistence.load_interactions()["evaluation_summary"].tolist() == ["old", "old"]
+    data_persistence.update_sessions([{"user_id": "u", "timestamp": "t1", "evaluation_summary": "new"}])
+    assert data_persistence.load_interactions()["evaluation_summary"].tolist() == ["new", "new"]
@@ -0,0 +1,49 @@
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import tracing
+
+
+def test_context_follows_tasks_and_threads():
+    async def leaf():
+        tracing.record("similarity", rejected=True)
+        await asyncio.to_thread(tracing.record, "similarity", rejected=False)
+
+    async def run():
+        await asyncio.gather(
+            tracing.bind(leaf(), axis="a"), tracing.bind(leaf(), axis="b")
+        )
+
+    asyncio.run(tracing.bind(run(), session="s"))
+    records = tracing.load()
+    assert sorted(records["axis"]) == ["a", "a", "b", "b"]
+    assert set(records["session"]) == {"s"}
+    assert tracing.current() == {}
+    assert tracing.summarise(records)["similarity_rejection_rate"] == 0.5
+
+
+def test_log_rotates(monkeypatch):
+    monkeypatch.setattr(tracing, "MAX_BYTES", 200)
+    for i in range(20):
+        tracing.record("llm_call", caller="c", latency=0.1 * i, cache_hit=False, error=None)
+    files = tracing.trace_files()
+    assert 1 < len(files) <= tracing.BACKUP_COUNT + 1
+    summary = tracing.summarise(tracing.load())
+    assert summary["calls"] == len(tracing.load())
+    assert summary["latency"]["p50"] <= summary["latency"]["p95"] <= summary["latency"]["p99"]
+
+
+def test_calls_per_session_leaves_out_background_jobs():
+    for session in ("p1", "p1", "p2"):
+        with tracing.context(session=session):
+            tracing.record("llm_call", caller="c", latency=0.1, cache_hit=False, error=None)
+    for _ in range(50):
+        with tracing.context(job="bank"):
+            tracing.record("llm_call", caller="c", latency=0.1, cache_hit=False, error=None)
+    summary = tracing.summarise(tracing.load())
+    assert summary["calls"] == 53
+    assert summary["calls_per_session"]["sessions"] == 2
+    assert summary["calls_per_session"]["mean"] == 1.5
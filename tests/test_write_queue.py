@@ -0,0 +1,145 @@
+import sys
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import data_persistence
+import write_queue
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_persistence, "CSV_PATH", tmp_path / "interactions.csv")
+    monkeypatch.setattr(data_persistence, "USERS_PATH", tmp_path / "users.csv")
+    monkeypatch.setattr(data_persistence, "REPORTS_PATH", tmp_path / "reports.csv")
+    monkeypatch.setattr(write_queue, "DEAD_LETTER_PATH", tmp_path / "dead_letter.jsonl")
+    monkeypatch.setattr(write_queue, "ENABLED", True)
+    yield tmp_path
+    assert write_queue.shutdown() == 0
+
+
+def test_batches_records_from_many_sessions(store, monkeypatch):
+    monkeypatch.setattr(write_queue, "MAX_DELAY", 0.5)
+    appends = []
+    append_bytes = data_persistence._append_bytes
+    monkeypatch.setattr(
+        data_persistence, "_append_bytes", lambda *a: appends.append(a[0]) or append_bytes(*a)
+    )
+    for i in range(10):
+        write_queue.save_user(f"u{i}", f"name{i}")
+        write_queue.save_session(f"u{i}", [("q1", "3"), ("q2", "4")], "summary", f"t{i}")
+        write_queue.save_report(f"u{i}", f"t{i}", data_persistence.STAFF_REPORT, f"report {i}")
+    write_queue.save_user("u0", "duplicate")
+    write_queue.flush()
+
+    assert sorted(appends) == sorted(
+        [data_persistence.USERS_PATH, data_persistence.CSV_PATH, data_persistence.REPORTS_PATH]
+    )
+    assert [s["timestamp"] for s in data_persistence.load_sessions()] == [f"t{i}" for i in range(10)]
+    assert data_persistence.get_user_name("u0") == "name0"
+    assert data_persistence.get_report("u9", "t9", data_persistence.STAFF_REPORT) == "report 9"
+
+
+def test_enqueue_does_not_wait_for_the_disk(store, monkeypatch):
+    save_reports = data_persistence.save_reports
+
+    def slow(reports, sync=True):
+        time.sleep(0.3)
+        save_reports(reports, sync)
+
+    monkeypatch.setattr(data_persistence, "save_reports", slow)
+    start = time.perf_counter()
+    future = write_queue.save_report("u1", "t1", data_persistence.STAFF_REPORT, "r")
+    assert time.perf_counter() - start < 0.05
+    future.result(timeout=5)
+    assert data_persistence.get_report("u1", "t1", data_persistence.STAFF_REPORT) == "r"
+    assert write_queue.stats()["latency"]["max"] >= 0.3
+
+
+def test_interval_policy_defers_fsync(store, monkeypatch):
+    monkeypatch.setattr(write_queue, "FSYNC", "interval")
+    monkeypatch.setattr(write_queue, "FSYNC_INTERVAL", 0.3)
+    monkeypatch.setattr(write_queue, "MAX_DELAY", 0.0)
+    fsyncs = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: fsyncs.append(fd) or fsync(fd))
+
+    for i in range(3):
+        write_queue.save_report("u1", f"t{i}", data_persistence.STAFF_REPORT, "r").result(5)
+    assert fsyncs == []
+    time.sleep(0.5)
+    assert len(fsyncs) == 1  # only the reports file exists
+
+
+def test_sqlite_batches_are_not_counted_as_fsyncs(store, monkeypatch):
+    monkeypatch.setattr(data_persistence, "BACKEND", "sqlite")
+    monkeypatch.setattr(data_persistence, "DB_PATH", store / "test.sqlite3")
+    fsyncs = write_queue.stats()["fsyncs"]
+    write_queue.save_report("u1", "t1", data_persistence.STAFF_REPORT, "r").result(5)
+    write_queue.flush(timeout=5)
+    assert write_queue.stats()["fsyncs"] == fsyncs
+    assert data_persistence.get_report("u1", "t1", data_persistence.STAFF_REPORT) == "r"
+
+
+def test_retries_failed_writes_and_drains_on_shutdown(store, monkeypatch):
+    monkeypatch.setattr(write_queue, "MAX_DELAY", 5.0)
+    save_sessions = data_persistence.save_sessions
+    calls = []
+
+    def flaky(sessions, sync=True):
+        calls.append(len(sessions))
+        if len(calls) == 1:
+            raise OSError("disk busy")
+        save_sessions(sessions, sync)
+
+    monkeypatch.setattr(data_persistence, "save_sessions", flaky)
+    futures = [write_queue.save_session(f"u{i}", [("q", "1")], "s", f"t{i}") for i in range(3)]
+    assert write_queue.shutdown() == 0
+    assert calls == [3, 3]
+    assert all(f.done() and f.exception() is None for f in futures)
+    assert len(data_persistence.load_sessions()) == 3
+
+
+def test_failing_writes_are_retried_until_they_succeed(store, monkeypatch):
+    monkeypatch.setattr(write_queue, "RETRY_MAX_DELAY", 0.05)
+    save_reports = data_persistence.save_reports
+    calls = []
+
+    def locked(reports, sync=True):
+        calls.append(len(reports))
+        if len(calls) <= 2 * write_queue.RETRIES:
+            raise OSError("database is locked")
+        save_reports(reports, sync)
+
+    monkeypatch.setattr(data_persistence, "save_reports", locked)
+    failed = write_queue.stats()["failed"]
+    write_queue.save_report("u1", "t1", data_persistence.STAFF_REPORT, "r").result(timeout=5)
+    assert len(calls) == 2 * write_queue.RETRIES + 1
+    assert data_persistence.get_report("u1", "t1", data_persistence.STAFF_REPORT) == "r"
+    stats = write_queue.stats()
+    assert stats["failed"] == failed and stats["retrying"] == 0
+
+
+def test_unwritten_records_are_replayed_by_the_next_start(store, monkeypatch):
+    save_reports = data_persistence.save_reports
+
+    def full(reports, sync=True):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(data_persistence, "save_reports", full)
+    future = write_queue.save_report("u1", "t1", data_persistence.STAFF_REPORT, "r")
+    time.sleep(0.3)
+    assert write_queue.stats()["pending"] == 1
+    assert write_queue.shutdown() == 0
+    assert isinstance(future.exception(), OSError)
+    assert write_queue.stats()["dead_letter"] == 1
+
+    monkeypatch.setattr(data_persistence, "save_reports", save_reports)
+    write_queue.start()
+    write_queue.flush(timeout=5)
+    assert data_persistence.get_report("u1", "t1", data_persistence.STAFF_REPORT) == "r"
+    assert not write_queue.DEAD_LETTER_PATH.exists()
@@ -0,0 +1,196 @@
+"""Tracing of LLM calls to a rotating JSON Lines log plus summary metrics.
+
+Every chat completion attempt, cache hit and similarity decision is written as
+one JSON object per line to ``TRACE_PATH``.  Fields describing where a call
+comes from (session, axis) are carried in context variables, so they follow
+the work into asyncio tasks and ``asyncio.to_thread`` without being passed
+through every function.  ``session`` identifies a patient session; background
+work such as bank refills sets ``job`` instead, so it does not count as one.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Awaitable, Dict, Iterator, List, TypeVar
+
+import data_persistence
+
+TRACE_PATH = data_persistence.DATA_DIR / "llm_trace.jsonl"
+ENABLED = os.getenv("LLM_TRACE", "1") != "0"
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 3
+
+CONTEXT_FIELDS = ("session", "axis", "job")
+
+T = TypeVar("T")
+
+_context: Dict[str, contextvars.ContextVar] = {
+    name: contextvars.ContextVar(f"trace_{name}", default=None) for name in CONTEXT_FIELDS
+}
+_handler_lock = threading.Lock()
+_handler: logging.handlers.RotatingFileHandler | None = None
+_logger = logging.getLogger("llm_trace")
+_logger.propagate = False
+_logger.setLevel(logging.INFO)
+
+
+def _get_handler() -> logging.Handler:
+    """Return the file handler, reopening it if ``TRACE_PATH`` changed."""
+    global _handler
+    with _handler_lock:
+        if _handler is None or _handler.baseFilename != os.path.abspath(TRACE_PATH):
+            if _handler is not None:
+                _logger.removeHandler(_handler)
+                _handler.close()
+            _handler = logging.handlers.RotatingFileHandler(
+                TRACE_PATH, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding="utf-8"
+            )
+            _handler.setFormatter(logging.Formatter("%(message)s"))
+            _logger.addHandler(_handler)
+        return _handler
+
+
+def current() -> Dict[str, str]:
+    """Return the context fields set for the running code."""
+    return {name: var.get() for name, var in _context.items() if var.get() is not None}
+
+
+def set_context(**fields: str) -> None:
+    """Set context fields for the rest of the current task or thread."""
+    for name, value in fields.items():
+        _context[name].set(value)
+
+
+@contextmanager
+def context(**fields: str) -> Iterator[None]:
+    """Set context fields for the duration of a ``with`` block."""
+    tokens = [(_context[name], _context[name].set(value)) for name, value in fields.items()]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+async def bind(aw: Awaitable[T], **fields: str) -> T:
+    """Await ``aw`` with context fields set, e.g. on another thread's loop."""
+    set_context(**fields)
+    return await aw
+
+
+async def bind_stream(agen: AsyncIterator[T], **fields: str) -> AsyncIterator[T]:
+    """Iterate ``agen`` with context fields set."""
+    set_context(**fields)
+    async for item in agen:
+        yield item
+
+
+def record(event: str, **fields) -> None:
+    """Append one trace record with the current context fields."""
+    if not ENABLED:
+        return
+    entry = {"ts": time.time(), "event": event, **current(), **fields}
+    _get_handler()
+    _logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+def record_completion(
+    caller: str | None,
+    attempt: int,
+    latency: float,
+    response=None,
+    error: BaseException | None = None,
+    **fields,
+) -> None:
+    """Record one chat completion attempt, with token usage when available."""
+    usage = getattr(response, "usage", None)
+    record(
+        "llm_call",
+        caller=caller,
+        attempt=attempt,
+        latency=round(latency, 4),
+        prompt_tokens=getattr(usage, "prompt_tokens", None),
+        completion_tokens=getattr(usage, "completion_tokens", None),
+        cache_hit=False,
+        error=type(error).__name__ if error is not None else None,
+        **fields,
+    )
+
+
+def trace_files() -> List:
+    """Return the current log and its rotated backups, oldest first."""
+    paths = [TRACE_PATH.with_name(f"{TRACE_PATH.name}.{i}") for i in range(BACKUP_COUNT, 0, -1)]
+    return [p for p in paths + [TRACE_PATH] if p.exists()]
+
+
+def load():
+    """Return all trace records as a DataFrame (empty if none were written)."""
+    import pandas as pd
+
+    rows = []
+    for path in trace_files():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # partially written line
+    return pd.DataFrame(rows)
+
+
+def summarise(records) -> Dict[str, object]:
+    """Compute latency percentiles, per-session call counts and rates.
+
+    ``latency`` percentiles cover successful API attempts (cache hits
+    excluded); ``calls_per_session`` counts API attempts per patient session
+    (background ``job`` calls excluded);
+    ``similarity_rejection_rate`` is the share of generated candidates
+    rejected as duplicates.
+    """
+    import pandas as pd
+
+    result: Dict[str, object] = {}
+    if records is None or records.empty:
+        return result
+    calls = records[records["event"] == "llm_call"]
+    if not calls.empty:
+        api = calls[~calls["cache_hit"].astype(bool)]
+        ok = api[api["error"].isna()] if "error" in api else api
+        if "cancelled" in ok:  # hedged duplicates cut short
+            ok = ok[ok["cancelled"].isna()]
+        result["calls"] = len(api)
+        result["cache_hits"] = len(calls) - len(api)
+        result["errors"] = int(api["error"].notna().sum()) if "error" in api else 0
+        if not ok.empty:
+            q = ok["latency"].quantile([0.5, 0.95, 0.99])
+            result["latency"] = {"p50": q[0.5], "p95": q[0.95], "p99": q[0.99]}
+            result["latency_by_caller"] = (
+                ok.groupby("caller")["latency"]
+                .quantile([0.5, 0.95, 0.99])
+                .unstack()
+                .rename(columns={0.5: "p50", 0.95: "p95", 0.99: "p99"})
+            )
+        tokens = {}
+        for col in ("prompt_tokens", "completion_tokens"):
+            if col in api:
+                tokens[col] = int(pd.to_numeric(api[col], errors="coerce").sum())
+        result["tokens"] = tokens
+        patients = api[api["job"].isna()] if "job" in api else api
+        if "session" in patients and patients["session"].notna().any():
+            per_session = patients.groupby("session").size()
+            result["calls_per_session"] = {
+                "sessions": len(per_session),
+                "mean": float(per_session.mean()),
+                "p95": float(per_session.quantile(0.95)),
+            }
+    checks = records[records["event"] == "similarity"]
+    if not checks.empty:
+        result["similarity_rejection_rate"] = float(checks["rejected"].astype(bool).mean())
+    return result
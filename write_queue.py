@@ -0,0 +1,359 @@
+"""Write-behind queue that takes persistence off the Streamlit script thread.
+
+``save_user``, ``save_session`` and ``save_report`` return as soon as the
+record is queued.  One daemon writer thread collects records from all
+sessions and writes them with the batch functions of
+:mod:`data_persistence`: a batch is written once it holds ``MAX_BATCH``
+records or its oldest record has waited ``MAX_DELAY`` seconds, with one file
+lock and one write per file (one transaction with SQLite).
+
+``FSYNC`` sets when CSV writes reach the disk: ``batch`` fsyncs every batch,
+``interval`` at most every ``FSYNC_INTERVAL`` seconds and ``off`` leaves it
+to the operating system.  Records still queued when the process exits are
+written by an ``atexit`` handler; only a hard kill loses them.
+
+A failing write is retried with exponential backoff capped at
+``RETRY_MAX_DELAY`` seconds for as long as the process runs; later records
+wait behind it.  Records that still cannot be written at shutdown are
+appended to ``DEAD_LETTER_PATH`` and queued again by the next :func:`start`.
+
+Set ``WRITE_BEHIND=0`` to write synchronously in the calling thread instead.
+"""
+
+from __future__ import annotations
+
+import atexit
+import concurrent.futures
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+import data_persistence
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("WRITE_BEHIND", "1") != "0"
+MAX_BATCH = int(os.getenv("WRITE_BATCH_SIZE", "100"))
+MAX_DELAY = float(os.getenv("WRITE_FLUSH_INTERVAL", "0.1"))
+FSYNC = os.getenv("WRITE_FSYNC", "batch")
+FSYNC_INTERVAL = float(os.getenv("WRITE_FSYNC_INTERVAL", "1.0"))
+RETRIES = 3  # attempts at shutdown before records go to the dead-letter file
+RETRY_MAX_DELAY = float(os.getenv("WRITE_RETRY_MAX_DELAY", "30"))
+SHUTDOWN_TIMEOUT = 10.0
+DEAD_LETTER_PATH = data_persistence.DATA_DIR / "write_queue_dead_letter.jsonl"
+
+# kind -> batch writer; users first so a session never precedes its user
+_WRITERS: Dict[str, Callable[..., None]] = {
+    "user": lambda items, sync: data_persistence.save_users(
+        [(i["user_id"], i["user_name"]) for i in items], sync=sync
+    ),
+    "session": lambda items, sync: data_persistence.save_sessions(items, sync=sync),
+    "report": lambda items, sync: data_persistence.save_reports(items, sync=sync),
+}
+
+
+@dataclass
+class _Write:
+    kind: str
+    payload: dict | None
+    future: concurrent.futures.Future
+    enqueued: float
+
+
+_lock = threading.Lock()
+_queue: "queue.Queue[_Write | None]" = queue.Queue()
+_thread: threading.Thread | None = None
+_stopping = threading.Event()
+_stats_lock = threading.Lock()
+_stats = {
+    "enqueued": 0, "written": 0, "failed": 0, "batches": 0, "fsyncs": 0, "retries": 0,
+    "retrying": 0, "dead_lettered": 0, "replayed": 0,
+}
+_latency: deque = deque(maxlen=1000)  # seconds from enqueue to written
+_batch_sizes: deque = deque(maxlen=1000)
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+
+
+def _dead_letter(group: List[_Write]) -> None:
+    """Append records that could not be written for :func:`_replay`."""
+    try:
+        with data_persistence.file_lock(DEAD_LETTER_PATH):
+            with DEAD_LETTER_PATH.open("a", encoding="utf-8") as f:
+                for w in group:
+                    f.write(json.dumps({"kind": w.kind, "payload": w.payload}, ensure_ascii=False))
+                    f.write("\n")
+    except OSError:
+        logger.exception("could not save %d %s record(s) for replay", len(group), group[0].kind)
+        return
+    _count("dead_lettered", len(group))
+
+
+def _replay() -> None:
+    """Queue the records a previous process left in the dead-letter file."""
+    if not DEAD_LETTER_PATH.exists():
+        return
+    with data_persistence.file_lock(DEAD_LETTER_PATH):
+        try:
+            lines = DEAD_LETTER_PATH.read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            return
+        DEAD_LETTER_PATH.unlink()
+    for line in lines:
+        record = json.loads(line)
+        _count("enqueued")
+        _queue.put(
+            _Write(record["kind"], record["payload"], concurrent.futures.Future(), time.monotonic())
+        )
+    _count("replayed", len(lines))
+    logger.warning("replaying %d record(s) from %s", len(lines), DEAD_LETTER_PATH)
+
+
+def _ensure_started() -> None:
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _stopping.clear()
+            _thread = threading.Thread(target=_run, name="write-behind", daemon=True)
+            _thread.start()
+            _replay()
+
+
+def start() -> None:
+    """Start the writer and replay records left over by an earlier process."""
+    if ENABLED:
+        _ensure_started()
+
+
+def _submit(kind: str, payload: dict) -> concurrent.futures.Future:
+    """Queue one record; the future resolves once it is written."""
+    future: concurrent.futures.Future = concurrent.futures.Future()
+    if not ENABLED:
+        _WRITERS[kind]([payload], sync=True)
+        future.set_result(None)
+        return future
+    _ensure_started()
+    _count("enqueued")
+    _queue.put(_Write(kind, payload, future, time.monotonic()))
+    return future
+
+
+def save_user(user_id: str, user_name: str) -> concurrent.futures.Future:
+    """Queue :func:`data_persistence.save_user`."""
+    return _submit("user", {"user_id": user_id, "user_name": user_name})
+
+
+def save_session(
+    user_id: str,
+    interactions: list[tuple[str, str]],
+    evaluation_summary: str,
+    start_timestamp: str | None = None,
+    axes: list[str] | None = None,
+    scores: dict[str, float] | None = None,
+) -> concurrent.futures.Future:
+    """Queue :func:`data_persistence.save_session`."""
+    return _submit(
+        "session",
+        {
+            "user_id": user_id,
+            "interactions": interactions,
+            "evaluation_summary": evaluation_summary,
+            "start_timestamp": start_timestamp or datetime.now(timezone.utc).isoformat(),
+            "axes": axes,
+            "scores": scores,
+        },
+    )
+
+
+def save_report(
+    user_id: str, start_timestamp: str, report_type: str, content: str
+) -> concurrent.futures.Future:
+    """Queue :func:`data_persistence.save_report`."""
+    return _submit(
+        "report",
+        {
+            "user_id": user_id,
+            "timestamp": start_timestamp,
+            "report_type": report_type,
+            "content": content,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        },
+    )
+
+
+def _write(batch: List[_Write], sync: bool) -> None:
+    """Write ``batch`` grouped by kind, retrying each group until it is
+    written or, once shutting down, saved to the dead-letter file."""
+    for kind, writer in _WRITERS.items():
+        group = [w for w in batch if w.kind == kind]
+        if not group:
+            continue
+        attempt, left = 0, RETRIES  # left: attempts once shutting down
+        while True:
+            try:
+                writer([w.payload for w in group], sync)
+                break
+            except Exception as e:
+                attempt += 1
+                if _stopping.is_set():
+                    left -= 1
+                if left == 0:
+                    logger.exception(
+                        "could not write %d %s record(s) before shutdown", len(group), kind
+                    )
+                    _count("failed", len(group))
+                    _dead_letter(group)
+                    for w in group:
+                        w.future.set_exception(e)
+                    group = []
+                    break
+                delay = min(RETRY_MAX_DELAY, 0.1 * 2 ** min(attempt - 1, 16))
+                logger.warning(
+                    "writing %d %s record(s) failed (attempt %d), retrying in %.1fs: %s",
+                    len(group), kind, attempt, delay, e,
+                )
+                with _stats_lock:
+                    _stats["retries"] += 1
+                    _stats["retrying"] = len(group)
+                if _stopping.is_set():
+                    time.sleep(0.1 * 2 ** (RETRIES - left - 1))
+                else:
+                    _stopping.wait(delay)  # shutdown cuts a long backoff short
+        now = time.monotonic()
+        with _stats_lock:
+            _stats["retrying"] = 0
+            _stats["written"] += len(group)
+            _latency.extend(now - w.enqueued for w in group)
+        for w in group:
+            w.future.set_result(None)
+    _count("batches")
+    with _stats_lock:
+        _batch_sizes.append(len(batch))
+
+
+def _count_fsync() -> None:
+    # SQLite syncs at its own checkpoints; only CSV writes are fsynced here.
+    if data_persistence.BACKEND != "sqlite":
+        _count("fsyncs")
+
+
+def _sync() -> None:
+    try:
+        data_persistence.sync_files()
+    except OSError:
+        logger.exception("fsync of the data files failed")
+        return
+    _count_fsync()
+
+
+def _run() -> None:
+    last_sync = time.monotonic()
+    dirty = False  # written without fsync under the interval policy
+    while True:
+        timeout = max(0.0, last_sync + FSYNC_INTERVAL - time.monotonic()) if dirty else None
+        try:
+            item = _queue.get(timeout=timeout)
+        except queue.Empty:
+            _sync()
+            last_sync, dirty = time.monotonic(), False
+            continue
+        batch: List[_Write] = []
+        markers: List[_Write] = []
+        stop = item is None
+        if item is not None:
+            (markers if item.kind == "flush" else batch).append(item)
+        deadline = time.monotonic() + MAX_DELAY
+        while batch and not stop and not markers and len(batch) < MAX_BATCH:
+            try:
+                item = _queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                stop = True
+            else:
+                (markers if item.kind == "flush" else batch).append(item)
+        if batch:
+            sync = FSYNC == "batch" or (
+                FSYNC == "interval" and time.monotonic() - last_sync >= FSYNC_INTERVAL
+            )
+            _write(batch, sync)
+            if sync:
+                _count_fsync()
+                last_sync, dirty = time.monotonic(), False
+            else:
+                dirty = FSYNC == "interval"
+        if dirty and (markers or stop):
+            _sync()
+            last_sync, dirty = time.monotonic(), False
+        for marker in markers:
+            marker.future.set_result(None)
+        if stop:
+            return
+
+
+def flush(timeout: float | None = None) -> None:
+    """Block until every record queued so far is written."""
+    with _lock:
+        running = _thread is not None and _thread.is_alive()
+    if not running:
+        return
+    marker = _Write("flush", None, concurrent.futures.Future(), time.monotonic())
+    _queue.put(marker)
+    marker.future.result(timeout)
+
+
+def shutdown(timeout: float = SHUTDOWN_TIMEOUT) -> int:
+    """Write what is queued, stop the writer and return the records left over."""
+    global _thread
+    with _lock:
+        thread, _thread = _thread, None
+    if thread is None or not thread.is_alive():
+        return 0
+    _stopping.set()
+    _queue.put(None)
+    thread.join(timeout)
+    left = _queue.qsize()
+    if thread.is_alive() or left:
+        logger.error("write-behind queue shut down with %d record(s) unwritten", left)
+    return left
+
+
+atexit.register(shutdown)
+
+
+def stats() -> Dict[str, object]:
+    """Counters, queue depth and enqueue-to-written latency of this process.
+
+    ``pending`` counts records waiting to be written, including those held
+    back by a failing write (``retrying``); ``dead_letter`` counts records
+    saved for replay by the next process.
+    """
+    try:
+        with DEAD_LETTER_PATH.open(encoding="utf-8") as f:
+            dead_letter = sum(1 for _ in f)
+    except FileNotFoundError:
+        dead_letter = 0
+    with _stats_lock:
+        result: Dict[str, object] = dict(
+            _stats, pending=_queue.qsize() + _stats["retrying"], dead_letter=dead_letter
+        )
+        latencies = sorted(_latency)
+        sizes = list(_batch_sizes)
+    if latencies:
+        pick = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+        result["latency"] = {
+            "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": latencies[-1]
+        }
+    if sizes:
+        result["batch_size_mean"] = sum(sizes) / len(sizes)
+    return result